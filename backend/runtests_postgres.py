@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# Runs the test suite against a throwaway PostgreSQL server:
+#
+#     pip install -r requirements-dev.txt
+#     python runtests_postgres.py [--pool] [--replica] [test labels]
+#
+# manage.py test runs on SQLite and skips the PostgreSQL only tests, like
+# the COPY upserts in scrapers/bulk.py, so run this too before merging.
+#
+# The server is started from the PostgreSQL binaries bundled with pgserver,
+# in a temporary directory that is deleted once the tests finish. --pool
+# runs the tests with the psycopg connection pool enabled (DB_POOL), and
+# --replica with a replica alias that is a test mirror of the primary, so
+# the replica routing tests run too.
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def main():
+    try:
+        import pgserver
+    except ImportError:
+        sys.exit("pgserver is needed to start a throwaway PostgreSQL server: pip install -r requirements-dev.txt")
+
+    args = sys.argv[1:]
+    env = dict(os.environ)
+    if "--pool" in args:
+        args.remove("--pool")
+        env["DB_POOL"] = "true"
+    replica = "--replica" in args
+    if replica:
+        args.remove("--replica")
+
+    with tempfile.TemporaryDirectory(prefix="vlr-pg-") as pgdata:
+        server = pgserver.get_server(pgdata, cleanup_mode="stop")
+        try:
+            env["DATABASE_URL"] = f"postgres://postgres@/postgres?host={pgdata}"
+            if replica:
+                env["REPLICA_DATABASE_URL"] = env["DATABASE_URL"]
+            result = subprocess.run(
+                [sys.executable, "manage.py", "test", "--noinput", *(args or ["vlr_data"])],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env=env,
+            )
+        finally:
+            server.cleanup()
+    sys.exit(result.returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# Vectorized analytics over the Parquet datasets written by export.ParquetExporter.
+# Everything here works on pyarrow Tables (and NumPy arrays of their columns)
+# loaded from the export directory, never on the database, so heavy analysis
+# does not slow down the API.
+from typing import List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+
+def load(path: str, dataset: str = "player_stats", columns: Optional[List[str]] = None, filter=None) -> pa.Table:
+    """Loads an exported dataset, reading only the columns and partitions needed
+
+    Args:
+        path (str): directory the datasets were exported to
+        dataset (str, optional): "matches", "maps" or "player_stats". Defaults to "player_stats".
+        columns (List[str], optional): columns to read. Defaults to every column.
+        filter (pyarrow.compute.Expression, optional): rows to keep, e.g. pc.field("month") >= "2024-01". Defaults to None.
+
+    Returns:
+        pa.Table: the rows
+    """
+    return ds.dataset(f"{path}/{dataset}", format="parquet", partitioning="hive").to_table(
+        columns=columns, filter=filter
+    )
+
+
+def _sort(table: pa.Table, keys: List[str], descending: bool = False) -> pa.Table:
+    order = "descending" if descending else "ascending"
+    return table.take(pc.sort_indices(table, sort_keys=[(key, order) for key in keys]))
+
+
+def leaderboard(stats: pa.Table, by: str = "average_acs", min_maps: int = 20, top: int = 20) -> pa.Table:
+    """Ranks players by a career stat over the maps in the stats
+
+    Args:
+        stats (pa.Table): player_stats rows, e.g. from load()
+        by (str, optional): column to rank by: "average_acs", "kd", "kills_per_map", "kills", "maps_played". Defaults to "average_acs".
+        min_maps (int, optional): min maps played to be ranked. Defaults to 20.
+        top (int, optional): number of players returned. Defaults to 20.
+
+    Returns:
+        pa.Table: one row per player with player_id, player, maps_played, kills, deaths, assists, kd, average_acs and kills_per_map, best first
+    """
+    totals = stats.group_by("player_id").aggregate(
+        [
+            ("player", "last"),
+            ("game_id", "count"),
+            ("kills", "sum"),
+            ("deaths", "sum"),
+            ("assists", "sum"),
+            ("acs", "sum"),
+        ]
+    )
+    maps = totals.column("game_id_count").to_numpy()
+    kills = totals.column("kills_sum").to_numpy()
+    deaths = totals.column("deaths_sum").to_numpy()
+    acs = totals.column("acs_sum").to_numpy()
+
+    board = pa.table(
+        {
+            "player_id": totals.column("player_id"),
+            "player": totals.column("player_last"),
+            "maps_played": maps,
+            "kills": kills,
+            "deaths": deaths,
+            "assists": totals.column("assists_sum"),
+            "kd": kills / np.maximum(deaths, 1),
+            "average_acs": acs / maps,
+            "kills_per_map": kills / maps,
+        }
+    )
+    board = board.filter(pc.greater_equal(board.column("maps_played"), min_maps))
+    return _sort(board, [by], descending=True).slice(0, top)
+
+
+def agent_distribution(stats: pa.Table, percentiles=(0.1, 0.25, 0.5, 0.75, 0.9)) -> pa.Table:
+    """Summarizes how often each agent is picked and how its players perform
+
+    Args:
+        stats (pa.Table): player_stats rows, e.g. from load()
+        percentiles (Sequence[float], optional): percentiles of ACS to compute. Defaults to (0.1, 0.25, 0.5, 0.75, 0.9).
+
+    Returns:
+        pa.Table: one row per agent with picks, pick_rate (share of all picks), mean_acs, mean_kd and an acs_p<N> column per percentile, most picked first
+    """
+    # np.add.reduceat cannot reduce over no slices
+    if len(stats) == 0:
+        columns = {"agent": pa.array([], pa.string()), "picks": pa.array([], pa.int64())}
+        for name in ["pick_rate", "mean_acs", "mean_kd"] + [f"acs_p{round(q * 100)}" for q in percentiles]:
+            columns[name] = pa.array([], pa.float64())
+        return pa.table(columns)
+
+    agents = stats.column("agent").to_numpy(zero_copy_only=False)
+    acs = stats.column("acs").to_numpy()
+    kd = stats.column("kills").to_numpy() / np.maximum(stats.column("deaths").to_numpy(), 1)
+
+    # Sort once by agent so each agent's rows are one contiguous slice
+    order = np.argsort(agents, kind="stable")
+    names, starts, picks = np.unique(agents[order], return_index=True, return_counts=True)
+    acs_sorted = acs[order]
+    columns = {
+        "agent": names,
+        "picks": picks,
+        "pick_rate": picks / len(agents),
+        "mean_acs": np.add.reduceat(acs_sorted, starts) / picks,
+        "mean_kd": np.add.reduceat(kd[order], starts) / picks,
+    }
+    slices = np.split(acs_sorted, starts[1:])
+    for q in percentiles:
+        columns[f"acs_p{round(q * 100)}"] = [np.quantile(values, q) for values in slices]
+    return _sort(pa.table(columns), ["picks"], descending=True)
+
+
+def rolling_average(stats: pa.Table, column: str = "acs", window: int = 10) -> pa.Table:
+    """Adds each player's rolling average of a stat over their last maps
+
+    Computed for every row at once from one cumulative sum over the rows
+    sorted by player and date, rather than a loop per player.
+
+    Args:
+        stats (pa.Table): player_stats rows, e.g. from load()
+        column (str, optional): stat to average. Defaults to "acs".
+        window (int, optional): number of maps averaged, fewer for a player's first maps. Defaults to 10.
+
+    Returns:
+        pa.Table: the rows sorted by player and date, with a rolling_<column> column
+    """
+    stats = _sort(stats, ["player_id", "date_played", "game_id"])
+    values = stats.column(column).to_numpy().astype(np.float64)
+    players = stats.column("player_id").to_numpy(zero_copy_only=False)
+
+    n = len(values)
+    index = np.arange(n)
+    # Index of each row's player's first row
+    new_player = np.ones(n, dtype=bool)
+    new_player[1:] = players[1:] != players[:-1]
+    first = np.maximum.accumulate(np.where(new_player, index, 0))
+
+    start = np.maximum(index - window + 1, first)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    rolling = (cumulative[index + 1] - cumulative[start]) / (index + 1 - start)
+    return stats.append_column(f"rolling_{column}", pa.array(rolling))
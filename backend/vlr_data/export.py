@@ -0,0 +1,307 @@
+import datetime
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from django.db.models import Max, Q
+
+from .models import ChangeLog, Map, Match, PlayerStats
+
+
+logger = logging.getLogger(__name__)
+
+MONTH = "month"
+EVENT = "event"
+PARTITIONINGS = (MONTH, EVENT)
+
+# Key of the Hive-style partition directories for each partitioning. Events
+# are keyed by the event_id column, so they must not clash with any other
+PARTITION_KEYS = {MONTH: "month", EVENT: "event_id"}
+
+# Columns of each exported dataset, and the values_list paths they are read from
+DATASETS = {
+    "matches": {
+        "match_id": "vlr_id",
+        "event_id": "event_id",
+        "event_url": "event__vlr_url",
+        "event": "event__name",
+        "series": "event__series",
+        "date_played": "date_played",
+        "team1_id": "team1__vlr_id",
+        "team2_id": "team2__vlr_id",
+        "team1": "team1__name",
+        "team2": "team2__name",
+        "is_finished": "is_finished",
+        "team1_score": "team1_score",
+        "team2_score": "team2_score",
+    },
+    "maps": {
+        "game_id": "game_id",
+        "match_id": "match__vlr_id",
+        "event_id": "match__event_id",
+        "date_played": "match__date_played",
+        "map_number": "map_number",
+        "map_name": "name__name",
+        "team1_id": "match__team1__vlr_id",
+        "team2_id": "match__team2__vlr_id",
+        "team1_score": "team1_score",
+        "team2_score": "team2_score",
+    },
+    "player_stats": {
+        "game_id": "map__game_id",
+        "match_id": "map__match__vlr_id",
+        "event_id": "map__match__event_id",
+        "date_played": "map__match__date_played",
+        "map_name": "map__name__name",
+        "player_id": "player__vlr_id",
+        "player": "player__ign",
+        "agent": "agent__name",
+        "kills": "kills",
+        "deaths": "deaths",
+        "assists": "assists",
+        "acs": "acs",
+    },
+}
+
+# Path from each dataset's model to the Match it belongs to
+_MATCH_PATHS = {"matches": "", "maps": "match__", "player_stats": "map__match__"}
+_MODELS = {"matches": Match, "maps": Map, "player_stats": PlayerStats}
+
+STATE_FILE = "_export_state.json"
+
+
+def _schema():
+    import pyarrow as pa
+
+    timestamp = pa.timestamp("us", tz="UTC")
+    types = {
+        # Same type as pyarrow infers for event_id=<id> partition directories,
+        # so the column and the partition key merge when the dataset is read
+        "event_id": pa.int32(),
+        "date_played": timestamp,
+        "is_finished": pa.bool_(),
+        "map_number": pa.int16(),
+        "team1_score": pa.int16(),
+        "team2_score": pa.int16(),
+        "kills": pa.int16(),
+        "deaths": pa.int16(),
+        "assists": pa.int16(),
+        "acs": pa.int16(),
+    }
+    return {
+        name: pa.schema([(column, types.get(column, pa.string())) for column in columns])
+        for name, columns in DATASETS.items()
+    }
+
+
+def _month_range(month: str) -> Tuple[datetime.datetime, datetime.datetime]:
+    start = datetime.datetime.strptime(month, "%Y-%m").replace(tzinfo=datetime.timezone.utc)
+    end = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, end
+
+
+class ParquetExporter:
+    """Exports matches, maps and player stats to Parquet datasets partitioned by month or event
+
+    Each dataset is a directory of Hive-style partitions (e.g.
+    player_stats/month=2024-08/part-0.parquet or
+    player_stats/event_id=2097/part-0.parquet), so analysts can load it with
+    pyarrow.dataset, pandas or DuckDB without touching the database. Rows
+    are streamed out of the database in chunks and written a batch at a
+    time, so memory does not grow with the size of a partition.
+
+    After the first export, only the partitions holding rows changed since
+    the last export (according to the ChangeLog) are rewritten. Each
+    partition is written to a temporary file and moved into place, so
+    readers never see a half-written one.
+    """
+
+    def __init__(self, path: str, partition: str = MONTH, chunk_size: int = 50_000):
+        """Initializes a new ParquetExporter Object
+
+        Args:
+            path (str): directory to write the datasets in, created if missing
+            partition (str, optional): what to partition the datasets by, one of PARTITIONINGS. Defaults to MONTH.
+            chunk_size (int, optional): rows read from the database and written per batch. Defaults to 50_000.
+
+        Raises:
+            ValueError: if the partitioning is unknown
+        """
+        if partition not in PARTITIONINGS:
+            raise ValueError(f"Unknown partitioning: {partition}")
+        self.path = path
+        self.partition = partition
+        self.key = PARTITION_KEYS[partition]
+        self.chunk_size = chunk_size
+
+    def _state_path(self) -> str:
+        return os.path.join(self.path, STATE_FILE)
+
+    def _load_state(self) -> Optional[dict]:
+        try:
+            with open(self._state_path()) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        # A different partitioning (or an older layout of it) means every file has to be rewritten
+        if state.get("partition") != self.partition or state.get("key") != self.key:
+            return None
+        return state
+
+    def _save_state(self, last_change: int):
+        tmp = self._state_path() + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"partition": self.partition, "key": self.key, "last_change": last_change}, f)
+        os.replace(tmp, self._state_path())
+
+    def _partition_of(self, date_played: datetime.datetime, event_id: int) -> str:
+        if self.partition == MONTH:
+            return date_played.strftime("%Y-%m")
+        return str(event_id)
+
+    def _partition_filter(self, dataset: str, value: str) -> Q:
+        prefix = _MATCH_PATHS[dataset]
+        if self.partition == MONTH:
+            start, end = _month_range(value)
+            return Q(**{f"{prefix}date_played__gte": start, f"{prefix}date_played__lt": end})
+        return Q(**{f"{prefix}event_id": int(value)})
+
+    def _all_partitions(self) -> Set[str]:
+        return {
+            self._partition_of(date_played, event_id)
+            for date_played, event_id in Match.objects.values_list("date_played", "event_id").iterator()
+        }
+
+    def _changed_partitions(self, last_change: int, upto: int) -> Set[str]:
+        """Gets the partitions holding matches that changed between two ChangeLog entries"""
+        ids: Dict[str, Set[str]] = {}
+        changes = ChangeLog.objects.filter(pk__gt=last_change, pk__lte=upto)
+        for entity, entity_id in changes.values_list("entity", "entity_id").iterator():
+            if entity == "playerstats":
+                entity, entity_id = "map", entity_id.split("/")[0]
+            ids.setdefault(entity, set()).add(entity_id)
+        if not ids:
+            return set()
+
+        changed = Q(vlr_id__in=ids.get("match", ()))
+        changed |= Q(map__game_id__in=ids.get("map", ()))
+        changed |= Q(team1__vlr_id__in=ids.get("team", ())) | Q(team2__vlr_id__in=ids.get("team", ()))
+        changed |= Q(event__vlr_url__in=ids.get("event", ()))
+        changed |= Q(map__playerstats__player__vlr_id__in=ids.get("player", ()))
+        matches = Match.objects.filter(changed).values_list("vlr_id", "date_played", "event_id").distinct()
+
+        partitions = set()
+        match_ids = set()
+        for vlr_id, date_played, event_id in matches.iterator():
+            partitions.add(self._partition_of(date_played, event_id))
+            match_ids.add(vlr_id)
+        # A match that moved (e.g. its date was corrected) must also leave its old partition
+        return partitions | self._partitions_holding(match_ids)
+
+    def _partitions_holding(self, match_ids: Set[str]) -> Set[str]:
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+
+        directory = os.path.join(self.path, "matches")
+        if not match_ids or not os.path.isdir(directory):
+            return set()
+        dataset = ds.dataset(directory, format="parquet", partitioning="hive")
+        table = dataset.to_table(
+            columns=[self.key], filter=pc.field("match_id").isin(list(match_ids))
+        )
+        return {str(value) for value in table.column(self.key).to_pylist()}
+
+    def _rows(self, dataset: str, value: str) -> Iterator[tuple]:
+        model = _MODELS[dataset]
+        order = f"{_MATCH_PATHS[dataset]}date_played"
+        rows = (
+            model.objects.filter(self._partition_filter(dataset, value))
+            .order_by(order, "pk")
+            .values_list(*DATASETS[dataset].values())
+        )
+        return rows.iterator(chunk_size=self.chunk_size)
+
+    def _write_partition(self, dataset: str, schema, value: str) -> int:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        directory = os.path.join(self.path, dataset, f"{self.key}={value}")
+        target = os.path.join(directory, "part-0.parquet")
+        tmp = target + ".tmp"
+        os.makedirs(directory, exist_ok=True)
+
+        written = 0
+        writer = None
+        try:
+            rows = self._rows(dataset, value)
+            while True:
+                chunk = [row for _, row in zip(range(self.chunk_size), rows)]
+                if not chunk:
+                    break
+                columns = list(zip(*chunk))
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                    schema=schema,
+                )
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp, schema, compression="zstd")
+                writer.write_batch(batch)
+                written += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if written:
+            os.replace(tmp, target)
+        else:
+            # Every row of the partition is gone
+            shutil.rmtree(directory, ignore_errors=True)
+        return written
+
+    def export(self, full: bool = False) -> Dict[str, int]:
+        """Writes every partition changed since the last export, or all of them the first time
+
+        Args:
+            full (bool, optional): Rewrite every partition from scratch. Defaults to False.
+
+        Returns:
+            Dict[str, int]: number of rows written to each dataset, keyed by dataset name, plus the number of partitions rewritten
+        """
+        os.makedirs(self.path, exist_ok=True)
+        state = None if full else self._load_state()
+        # Read before exporting, so changes made while exporting are picked up next time
+        upto = ChangeLog.objects.aggregate(last=Max("pk"))["last"] or 0
+
+        if state is None:
+            for dataset in DATASETS:
+                shutil.rmtree(os.path.join(self.path, dataset), ignore_errors=True)
+            partitions = self._all_partitions()
+        else:
+            partitions = self._changed_partitions(state["last_change"], upto)
+
+        counts = {dataset: 0 for dataset in DATASETS}
+        schemas = _schema()
+        for value in sorted(partitions):
+            for dataset in DATASETS:
+                counts[dataset] += self._write_partition(dataset, schemas[dataset], value)
+            logger.info("Exported %s=%s", self.key, value)
+
+        self._save_state(upto)
+        counts["partitions"] = len(partitions)
+        return counts
+
+
+def export_parquet(path: str, partition: str = MONTH, full: bool = False) -> Dict[str, int]:
+    """Exports matches, maps and player stats to Parquet, see ParquetExporter
+
+    Args:
+        path (str): directory to write the datasets in
+        partition (str, optional): what to partition the datasets by, one of PARTITIONINGS. Defaults to MONTH.
+        full (bool, optional): Rewrite every partition from scratch. Defaults to False.
+
+    Returns:
+        Dict[str, int]: number of rows written to each dataset, plus the number of partitions rewritten
+    """
+    return ParquetExporter(path, partition).export(full)
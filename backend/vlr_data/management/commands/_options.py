@@ -0,0 +1,49 @@
+from vlr_data.scrapers.archive import ArchiveReader, ArchiveWriter
+from vlr_data.scrapers.async_client import AsyncVLRClient
+from vlr_data.scrapers.backends import BACKENDS, HTML_PARSER
+from vlr_data.scrapers.cache import ResponseCache
+
+
+def add_client_arguments(parser):
+    """Adds the arguments shared by every command that fetches from VLR"""
+    parser.add_argument(
+        "--sleep",
+        type=float,
+        default=1.0,
+        help="Average time (in seconds) between requests to VLR",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Max number of requests in flight at once",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=BACKENDS,
+        default=HTML_PARSER,
+        help="Parser backend to parse the pages with",
+    )
+    parser.add_argument("--cache", help="Directory of the on-disk response cache")
+    parser.add_argument("--record", help="Archive file to record every fetched page into")
+    parser.add_argument("--replay", help="Archive file to serve every page from instead of VLR")
+
+
+def client_from_options(options) -> AsyncVLRClient:
+    """Builds the client described by the arguments from add_client_arguments"""
+    return AsyncVLRClient(
+        sleep=options["sleep"],
+        concurrency=options["concurrency"],
+        parser=options["parser"],
+        cache=ResponseCache(options["cache"]) if options["cache"] else None,
+        recorder=ArchiveWriter(options["record"]) if options["record"] else None,
+        replay=ArchiveReader(options["replay"]) if options["replay"] else None,
+    )
+
+
+def close_client(client: AsyncVLRClient):
+    """Closes a client from client_from_options along with its cache and archives"""
+    client.close()
+    for resource in (client.cache, client.recorder, client.replay):
+        if resource is not None:
+            resource.close()
@@ -0,0 +1,66 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from vlr_data.scrapers.backfill import TeamBackfill
+from vlr_data.scrapers.fingerprint import FingerprintStore
+
+from ._options import add_client_arguments, client_from_options, close_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Walks every page of teams' VLR match histories and ingests the matches "
+        "on them. Resumes from the last checkpoint of each team."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "teams",
+            nargs="*",
+            help="VLR IDs of the teams to backfill, defaults to every team in the database",
+        )
+        parser.add_argument(
+            "--state",
+            default="crawl_state.sqlite3",
+            help="SQLite file the checkpoints and page fingerprints are kept in",
+        )
+        parser.add_argument(
+            "--teams-at-once",
+            type=int,
+            default=8,
+            help="Number of teams walked concurrently",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of parser processes, defaults to the number of CPUs",
+        )
+        add_client_arguments(parser)
+
+    def handle(self, *args, **options):
+        client = client_from_options(options)
+        fingerprints = FingerprintStore(options["state"])
+        backfill = TeamBackfill(
+            client,
+            options["state"],
+            teams_at_once=options["teams_at_once"],
+            workers=options["workers"],
+            parser=options["parser"],
+            fingerprints=fingerprints,
+        )
+        try:
+            stats = asyncio.run(backfill.run(options["teams"] or None))
+        finally:
+            backfill.close()
+            fingerprints.close()
+            close_client(client)
+
+        pipeline = backfill.pipeline.stats
+        self.stdout.write(
+            f"Backfilled {stats.teams} teams ({stats.failed_teams} failed) over "
+            f"{stats.pages} pages, {stats.matches} new matches ({stats.failed_matches} "
+            f"failed, retried next run): ingested "
+            f"{pipeline.ingested}, skipped {pipeline.skipped} unchanged, "
+            f"failed {pipeline.failed}"
+        )
@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vlr_data.scrapers import url_types
+from vlr_data.scrapers.archive import ArchiveReader
+from vlr_data.scrapers.backends import BACKENDS, HTML_PARSER, parse_html
+from vlr_data.scrapers.stats_table import (
+    MATCH_PAGE_STRAINER,
+    extract_maps,
+    extract_maps_by_selectors,
+)
+from vlr_data.scrapers.vlr_scraper import parse_match_page
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks parse_match_page's single-pass stats extraction against "
+        "the per-stat selectors it replaced, over the match pages in an archive"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help="Archive file recorded by ArchiveWriter")
+        parser.add_argument(
+            "--parser",
+            choices=BACKENDS,
+            default=HTML_PARSER,
+            help="Parser backend to parse the pages with",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Parse every page this many times",
+        )
+
+    def _time(self, func, pages, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for content in pages:
+                func(content)
+        return 1000 * (time.perf_counter() - start) / (repeat * len(pages))
+
+    def handle(self, *args, **options):
+        backend = options["parser"]
+        with ArchiveReader(options["archive"]) as archive:
+            pages = [
+                content
+                for url, content in archive
+                if url_types.classify_url(url) == url_types.MATCH
+            ]
+        if not pages:
+            raise CommandError("The archive has no match pages")
+
+        def before(content):
+            return parse_match_page(
+                parse_html(content, backend), extract_maps=extract_maps_by_selectors
+            )
+
+        def after(content):
+            return parse_match_page(
+                parse_html(content, backend, MATCH_PAGE_STRAINER),
+                extract_maps=extract_maps,
+            )
+
+        mismatches = sum(before(content) != after(content) for content in pages)
+        if mismatches:
+            raise CommandError(f"{mismatches} pages parsed differently")
+
+        before_ms = self._time(before, pages, options["repeat"])
+        after_ms = self._time(after, pages, options["repeat"])
+        self.stdout.write(
+            f"{len(pages)} match pages with {backend}: "
+            f"{before_ms:.1f}ms/page before, {after_ms:.1f}ms/page after "
+            f"({before_ms / after_ms:.1f}x faster)"
+        )
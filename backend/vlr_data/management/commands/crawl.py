@@ -0,0 +1,88 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from vlr_data.scrapers.crawler import Crawler
+from vlr_data.scrapers.fingerprint import FingerprintStore
+from vlr_data.scrapers.frontier import CrawlPolicy, Frontier
+from vlr_data.scrapers.url_types import BASE_URL
+
+from ._options import add_client_arguments, client_from_options, close_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Crawls VLR outwards from the seed pages, ingesting every page found. "
+        "Resumes the last crawl if it was interrupted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "seeds",
+            nargs="*",
+            default=[BASE_URL],
+            help="VLR URLs to start crawling from, defaults to the homepage",
+        )
+        parser.add_argument(
+            "--state",
+            default="crawl_state.sqlite3",
+            help="SQLite file the crawl frontier and page fingerprints are kept in",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Parse and ingest every page, even those unchanged since they were last ingested",
+        )
+        parser.add_argument(
+            "--max-depth",
+            type=int,
+            default=CrawlPolicy.max_depth,
+            help="Max number of links between a seed and a crawled page",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of parser processes, defaults to the number of CPUs",
+        )
+        parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=64,
+            help="Max pages waiting between two pipeline stages",
+        )
+        add_client_arguments(parser)
+
+    def handle(self, *args, **options):
+        client = client_from_options(options)
+        frontier = Frontier(
+            options["state"], CrawlPolicy(max_depth=options["max_depth"])
+        )
+        fingerprints = None if options["force"] else FingerprintStore(options["state"])
+        crawler = Crawler(
+            client,
+            frontier,
+            workers=options["workers"],
+            queue_size=options["queue_size"],
+            parser=options["parser"],
+            fingerprints=fingerprints,
+        )
+        try:
+            stats = asyncio.run(crawler.run(options["seeds"]))
+        finally:
+            frontier.close()
+            if fingerprints is not None:
+                fingerprints.close()
+            close_client(client)
+
+        if stats.resumed:
+            self.stdout.write("Resumed the last crawl")
+        self.stdout.write(
+            f"Fetched {stats.pipeline.fetched}, parsed {stats.pipeline.parsed}, "
+            f"ingested {stats.pipeline.ingested}, skipped {stats.pipeline.skipped} "
+            f"unchanged, failed {stats.pipeline.failed}"
+        )
+        self.stdout.write(
+            ", ".join(f"{status}: {count}" for status, count in sorted(stats.statuses.items()))
+        )
+        if not stats.finished:
+            self.stdout.write("The crawl did not finish, run again to resume it")
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from vlr_data.export import MONTH, PARTITIONINGS, ParquetExporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports matches, maps and player stats to partitioned Parquet files for "
+        "analysis outside the database. Only rewrites the partitions changed "
+        "since the last export."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--out",
+            default="exports",
+            help="Directory to write the datasets in",
+        )
+        parser.add_argument(
+            "--partition",
+            choices=PARTITIONINGS,
+            default=MONTH,
+            help="What to partition the datasets by",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rewrite every partition instead of only the changed ones",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=50_000,
+            help="Rows read from the database and written per batch",
+        )
+
+    def handle(self, *args, **options):
+        exporter = ParquetExporter(options["out"], options["partition"], options["chunk_size"])
+        counts = exporter.export(options["full"])
+        partitions = counts.pop("partitions")
+        self.stdout.write(
+            f"Rewrote {partitions} partitions: "
+            + ", ".join(f"{count} {dataset} rows" for dataset, count in counts.items())
+        )
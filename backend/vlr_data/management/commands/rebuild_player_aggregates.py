@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from vlr_data.scrapers.aggregates import rebuild_player_aggregates
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the player career, per-agent and per-map aggregate tables "
+        "from every PlayerStats row. Ingest keeps them up to date, so this is "
+        "only needed after they are first created or if they drift."
+    )
+
+    def handle(self, *args, **options):
+        counts = rebuild_player_aggregates()
+        self.stdout.write(
+            ", ".join(f"{count} {model} rows" for model, count in counts.items())
+        )
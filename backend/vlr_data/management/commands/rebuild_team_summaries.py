@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from vlr_data.scrapers.aggregates import rebuild_team_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes every team summary, per-map record and head to head from "
+        "the Match and Map tables. Ingest keeps them up to date, so this is "
+        "only needed after they are first created or if they drift."
+    )
+
+    def handle(self, *args, **options):
+        counts = rebuild_team_summaries()
+        self.stdout.write(
+            ", ".join(f"{count} {model} rows" for model, count in counts.items())
+        )
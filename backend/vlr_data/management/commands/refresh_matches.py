@@ -0,0 +1,60 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from vlr_data.scrapers.fingerprint import FingerprintStore
+from vlr_data.scrapers.scheduler import RefreshScheduler
+
+from ._options import add_client_arguments, client_from_options, close_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Polls unfinished matches more often as they approach and while they "
+        "are live, until VLR reports them final"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--state",
+            default="crawl_state.sqlite3",
+            help="SQLite file the poll times and page fingerprints are kept in",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Poll the matches that are due once and exit",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of parser processes",
+        )
+        add_client_arguments(parser)
+
+    def handle(self, *args, **options):
+        client = client_from_options(options)
+        fingerprints = FingerprintStore(options["state"])
+        scheduler = RefreshScheduler(
+            client,
+            options["state"],
+            workers=options["workers"],
+            parser=options["parser"],
+            fingerprints=fingerprints,
+        )
+        try:
+            if options["once"]:
+                stats, next_poll = asyncio.run(scheduler.poll())
+                self.stdout.write(
+                    f"Polled {stats.polled} of {stats.unfinished} unfinished matches, "
+                    f"{stats.finished} now finished. Next poll due at {next_poll:%Y-%m-%d %H:%M:%S %Z}"
+                )
+            else:
+                asyncio.run(scheduler.run())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            scheduler.close()
+            fingerprints.close()
+            close_client(client)
@@ -0,0 +1,120 @@
+from collections import Counter, defaultdict
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from vlr_data.scrapers import url_types
+from vlr_data.scrapers.archive import ArchiveReader
+from vlr_data.scrapers.backends import (
+    BACKENDS,
+    HTML_PARSER,
+    parse_html,
+    verify_backends,
+)
+from vlr_data.scrapers.ingest import INGEST_ORDER, ingest_page
+from vlr_data.scrapers.stats_table import PAGE_STRAINERS
+from vlr_data.scrapers.vlr_scraper import PAGE_PARSERS
+
+
+class Command(BaseCommand):
+    help = "Re-runs the parsers (and optionally ingest) over every page in an HTML archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help="Archive file recorded by ArchiveWriter")
+        parser.add_argument(
+            "--ingest",
+            action="store_true",
+            help="Ingest the parsed pages into the database",
+        )
+        parser.add_argument(
+            "--kind",
+            action="append",
+            choices=sorted(PAGE_PARSERS),
+            help="Only replay pages of this kind (can be repeated)",
+        )
+        parser.add_argument(
+            "--parser",
+            choices=BACKENDS,
+            default=HTML_PARSER,
+            help="Parser backend to parse the pages with",
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Check every other parser backend gives the same output as html.parser",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="Parse the corpus this many times, for benchmarking",
+        )
+
+    def handle(self, *args, **options):
+        kinds = set(options["kind"] or PAGE_PARSERS)
+        parse_time = Counter()
+        parse_count = Counter()
+        failures = Counter()
+        parsed = defaultdict(list)
+
+        with ArchiveReader(options["archive"]) as archive:
+            pages = [
+                (url, url_types.classify_url(url), content)
+                for url, content in archive
+            ]
+
+        for i in range(options["repeat"]):
+            for url, kind, content in pages:
+                if kind not in kinds:
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    soup = parse_html(content, options["parser"], PAGE_STRAINERS.get(kind))
+                    data = PAGE_PARSERS[kind](soup)
+                except Exception as e:
+                    failures[kind] += 1
+                    self.stderr.write(f"Error parsing {url}: {e}")
+                    continue
+                parse_time[kind] += time.perf_counter() - start
+                parse_count[kind] += 1
+
+                if i == 0:
+                    parsed[kind].append((url, data))
+
+        for kind in sorted(parse_count):
+            self.stdout.write(
+                f"{kind}: {parse_count[kind]} pages parsed in {parse_time[kind]:.2f}s "
+                f"({1000 * parse_time[kind] / parse_count[kind]:.1f}ms/page), "
+                f"{failures[kind]} failed"
+            )
+
+        if options["verify"]:
+            others = [b for b in BACKENDS if b != HTML_PARSER]
+            mismatches = Counter()
+            for url, kind, content in pages:
+                if kind not in kinds:
+                    continue
+                for backend in verify_backends(content, PAGE_PARSERS[kind], others):
+                    mismatches[backend] += 1
+                    self.stderr.write(f"{backend} output differs from html.parser on {url}")
+            for backend in others:
+                self.stdout.write(f"{backend}: {mismatches[backend]} pages differ")
+
+        if not options["ingest"]:
+            return
+
+        start = time.perf_counter()
+        ingested = 0
+        for kind in INGEST_ORDER:
+            for url, data in parsed[kind]:
+                try:
+                    with transaction.atomic():
+                        ingest_page(kind, data, url)
+                    ingested += 1
+                except Exception as e:
+                    self.stderr.write(f"Error ingesting {url}: {e}")
+        self.stdout.write(
+            f"Ingested {ingested} pages in {time.perf_counter() - start:.2f}s"
+        )
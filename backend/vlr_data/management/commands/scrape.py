@@ -0,0 +1,56 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from vlr_data.scrapers.fingerprint import FingerprintStore
+from vlr_data.scrapers.pipeline import Pipeline
+
+from ._options import add_client_arguments, client_from_options, close_client
+
+
+class Command(BaseCommand):
+    help = "Fetches, parses and ingests VLR pages through the multi-process pipeline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="VLR URLs to scrape")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of parser processes, defaults to the number of CPUs",
+        )
+        parser.add_argument(
+            "--queue-size",
+            type=int,
+            default=64,
+            help="Max pages waiting between two pipeline stages",
+        )
+        parser.add_argument(
+            "--fingerprints",
+            help="SQLite file of page fingerprints, pages unchanged since they were last ingested are skipped",
+        )
+        add_client_arguments(parser)
+
+    def handle(self, *args, **options):
+        client = client_from_options(options)
+        fingerprints = (
+            FingerprintStore(options["fingerprints"]) if options["fingerprints"] else None
+        )
+        pipeline = Pipeline(
+            client,
+            workers=options["workers"],
+            queue_size=options["queue_size"],
+            parser=options["parser"],
+            fingerprints=fingerprints,
+        )
+        try:
+            stats = asyncio.run(pipeline.run(options["urls"]))
+        finally:
+            close_client(client)
+            if fingerprints is not None:
+                fingerprints.close()
+
+        self.stdout.write(
+            f"Fetched {stats.fetched}, parsed {stats.parsed}, "
+            f"ingested {stats.ingested}, skipped {stats.skipped} unchanged, "
+            f"failed {stats.failed}"
+        )
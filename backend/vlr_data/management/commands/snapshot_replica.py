@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vlr_data.routers import snapshot_replica
+
+
+class Command(BaseCommand):
+    help = (
+        "Copies the SQLite database to the read replica set by REPLICA_DATABASE_URL. "
+        "Run it more often than REPLICA_MAX_LAG, or the API falls back to reading "
+        "from the primary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every",
+            type=float,
+            help="Keep taking a snapshot every this many seconds instead of taking one and exiting",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.monotonic()
+            try:
+                snapshot_replica()
+            except ValueError as e:
+                raise CommandError(e)
+            self.stdout.write(f"Took a snapshot in {time.monotonic() - start:.2f}s")
+            if options["every"] is None:
+                return
+            time.sleep(max(options["every"] - (time.monotonic() - start), 0))
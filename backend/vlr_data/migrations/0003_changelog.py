@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlr_data', '0002_team_team_logo_url_alter_team_team_tag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(max_length=20, verbose_name='Model Name')),
+                ('entity_id', models.CharField(verbose_name='VLR ID of the Row')),
+                ('fields', models.JSONField(verbose_name='Fields Changed')),
+                ('changed_at', models.DateTimeField(verbose_name='Changed At')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlr_data', '0003_changelog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(condition=models.Q(('is_finished', False)), fields=['date_played'], name='match_upcoming_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['date_played'], name='match_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['team1', 'date_played'], name='match_team1_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['team2', 'date_played'], name='match_team2_date_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlr_data', '0004_match_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerCareer',
+            fields=[
+                ('maps_played', models.IntegerField(default=0, verbose_name='Maps Played')),
+                ('kills', models.IntegerField(default=0, verbose_name='Kills')),
+                ('deaths', models.IntegerField(default=0, verbose_name='Deaths')),
+                ('assists', models.IntegerField(default=0, verbose_name='Assists')),
+                ('acs_total', models.IntegerField(default=0, verbose_name='Sum of Average Combat Scores')),
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='career', serialize=False, to='vlr_data.player')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerAgentSplit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('maps_played', models.IntegerField(default=0, verbose_name='Maps Played')),
+                ('kills', models.IntegerField(default=0, verbose_name='Kills')),
+                ('deaths', models.IntegerField(default=0, verbose_name='Deaths')),
+                ('assists', models.IntegerField(default=0, verbose_name='Assists')),
+                ('acs_total', models.IntegerField(default=0, verbose_name='Sum of Average Combat Scores')),
+                ('agent', models.CharField(verbose_name='Agent Played')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agent_splits', to='vlr_data.player')),
+            ],
+            options={
+                'unique_together': {('player', 'agent')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerMapSplit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('maps_played', models.IntegerField(default=0, verbose_name='Maps Played')),
+                ('kills', models.IntegerField(default=0, verbose_name='Kills')),
+                ('deaths', models.IntegerField(default=0, verbose_name='Deaths')),
+                ('assists', models.IntegerField(default=0, verbose_name='Assists')),
+                ('acs_total', models.IntegerField(default=0, verbose_name='Sum of Average Combat Scores')),
+                ('map_name', models.CharField(max_length=50, verbose_name='Map Name')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='map_splits', to='vlr_data.player')),
+            ],
+            options={
+                'unique_together': {('player', 'map_name')},
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlr_data', '0005_player_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamSummary',
+            fields=[
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='vlr_data.team')),
+                ('matches_played', models.IntegerField(default=0, verbose_name='Matches Played')),
+                ('wins', models.IntegerField(default=0, verbose_name='Matches Won')),
+                ('losses', models.IntegerField(default=0, verbose_name='Matches Lost')),
+                ('form', models.CharField(default='', max_length=20, verbose_name='Recent Results')),
+                ('last_played', models.DateTimeField(null=True, verbose_name='Last Match Date')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HeadToHead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('matches_played', models.IntegerField(default=0, verbose_name='Matches Played')),
+                ('team_a_wins', models.IntegerField(default=0, verbose_name='Team A Wins')),
+                ('team_b_wins', models.IntegerField(default=0, verbose_name='Team B Wins')),
+                ('team_a_maps', models.IntegerField(default=0, verbose_name='Maps Won by Team A')),
+                ('team_b_maps', models.IntegerField(default=0, verbose_name='Maps Won by Team B')),
+                ('last_played', models.DateTimeField(null=True, verbose_name='Last Match Date')),
+                ('team_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='head_to_heads_as_a', to='vlr_data.team')),
+                ('team_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='head_to_heads_as_b', to='vlr_data.team')),
+            ],
+            options={
+                'unique_together': {('team_a', 'team_b')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TeamMapRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('map_name', models.CharField(max_length=50, verbose_name='Map Name')),
+                ('played', models.IntegerField(default=0, verbose_name='Maps Played')),
+                ('won', models.IntegerField(default=0, verbose_name='Maps Won')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='map_records', to='vlr_data.team')),
+            ],
+            options={
+                'unique_together': {('team', 'map_name')},
+            },
+        ),
+    ]
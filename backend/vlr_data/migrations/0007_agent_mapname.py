@@ -0,0 +1,108 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def names_to_ids(apps, schema_editor):
+    Agent = apps.get_model("vlr_data", "Agent")
+    MapName = apps.get_model("vlr_data", "MapName")
+    Map = apps.get_model("vlr_data", "Map")
+    PlayerStats = apps.get_model("vlr_data", "PlayerStats")
+
+    # One UPDATE per distinct name, there are only a few dozen
+    for lookup, model, old, new in (
+        (Agent, PlayerStats, "agent_name", "agent"),
+        (MapName, Map, "map_name", "name"),
+    ):
+        names = model.objects.values_list(old, flat=True).distinct()
+        for name in names:
+            row, _ = lookup.objects.get_or_create(name=name)
+            model.objects.filter(**{old: name}).update(**{new: row})
+
+
+def ids_to_names(apps, schema_editor):
+    Agent = apps.get_model("vlr_data", "Agent")
+    MapName = apps.get_model("vlr_data", "MapName")
+    Map = apps.get_model("vlr_data", "Map")
+    PlayerStats = apps.get_model("vlr_data", "PlayerStats")
+
+    for lookup, model, old, new in (
+        (Agent, PlayerStats, "agent_name", "agent"),
+        (MapName, Map, "map_name", "name"),
+    ):
+        for row in lookup.objects.all():
+            model.objects.filter(**{new: row}).update(**{old: row.name})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlr_data', '0006_team_summaries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Agent',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Agent')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MapName',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Map Name')),
+            ],
+        ),
+        # Keep the text columns under another name while the ids are filled in
+        migrations.RenameField(
+            model_name='playerstats',
+            old_name='agent',
+            new_name='agent_name',
+        ),
+        migrations.RenameField(
+            model_name='map',
+            old_name='name',
+            new_name='map_name',
+        ),
+        # Nullable so unapplying can add them back before copying the names into them
+        migrations.AlterField(
+            model_name='playerstats',
+            name='agent_name',
+            field=models.CharField(null=True, verbose_name='Agent Played'),
+        ),
+        migrations.AlterField(
+            model_name='map',
+            name='map_name',
+            field=models.CharField(max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='agent',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='vlr_data.agent', verbose_name='Agent Played'),
+        ),
+        migrations.AddField(
+            model_name='map',
+            name='name',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='vlr_data.mapname', verbose_name='Map'),
+        ),
+        migrations.RunPython(names_to_ids, ids_to_names),
+        migrations.RemoveField(
+            model_name='playerstats',
+            name='agent_name',
+        ),
+        migrations.RemoveField(
+            model_name='map',
+            name='map_name',
+        ),
+        migrations.AlterField(
+            model_name='playerstats',
+            name='agent',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='vlr_data.agent', verbose_name='Agent Played'),
+        ),
+        migrations.AlterField(
+            model_name='map',
+            name='name',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, to='vlr_data.mapname', verbose_name='Map'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vlr_data', '0007_agent_mapname'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='match',
+            name='match_upcoming_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='match',
+            name='match_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(condition=models.Q(('is_finished', False)), fields=['date_played', 'vlr_id'], name='match_upcoming_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['date_played', 'vlr_id'], name='match_date_idx'),
+        ),
+    ]
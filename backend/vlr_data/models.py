@@ -30,6 +30,22 @@ class Event(models.Model):
     vlr_url = models.URLField("Event Series URL", unique=True)
 
 
+class Agent(models.Model):
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField("Agent", max_length=50, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class MapName(models.Model):
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField("Map Name", max_length=50, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
 class Match(models.Model):
     event = models.ForeignKey(Event, on_delete=models.DO_NOTHING)
     team1 = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="team_1_matches")
@@ -40,13 +56,32 @@ class Match(models.Model):
     team1_score = models.PositiveSmallIntegerField("Team 1 Score")
     team2_score = models.PositiveSmallIntegerField("Team 2 Score")
 
+    class Meta:
+        indexes = [
+            # Upcoming matches ordered by date, and by VLR ID between matches
+            # at the same time so pages can be keyed on both. Partial, since
+            # Django filters is_finished=False as NOT is_finished, which a
+            # composite (is_finished, date_played) index cannot serve
+            models.Index(
+                fields=["date_played", "vlr_id"],
+                condition=models.Q(is_finished=False),
+                name="match_upcoming_date_idx",
+            ),
+            # Match list: every match ordered by date and VLR ID
+            models.Index(fields=["date_played", "vlr_id"], name="match_date_idx"),
+            # A team's matches ordered by date, from either side
+            models.Index(fields=["team1", "date_played"], name="match_team1_date_idx"),
+            models.Index(fields=["team2", "date_played"], name="match_team2_date_idx"),
+        ]
+
     def __str__(self):
         return f"{self.team1.name} vs {self.team2.name} on {self.date_played}"
 
 
 class Map(models.Model):
     match = models.ForeignKey(Match, on_delete=models.CASCADE)
-    name = models.CharField(max_length=50)
+    # Not indexed, maps are never looked up by their name
+    name = models.ForeignKey(MapName, on_delete=models.PROTECT, db_index=False, verbose_name="Map")
     map_number = models.PositiveSmallIntegerField("Map Number")
     game_id = models.CharField("VLR Game ID", unique=True)
     team1_score = models.PositiveSmallIntegerField("Team 1 Score")
@@ -63,10 +98,119 @@ class PlayerStats(models.Model):
     deaths = models.PositiveSmallIntegerField("Deaths")
     assists = models.PositiveSmallIntegerField("Assists")
     acs = models.PositiveSmallIntegerField("Average Combat Score")
-    agent = models.CharField("Agent Played")
+    # Not indexed, stats are never looked up by agent
+    agent = models.ForeignKey(Agent, on_delete=models.PROTECT, db_index=False, verbose_name="Agent Played")
 
     class Meta:
+        # A player's stats are looked up by the player foreign key index
         unique_together = ("player", "map")
 
     def __str__(self):
         return f"{self.player.ign} on {self.map.name}"
+
+
+class ChangeLog(models.Model):
+    entity = models.CharField("Model Name", max_length=20)
+    entity_id = models.CharField("VLR ID of the Row")
+    fields = models.JSONField("Fields Changed")
+    changed_at = models.DateTimeField("Changed At")
+
+    def __str__(self):
+        return f"{self.entity} {self.entity_id}: {', '.join(self.fields)}"
+
+
+class PlayerTotals(models.Model):
+    """Running sums of a player's stats over a set of maps, kept up to date by ingest"""
+
+    maps_played = models.IntegerField("Maps Played", default=0)
+    kills = models.IntegerField("Kills", default=0)
+    deaths = models.IntegerField("Deaths", default=0)
+    assists = models.IntegerField("Assists", default=0)
+    acs_total = models.IntegerField("Sum of Average Combat Scores", default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def kd(self) -> float:
+        return self.kills / self.deaths if self.deaths else float(self.kills)
+
+    @property
+    def average_acs(self) -> float:
+        return self.acs_total / self.maps_played if self.maps_played else 0.0
+
+
+class PlayerCareer(PlayerTotals):
+    player = models.OneToOneField(Player, on_delete=models.CASCADE, primary_key=True, related_name="career")
+
+    def __str__(self):
+        return f"{self.player.ign} career"
+
+
+class PlayerAgentSplit(PlayerTotals):
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name="agent_splits")
+    agent = models.CharField("Agent Played")
+
+    class Meta:
+        unique_together = ("player", "agent")
+
+    def __str__(self):
+        return f"{self.player.ign} on {self.agent}"
+
+
+class PlayerMapSplit(PlayerTotals):
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name="map_splits")
+    map_name = models.CharField("Map Name", max_length=50)
+
+    class Meta:
+        unique_together = ("player", "map_name")
+
+    def __str__(self):
+        return f"{self.player.ign} on {self.map_name}"
+
+
+class TeamSummary(models.Model):
+    team = models.OneToOneField(Team, on_delete=models.CASCADE, primary_key=True, related_name="summary")
+    matches_played = models.IntegerField("Matches Played", default=0)
+    wins = models.IntegerField("Matches Won", default=0)
+    losses = models.IntegerField("Matches Lost", default=0)
+    form = models.CharField("Recent Results", max_length=20, default="")    # W or L per match, most recent first
+    last_played = models.DateTimeField("Last Match Date", null=True)
+
+    def __str__(self):
+        return f"{self.team.name} {self.wins}-{self.losses}"
+
+
+class TeamMapRecord(models.Model):
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="map_records")
+    map_name = models.CharField("Map Name", max_length=50)
+    played = models.IntegerField("Maps Played", default=0)
+    won = models.IntegerField("Maps Won", default=0)
+
+    class Meta:
+        unique_together = ("team", "map_name")
+
+    @property
+    def win_rate(self) -> float:
+        return self.won / self.played if self.played else 0.0
+
+    def __str__(self):
+        return f"{self.team.name} on {self.map_name}: {self.won}/{self.played}"
+
+
+class HeadToHead(models.Model):
+    # Stored once per pair of teams, with team_a the one with the lower primary key
+    team_a = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="head_to_heads_as_a")
+    team_b = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="head_to_heads_as_b")
+    matches_played = models.IntegerField("Matches Played", default=0)
+    team_a_wins = models.IntegerField("Team A Wins", default=0)
+    team_b_wins = models.IntegerField("Team B Wins", default=0)
+    team_a_maps = models.IntegerField("Maps Won by Team A", default=0)
+    team_b_maps = models.IntegerField("Maps Won by Team B", default=0)
+    last_played = models.DateTimeField("Last Match Date", null=True)
+
+    class Meta:
+        unique_together = ("team_a", "team_b")
+
+    def __str__(self):
+        return f"{self.team_a.name} {self.team_a_wins}-{self.team_b_wins} {self.team_b.name}"
@@ -0,0 +1,103 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginates a queryset by the values of its ordering fields rather than by offset
+
+    The queryset must be ordered by fields whose values together are unique,
+    e.g. ("-date_played", "-vlr_id"). The cursor in the next link holds the
+    last row's values of those fields, and the next page is the rows ordered
+    after them. With an index on the ordering fields, every page is one
+    index range scan however deep it is, and the table is never counted.
+    """
+
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def _ordering(self, queryset):
+        ordering = queryset.query.order_by
+        if not ordering:
+            raise ImproperlyConfigured("KeysetPagination needs an ordered queryset")
+        return [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                queryset.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row) -> str:
+        values = [getattr(row, name) for name, _ in self.ordering]
+        values = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def _after(self, position) -> Q:
+        # (a, b) after (x, y) is a > x OR (a = x AND b > y). The leading a >= x
+        # is implied, but spelled out so the database can range scan the index
+        (first, first_descending), first_value = self.ordering[0], position[0]
+        after = Q(**{f"{first}__{'lte' if first_descending else 'gte'}": first_value})
+        rows_after = Q()
+        for i, ((name, descending), value) in enumerate(zip(self.ordering, position)):
+            equal = {field: v for (field, _), v in zip(self.ordering[:i], position[:i])}
+            rows_after |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+        return after & rows_after
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self._ordering(queryset)
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset)
+        if position is not None:
+            queryset = queryset.filter(self._after(position))
+
+        # One extra row tells whether there is a next page without counting
+        rows = list(queryset[: page_size + 1])
+        self.next_cursor = self.encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,162 @@
+import contextvars
+from contextlib import contextmanager
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+REPLICA = "replica"
+
+# Database the current request (or task) reads from, None for the primary
+_read_db = contextvars.ContextVar("read_db", default=None)
+
+# Last time the replica's lag was measured and whether it was within the bound
+_freshness = {"checked": float("-inf"), "fresh": False}
+_freshness_lock = threading.Lock()
+
+
+def replica_configured() -> bool:
+    """Checks whether a replica database is configured
+
+    Returns:
+        bool: whether DATABASES has a replica alias
+    """
+    return REPLICA in settings.DATABASES
+
+
+def replica_lag() -> float:
+    """Measures how far the replica is behind the primary
+
+    On PostgreSQL this is the time since the last transaction replayed from
+    the primary (0 once every WAL record received has been replayed), on
+    SQLite the age of the snapshot written by the snapshot_replica command.
+
+    Returns:
+        float: lag in seconds, infinite if the replica cannot be reached
+    """
+    connection = connections[REPLICA]
+    try:
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT CASE"
+                    " WHEN NOT pg_is_in_recovery() THEN 0"
+                    " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+                    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                )
+                lag = cursor.fetchone()[0]
+            return float("inf") if lag is None else float(lag)
+        if connection.vendor == "sqlite":
+            return time.time() - os.path.getmtime(connection.settings_dict["NAME"])
+    except (DatabaseError, OSError) as e:
+        logger.warning("Could not measure the replica's lag: %s", e)
+        return float("inf")
+    return 0.0
+
+
+def replica_is_fresh() -> bool:
+    """Checks whether the replica is within REPLICA_MAX_LAG seconds of the primary
+
+    The lag is measured at most once every REPLICA_LAG_CHECK_INTERVAL
+    seconds per process, not on every request.
+
+    Returns:
+        bool: whether reads can go to the replica
+    """
+    if not replica_configured():
+        return False
+    now = time.monotonic()
+    with _freshness_lock:
+        if now - _freshness["checked"] < settings.REPLICA_LAG_CHECK_INTERVAL:
+            return _freshness["fresh"]
+        _freshness["checked"] = now
+
+    fresh = replica_lag() <= settings.REPLICA_MAX_LAG
+    if not fresh and _freshness["fresh"]:
+        logger.warning("Replica is more than %ss behind, reading from the primary", settings.REPLICA_MAX_LAG)
+    _freshness["fresh"] = fresh
+    return fresh
+
+
+@contextmanager
+def read_from_replica():
+    """Sends the reads made inside the block to the replica, if one is configured and fresh enough
+
+    Reads stay on the primary inside use_primary(), even when nested.
+    """
+    if _read_db.get() is not None or not replica_is_fresh():
+        yield
+        return
+    token = _read_db.set(REPLICA)
+    try:
+        yield
+    finally:
+        _read_db.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Sends the reads made inside the block to the primary, e.g. to read back a row just written"""
+    token = _read_db.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _read_db.reset(token)
+
+
+def snapshot_replica():
+    """Copies the SQLite primary to the replica's file, replacing the previous snapshot in one step
+
+    The copy is made with SQLite's online backup, so ingest can keep writing
+    while it runs, into a temporary file that is then moved over the old
+    snapshot. Readers that have the old snapshot open keep reading it until
+    they reconnect.
+
+    Raises:
+        ValueError: if the primary and the replica are not both SQLite databases
+    """
+    primary = connections[DEFAULT_DB_ALIAS]
+    if not replica_configured() or primary.vendor != "sqlite" or connections[REPLICA].vendor != "sqlite":
+        raise ValueError("Snapshots need a SQLite primary and a SQLite replica")
+
+    target = str(settings.DATABASES[REPLICA]["NAME"])
+    tmp = target + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    primary.ensure_connection()
+    copy = sqlite3.connect(tmp)
+    try:
+        primary.connection.backup(copy)
+        # Readers never write to the snapshot, so it needs no WAL file that could outlive it
+        copy.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        copy.close()
+    os.replace(tmp, target)
+
+
+class PrimaryReplicaRouter:
+    """Sends writes and migrations to the primary, and reads to the replica only inside read_from_replica()
+
+    Reads default to the primary, so ingest always diffs against the rows it
+    is about to write, and only the API views opt in to the replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_db.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,271 @@
+from collections import defaultdict
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from ..models import (
+    HeadToHead,
+    Map,
+    Match,
+    PlayerAgentSplit,
+    PlayerCareer,
+    PlayerMapSplit,
+    PlayerStats,
+    TeamMapRecord,
+    TeamSummary,
+)
+from .lookups import agents as agent_names
+
+
+TOTALS = ("maps_played", "kills", "deaths", "assists", "acs_total")
+
+# Number of recent results kept in a team's form
+FORM_LENGTH = 10
+
+# Teams and pairs of teams already refreshed after the latest commit, per thread
+_refreshed = threading.local()
+
+
+def _totals(stats: PlayerStats, sign: int) -> Tuple[int, ...]:
+    return (sign, sign * stats.kills, sign * stats.deaths, sign * stats.assists, sign * stats.acs)
+
+
+def _add_totals(model, keys: Tuple[str, ...], deltas: Dict[tuple, List[int]]):
+    """Adds deltas to the running totals of aggregate rows, creating the rows that are missing and deleting the emptied ones
+
+    The players' rows are read and locked in one query, and the new totals
+    written back in one bulk upsert, so a match costs the same handful of
+    queries per table however many rows it touches. The lock keeps
+    concurrent writers from losing each other's updates to existing rows.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    player_ids = {key[0] for key in deltas}
+    stored = {
+        tuple(getattr(row, name) for name in keys): [getattr(row, name) for name in TOTALS]
+        for row in model.objects.select_for_update().filter(player_id__in=player_ids)
+    }
+    totals = {
+        key: [total + value for total, value in zip(stored.get(key, [0] * len(TOTALS)), delta)]
+        for key, delta in deltas.items()
+    }
+    model.objects.bulk_create(
+        [model(**dict(zip(keys, key)), **dict(zip(TOTALS, total))) for key, total in totals.items()],
+        update_conflicts=True,
+        unique_fields=[model._meta.get_field(name).name for name in keys],
+        update_fields=list(TOTALS),
+    )
+    # Splits the player no longer has any maps in, e.g. after an agent was corrected
+    if any(total[0] <= 0 for total in totals.values()):
+        model.objects.filter(player_id__in=player_ids, maps_played__lte=0).delete()
+
+
+def update_player_aggregates(changes: Iterable[Tuple[PlayerStats, str, int]]):
+    """Applies added and removed PlayerStats rows to the player aggregate tables
+
+    Must run in the transaction the PlayerStats rows are written in, so the
+    aggregates never disagree with them. A stats row that was updated is
+    passed twice: once removed with its old values and once added with its
+    new ones.
+
+    Args:
+        changes (Iterable[Tuple[PlayerStats, str, int]]): the stats row, the name of the map it was played on, and 1 if it was added or -1 if it was removed
+    """
+    careers = defaultdict(lambda: [0] * len(TOTALS))
+    agents = defaultdict(lambda: [0] * len(TOTALS))
+    maps = defaultdict(lambda: [0] * len(TOTALS))
+
+    for stats, map_name, sign in changes:
+        totals = _totals(stats, sign)
+        for aggregate, key in (
+            (careers, (stats.player_id,)),
+            (agents, (stats.player_id, agent_names.name(stats.agent_id))),
+            (maps, (stats.player_id, map_name)),
+        ):
+            aggregate[key] = [total + value for total, value in zip(aggregate[key], totals)]
+
+    _add_totals(PlayerCareer, ("player_id",), careers)
+    _add_totals(PlayerAgentSplit, ("player_id", "agent"), agents)
+    _add_totals(PlayerMapSplit, ("player_id", "map_name"), maps)
+
+
+def rebuild_player_aggregates() -> Dict[str, int]:
+    """Recomputes the player aggregate tables from scratch from every PlayerStats row
+
+    Returns:
+        Dict[str, int]: number of rows written to each table, keyed by model name
+    """
+    totals = {
+        "maps_played": Count("id"),
+        "kills": Sum("kills"),
+        "deaths": Sum("deaths"),
+        "assists": Sum("assists"),
+        "acs_total": Sum("acs"),
+    }
+    counts = {}
+    with transaction.atomic():
+        for model, group_by, fields in (
+            (PlayerCareer, ("player",), ("player_id",)),
+            (PlayerAgentSplit, ("player", "agent__name"), ("player_id", "agent")),
+            (PlayerMapSplit, ("player", "map__name__name"), ("player_id", "map_name")),
+        ):
+            model.objects.all().delete()
+            rows = PlayerStats.objects.values(*group_by).annotate(**totals).order_by()
+            created = model.objects.bulk_create(
+                [
+                    model(
+                        **{field: row[key] for field, key in zip(fields, group_by)},
+                        **{name: row[name] for name in TOTALS},
+                    )
+                    for row in rows.iterator()
+                ],
+                batch_size=1000,
+            )
+            counts[model._meta.model_name] = len(created)
+    return counts
+
+
+def _won(pk: int, team1_id: int, team1_score: int, team2_score: int) -> bool:
+    return team1_score != team2_score and (team1_score > team2_score) == (team1_id == pk)
+
+
+def _refresh_team(pk: int):
+    matches = list(
+        Match.objects.filter(Q(team1_id=pk) | Q(team2_id=pk), is_finished=True)
+        .order_by("-date_played")
+        .values_list("team1_id", "team1_score", "team2_score", "date_played")
+    )
+    results = [
+        "W" if _won(pk, team1_id, team1_score, team2_score) else "L"
+        for team1_id, team1_score, team2_score, _ in matches
+        if team1_score != team2_score
+    ]
+    TeamSummary.objects.update_or_create(
+        team_id=pk,
+        defaults={
+            "matches_played": len(matches),
+            "wins": results.count("W"),
+            "losses": results.count("L"),
+            "form": "".join(results[:FORM_LENGTH]),
+            "last_played": matches[0][3] if matches else None,
+        },
+    )
+
+    records = defaultdict(lambda: [0, 0])
+    maps = Map.objects.filter(
+        Q(match__team1_id=pk) | Q(match__team2_id=pk), match__is_finished=True
+    ).values_list("name__name", "match__team1_id", "team1_score", "team2_score")
+    for name, team1_id, team1_score, team2_score in maps:
+        records[name][0] += 1
+        records[name][1] += _won(pk, team1_id, team1_score, team2_score)
+
+    TeamMapRecord.objects.filter(team_id=pk).exclude(map_name__in=list(records)).delete()
+    TeamMapRecord.objects.bulk_create(
+        [
+            TeamMapRecord(team_id=pk, map_name=name, played=played, won=won)
+            for name, (played, won) in records.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["team", "map_name"],
+        update_fields=["played", "won"],
+    )
+
+
+def _refresh_head_to_head(team_a: int, team_b: int):
+    matches = list(
+        Match.objects.filter(
+            Q(team1_id=team_a, team2_id=team_b) | Q(team1_id=team_b, team2_id=team_a),
+            is_finished=True,
+        )
+        .order_by("-date_played")
+        .values_list("team1_id", "team1_score", "team2_score", "date_played")
+    )
+    a_maps = sum(score_1 if team1_id == team_a else score_2 for team1_id, score_1, score_2, _ in matches)
+    b_maps = sum(score_2 if team1_id == team_a else score_1 for team1_id, score_1, score_2, _ in matches)
+    HeadToHead.objects.update_or_create(
+        team_a_id=team_a,
+        team_b_id=team_b,
+        defaults={
+            "matches_played": len(matches),
+            "team_a_wins": sum(_won(team_a, *match[:3]) for match in matches),
+            "team_b_wins": sum(_won(team_b, *match[:3]) for match in matches),
+            "team_a_maps": a_maps,
+            "team_b_maps": b_maps,
+            "last_played": matches[0][3] if matches else None,
+        },
+    )
+
+
+def refresh_team_summaries(pairs: Iterable[Tuple[int, int]]):
+    """Recomputes the summary and map records of every team in the pairs, and the head to head of each pair
+
+    Each one is recomputed from the team's (or pair's) finished matches,
+    found through the team1/team2 date indexes, so the cost depends on the
+    teams' histories rather than on the size of the Match table. Unlike the
+    player aggregates they are not updated from deltas: a re-ingested match
+    can change its teams or its winner, and the form needs the order of the
+    team's most recent matches, which a running sum does not keep.
+
+    Args:
+        pairs (Iterable[Tuple[int, int]]): primary keys of the two teams of each changed match
+    """
+    pairs = {tuple(sorted(pair)) for pair in pairs}
+    with transaction.atomic():
+        for pk in {pk for pair in pairs for pk in pair}:
+            _refresh_team(pk)
+        for team_a, team_b in pairs:
+            _refresh_head_to_head(team_a, team_b)
+
+
+def _refresh_once(done: Set[tuple], team1_pk: int, team2_pk: int):
+    team_a, team_b = sorted((team1_pk, team2_pk))
+    with transaction.atomic():
+        for pk in (team_a, team_b):
+            if pk not in done:
+                done.add(pk)
+                _refresh_team(pk)
+        if (team_a, team_b) not in done:
+            done.add((team_a, team_b))
+            _refresh_head_to_head(team_a, team_b)
+
+
+def schedule_team_summaries(team1_pk: int, team2_pk: int):
+    """Refreshes the summaries of two teams and their head to head once the current transaction commits
+
+    Every pair gets its own on_commit callback, so the pairs scheduled in a
+    transaction (or savepoint) that rolls back are dropped with it. The
+    callbacks run after one commit share the teams and pairs they already
+    refreshed, so a team in several matches of an IngestWriter batch is
+    only refreshed once.
+
+    Args:
+        team1_pk (int): primary key of the first team of the match
+        team2_pk (int): primary key of the second team of the match
+    """
+    done = getattr(_refreshed, "done", None)
+    # Callbacks only fill the set once their commit has run, so a non-empty
+    # one belongs to an earlier transaction
+    if done is None or done:
+        done = _refreshed.done = set()
+    transaction.on_commit(lambda: _refresh_once(done, team1_pk, team2_pk), robust=True)
+
+
+def rebuild_team_summaries() -> Dict[str, int]:
+    """Recomputes every team summary, map record and head to head from scratch from the Match and Map tables
+
+    Returns:
+        Dict[str, int]: number of rows in each table, keyed by model name
+    """
+    with transaction.atomic():
+        for model in (TeamSummary, TeamMapRecord, HeadToHead):
+            model.objects.all().delete()
+        refresh_team_summaries(
+            Match.objects.filter(is_finished=True).values_list("team1_id", "team2_id").distinct()
+        )
+    return {
+        model._meta.model_name: model.objects.count()
+        for model in (TeamSummary, TeamMapRecord, HeadToHead)
+    }
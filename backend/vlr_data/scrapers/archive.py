@@ -0,0 +1,195 @@
+import datetime
+import gzip
+import io
+import json
+import os
+from pathlib import Path
+import struct
+import threading
+from typing import Dict, Iterator, List, Tuple
+import zlib
+
+
+MAGIC = b"VLRARC01"
+_FOOTER = struct.Struct(">8sQ")  # magic, offset of the index member
+
+
+def _gzip_member(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _encode_record(url: str, content: bytes, fetched_at: datetime.datetime) -> bytes:
+    header = (
+        "VLR-Archive-Record: 1\r\n"
+        f"URL: {url}\r\n"
+        f"Date: {fetched_at.isoformat()}\r\n"
+        f"Content-Length: {len(content)}\r\n"
+        "\r\n"
+    ).encode()
+    return _gzip_member(header + content)
+
+
+def _split_record(data: bytes) -> Tuple[str, bytes]:
+    header, _, content = data.partition(b"\r\n\r\n")
+    fields = dict(
+        line.split(": ", 1) for line in header.decode().split("\r\n") if ": " in line
+    )
+    return fields["URL"], content
+
+
+def _read_index(f) -> Tuple[Dict[str, List[int]], int]:
+    """Reads the URL -> [offset, length] index from the end of an archive file
+
+    Returns the index and the offset where the records end. If the footer is
+    missing (e.g. the writer crashed) or the index it points at is corrupt,
+    the index is rebuilt by scanning every gzip member in the file.
+    """
+    f.seek(0, io.SEEK_END)
+    size = f.tell()
+    if size >= _FOOTER.size:
+        f.seek(size - _FOOTER.size)
+        magic, index_offset = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic == MAGIC and index_offset <= size - _FOOTER.size:
+            f.seek(index_offset)
+            member = f.read(size - _FOOTER.size - index_offset)
+            try:
+                return json.loads(gzip.decompress(member)), index_offset
+            except (OSError, EOFError, zlib.error, ValueError):
+                pass
+
+    index = {}
+    offset = 0
+    while offset < size:
+        f.seek(offset)
+        d = zlib.decompressobj(wbits=31)
+        consumed = 0
+        chunks = []
+        try:
+            while not d.eof:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                chunks.append(d.decompress(chunk))
+                consumed += len(chunk)
+            url, _ = _split_record(b"".join(chunks))
+        except (zlib.error, KeyError, ValueError):
+            break
+        if not d.eof:
+            break
+        length = consumed - len(d.unused_data)
+        index[url] = [offset, length]
+        offset += length
+    return index, offset
+
+
+class ArchiveWriter:
+    """Records fetched pages into a single compressed, indexed archive file
+
+    Each page is stored as its own gzip member with a WARC-like header, and a
+    URL -> offset index is written at the end of the file on close. Opening an
+    existing archive appends to it, and re-recording a URL points the index at
+    the newest copy.
+    """
+
+    def __init__(self, path):
+        """Initializes a new ArchiveWriter Object
+
+        Args:
+            path (str | Path): Archive file to write, created if missing
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a+b")
+        self.index, end = _read_index(self._file)
+        self._file.truncate(end)
+        self._file.seek(end)
+
+    def record(self, url: str, content: bytes):
+        """Appends a fetched page to the archive
+
+        Args:
+            url (str): URL the page was fetched from
+            content (bytes): raw content of the page
+        """
+        member = _encode_record(
+            url, content, datetime.datetime.now(datetime.timezone.utc)
+        )
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(member)
+            self.index[url] = [offset, len(member)]
+
+    def close(self):
+        """Writes the index and closes the archive"""
+        with self._lock:
+            if self._file.closed:
+                return
+            index_offset = self._file.tell()
+            self._file.write(_gzip_member(json.dumps(self.index).encode()))
+            self._file.write(_FOOTER.pack(MAGIC, index_offset))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArchiveReader:
+    """Serves pages recorded by an ArchiveWriter without touching the network"""
+
+    def __init__(self, path):
+        """Initializes a new ArchiveReader Object
+
+        Args:
+            path (str | Path): Archive file to read
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = open(self.path, "rb")
+        self.index, _ = _read_index(self._file)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def urls(self) -> List[str]:
+        """Gets every URL in the archive, in the order they were recorded"""
+        return sorted(self.index, key=lambda url: self.index[url][0])
+
+    def get(self, url: str) -> bytes:
+        """Gets the recorded content of a URL
+
+        Args:
+            url (str): URL to look up
+
+        Raises:
+            KeyError: if the URL was never recorded
+
+        Returns:
+            bytes: raw content of the page
+        """
+        offset, length = self.index[url]
+        with self._lock:
+            self._file.seek(offset)
+            member = self._file.read(length)
+        return _split_record(gzip.decompress(member))[1]
+
+    def __iter__(self) -> Iterator[Tuple[str, bytes]]:
+        for url in self.urls():
+            yield url, self.get(url)
+
+    def close(self):
+        """Closes the archive"""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
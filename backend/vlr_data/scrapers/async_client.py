@@ -0,0 +1,265 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+import requests
+
+from .archive import ArchiveReader, ArchiveWriter
+from .backends import HTML_PARSER, Document, parse_html
+from .cache import ResponseCache
+from .retry import (
+    PERMANENT,
+    RATE_LIMITED,
+    SUCCESS,
+    CircuitBreaker,
+    FetchError,
+    PermanentFetchError,
+    RetryPolicy,
+)
+from .stats_table import PAGE_STRAINERS
+from .url_types import classify_url
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket used to keep requests to a single host under a fixed rate"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """Initializes a new TokenBucket Object
+
+        Args:
+            rate (float): Tokens added per second, i.e. the sustained requests per second allowed. A rate of 0 disables limiting.
+            capacity (float, optional): Max tokens the bucket can hold, i.e. how many requests can burst at once. Defaults to 1.0.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Waits until a token is available and takes it"""
+        if self.rate <= 0:
+            return
+
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class AsyncVLRClient:
+    """Asyncio client to get URLs from VLR with many requests in flight at once"""
+
+    def __init__(
+        self,
+        sleep=1.0,
+        max_retries=3,
+        timeout=20.0,
+        concurrency=4,
+        burst=1.0,
+        cache: Optional[ResponseCache] = None,
+        recorder: Optional[ArchiveWriter] = None,
+        replay: Optional[ArchiveReader] = None,
+        retry: Optional[RetryPolicy] = None,
+        parser: str = HTML_PARSER,
+    ):
+        """Initializes a new AsyncVLRClient Object
+
+        Args:
+            sleep (float, optional): Average time (in seconds) between requests to the same host. Defaults to 1.0.
+            max_retries (int, optional): Max times to try fetching a url if it fails, ignored if retry is given. Defaults to 3.
+            timeout (float, optional): Max time to wait (in seconds) for a url before giving up. Defaults to 20.0.
+            concurrency (int, optional): Max number of requests in flight at once. Defaults to 4.
+            burst (float, optional): Max requests that can be sent back to back to a host after it has been idle. Defaults to 1.0.
+            cache (ResponseCache, optional): On-disk cache to serve fresh responses from and revalidate stale ones with. Defaults to None.
+            recorder (ArchiveWriter, optional): Archive to record every fetched page into. Defaults to None.
+            replay (ArchiveReader, optional): Archive to serve every page from instead of the network. Defaults to None.
+            retry (RetryPolicy, optional): How failed requests are retried. Defaults to RetryPolicy(max_retries=max_retries).
+            parser (str, optional): Parser backend used by get and get_many, one of backends.BACKENDS. Defaults to HTML_PARSER.
+        """
+        self.session = requests.Session()
+        self.sleep = sleep
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.burst = burst
+        self.cache = cache
+        self.recorder = recorder
+        self.replay = replay
+        self.retry = retry or RetryPolicy(max_retries=max_retries)
+        self.parser = parser
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="vlr-fetch"
+        )
+
+    def _bucket(self, url: str) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            rate = 1.0 / self.sleep if self.sleep > 0 else 0
+            self._buckets[host] = TokenBucket(rate, self.burst)
+        return self._buckets[host]
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker()
+        return self._breakers[host]
+
+    async def _in_thread(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _request(self, url: str, headers: dict) -> requests.Response:
+        return await self._in_thread(
+            lambda: self.session.get(url, headers=headers, timeout=self.timeout)
+        )
+
+    async def fetch(self, url: str) -> bytes:
+        """Fetches a URL under the client's rate limit and returns the raw body
+
+        Args:
+            url (str): URL to get
+
+        Raises:
+            PermanentFetchError: if VLR answers with a status that retrying will not fix, e.g. 404
+            FetchError: if the URL could not be fetched after max_retries tries, or is not in the replay archive
+
+        Returns:
+            bytes: raw content of the response
+        """
+        if self.replay is not None:
+            try:
+                return await self._in_thread(self.replay.get, url)
+            except KeyError:
+                raise PermanentFetchError(url, "not in the replay archive")
+
+        content = await self._fetch(url)
+        if self.recorder is not None:
+            await self._in_thread(self.recorder.record, url, content)
+        return content
+
+    async def _fetch(self, url: str) -> bytes:
+        cached = None
+        headers = {}
+        if self.cache is not None:
+            cached = await self._in_thread(self.cache.lookup, url)
+            if cached is not None:
+                if cached.is_fresh():
+                    return cached.content
+                headers = cached.revalidation_headers()
+
+        breaker = self._breaker(url)
+        error = None
+        for attempt in range(self.retry.max_retries):
+            if attempt > 0:
+                await asyncio.sleep(delay)
+            probe = await breaker.wait()
+            try:
+                await self._bucket(url).acquire()
+
+                try:
+                    async with self._semaphore:
+                        r = await self._request(url, headers)
+                except requests.RequestException as e:
+                    logger.warning("Error fetching %s: %s", url, e)
+                    breaker.record_failure()
+                    error = FetchError(url, str(e))
+                    delay = self.retry.backoff(attempt)
+                    continue
+
+                outcome = self.retry.classify(r.status_code)
+                if outcome == SUCCESS:
+                    breaker.record_success()
+                    if r.status_code == 304 and cached is not None:
+                        await self._in_thread(self.cache.refresh, url, r.headers)
+                        return cached.content
+                    if r.status_code == 200:
+                        if self.cache is not None:
+                            await self._in_thread(
+                                self.cache.store, url, r.content, r.headers
+                            )
+                        return r.content
+
+                error = FetchError(url, f"HTTP {r.status_code}", r.status_code)
+                if outcome == PERMANENT:
+                    raise PermanentFetchError(url, f"HTTP {r.status_code}", r.status_code)
+
+                if outcome == RATE_LIMITED:
+                    delay = self.retry.retry_after(r.headers)
+                    if delay is None:
+                        delay = self.retry.backoff(attempt)
+                    logger.warning("Rate limited by %s, pausing for %.1fs", url, delay)
+                    breaker.pause(delay)
+                else:
+                    logger.warning("Error fetching %s: HTTP %d", url, r.status_code)
+                    breaker.record_failure()
+                    delay = self.retry.backoff(attempt)
+            finally:
+                if probe:
+                    breaker.end_probe()
+
+        raise error or FetchError(url, "no tries left")
+
+    def _parse(self, url: str, content: bytes) -> Document:
+        return parse_html(content, self.parser, PAGE_STRAINERS.get(classify_url(url)))
+
+    async def get(self, url: str) -> Document:
+        """Fetches a URL and parses it with the client's parser backend
+
+        Args:
+            url (str): URL to get
+
+        Returns:
+            Document: BeautifulSoup (or compatible) object with request content
+        """
+        return self._parse(url, await self.fetch(url))
+
+    async def fetch_many(self, urls: List[str], return_exceptions=False) -> list:
+        """Fetches many URLs concurrently
+
+        Args:
+            urls (List[str]): URLs to get
+            return_exceptions (bool, optional): Return the exception in place of a failed URL's content instead of raising it. Defaults to False.
+
+        Returns:
+            list: raw content of each URL, in the same order as urls
+        """
+        return await asyncio.gather(
+            *(self.fetch(url) for url in urls), return_exceptions=return_exceptions
+        )
+
+    async def get_many(self, urls: List[str], return_exceptions=False) -> list:
+        """Fetches many URLs concurrently and parses them with the client's parser backend
+
+        Args:
+            urls (List[str]): URLs to get
+            return_exceptions (bool, optional): Return the exception in place of a failed URL's soup instead of raising it. Defaults to False.
+
+        Returns:
+            list: BeautifulSoup (or compatible) object for each URL, in the same order as urls
+        """
+        contents = await self.fetch_many(urls, return_exceptions=return_exceptions)
+        return [
+            c if isinstance(c, BaseException) else self._parse(url, c)
+            for url, c in zip(urls, contents)
+        ]
+
+    def close(self):
+        """Releases the client's worker threads and HTTP connections"""
+        self._executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,178 @@
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional, Sequence, Union
+from bs4 import BeautifulSoup, SoupStrainer
+
+
+HTML_PARSER = "html.parser"
+LXML = "lxml"
+SELECTOLAX = "selectolax"
+
+BACKENDS = (HTML_PARSER, LXML, SELECTOLAX)
+
+# BeautifulSoup leaves the text inside these tags out of get_text
+_NON_TEXT_TAGS = frozenset({"script", "style", "template"})
+
+
+def _join(strings: Iterator[str], separator: str, strip: bool) -> str:
+    if strip:
+        strings = (s.strip() for s in strings)
+        strings = (s for s in strings if s)
+    return separator.join(strings)
+
+
+class LxmlNode:
+    """Wraps an lxml element in the subset of the BeautifulSoup API the parsers use"""
+
+    __slots__ = ("_el",)
+
+    def __init__(self, el):
+        self._el = el
+
+    def select(self, selector: str) -> List["LxmlNode"]:
+        return [LxmlNode(el) for el in _lxml_selector(selector)(self._el)]
+
+    def select_one(self, selector: str) -> Optional["LxmlNode"]:
+        matches = _lxml_selector(selector)(self._el)
+        return LxmlNode(matches[0]) if matches else None
+
+    def find_all(self, name: str, recursive: bool = True) -> List["LxmlNode"]:
+        if recursive:
+            return [LxmlNode(el) for el in self._el.iterdescendants(name)]
+        return [LxmlNode(el) for el in self._el.iterchildren(name)]
+
+    def get(self, key: str, default=None):
+        value = self._el.get(key)
+        if value is None:
+            return default
+        return value.split() if key == "class" else value
+
+    def _strings(self, el) -> Iterator[str]:
+        if el.tag in _NON_TEXT_TAGS:
+            return
+        if el.text:
+            yield el.text
+        for child in el:
+            if isinstance(child.tag, str):
+                yield from self._strings(child)
+            if child.tail:
+                yield child.tail
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        return _join(self._strings(self._el), separator, strip)
+
+
+class SelectolaxNode:
+    """Wraps a selectolax node in the subset of the BeautifulSoup API the parsers use"""
+
+    __slots__ = ("_node",)
+
+    def __init__(self, node):
+        self._node = node
+
+    def select(self, selector: str) -> List["SelectolaxNode"]:
+        return [SelectolaxNode(node) for node in self._node.css(selector)]
+
+    def select_one(self, selector: str) -> Optional["SelectolaxNode"]:
+        node = self._node.css_first(selector)
+        return None if node is None else SelectolaxNode(node)
+
+    def find_all(self, name: str, recursive: bool = True) -> List["SelectolaxNode"]:
+        if recursive:
+            return self.select(name)
+        return [SelectolaxNode(node) for node in self._node.iter() if node.tag == name]
+
+    def get(self, key: str, default=None):
+        attributes = self._node.attributes
+        if key not in attributes:
+            return default
+        value = attributes[key] or ""
+        return value.split() if key == "class" else value
+
+    def _strings(self, node) -> Iterator[str]:
+        for child in node.iter(include_text=True):
+            if child.tag == "-text":
+                yield child.text_content
+            elif not child.tag.startswith(("-", "_")) and child.tag not in _NON_TEXT_TAGS:
+                yield from self._strings(child)
+
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        if self._node.tag in _NON_TEXT_TAGS:
+            return ""
+        return _join(self._strings(self._node), separator, strip)
+
+
+Document = Union[BeautifulSoup, LxmlNode, SelectolaxNode]
+
+
+@lru_cache(maxsize=256)
+def _lxml_selector(selector: str):
+    from lxml.cssselect import CSSSelector
+
+    return CSSSelector(selector, translator="html")
+
+
+def parse_html(
+    content: Union[bytes, str],
+    backend: str = HTML_PARSER,
+    parse_only: Optional[SoupStrainer] = None,
+) -> Document:
+    """Parses a page with the chosen backend
+
+    Every backend returns a document exposing select, select_one, find_all,
+    get and get_text with BeautifulSoup's semantics, so the parse_* functions
+    give the same output whichever one is used.
+
+    Args:
+        content (bytes | str): raw content of the page
+        backend (str, optional): one of BACKENDS. Defaults to HTML_PARSER.
+        parse_only (SoupStrainer, optional): Only build the parts of the tree it matches. Only used by HTML_PARSER, the other backends are fast enough to build the whole page. Defaults to None.
+
+    Raises:
+        ValueError: if the backend is unknown
+        ImportError: if the backend's library is not installed
+
+    Returns:
+        Document: the parsed page
+    """
+    if backend == HTML_PARSER:
+        return BeautifulSoup(content, "html.parser", parse_only=parse_only)
+
+    if backend == LXML:
+        import lxml.html
+
+        if isinstance(content, str):
+            content = content.encode()
+        return LxmlNode(lxml.html.document_fromstring(content))
+
+    if backend == SELECTOLAX:
+        from selectolax.lexbor import LexborHTMLParser
+
+        return SelectolaxNode(LexborHTMLParser(content).root)
+
+    raise ValueError(f"Unknown parser backend: {backend}")
+
+
+def verify_backends(
+    content: Union[bytes, str],
+    parser: Callable[[Document], object],
+    backends: Sequence[str] = (LXML, SELECTOLAX),
+) -> List[str]:
+    """Checks that a parser gives the same output on other backends as on html.parser
+
+    Args:
+        content (bytes | str): raw content of the page
+        parser (Callable[[Document], object]): one of the parse_* or extract_* functions
+        backends (Sequence[str], optional): backends to check. Defaults to (LXML, SELECTOLAX).
+
+    Returns:
+        List[str]: the backends whose output differs from html.parser's
+    """
+    expected = parser(parse_html(content, HTML_PARSER))
+    mismatched = []
+    for backend in backends:
+        try:
+            if parser(parse_html(content, backend)) != expected:
+                mismatched.append(backend)
+        except Exception:
+            mismatched.append(backend)
+    return mismatched
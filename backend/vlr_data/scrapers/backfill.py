@@ -0,0 +1,262 @@
+import asyncio
+from dataclasses import dataclass
+import logging
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connection
+
+from ..models import Match, Team
+from .async_client import AsyncVLRClient
+from .backends import HTML_PARSER
+from .fingerprint import FingerprintStore
+from .ingest import get_match_id_from_url
+from .pipeline import Pipeline
+from .url_types import BASE_URL, normalize_url
+from .vlr_scraper import extract_page_count, parse_team_matches_page
+
+
+logger = logging.getLogger(__name__)
+
+
+def team_matches_url(vlr_id: str, page: int = 1) -> str:
+    """Gets the URL of a page of a team's VLR matches from its VLR ID
+
+    Args:
+        vlr_id (str): the team's VLR ID
+        page (int, optional): page of the list, most recent matches first. Defaults to 1.
+
+    Returns:
+        str: URL for the page of the team's matches
+    """
+    return f"{BASE_URL}/team/matches/{vlr_id}/?page={page}"
+
+
+def _known_matches(vlr_ids: List[str]) -> Set[str]:
+    close_old_connections()
+    return set(
+        Match.objects.filter(vlr_id__in=vlr_ids).values_list("vlr_id", flat=True)
+    )
+
+
+def _all_teams() -> List[str]:
+    close_old_connections()
+    return list(Team.objects.values_list("vlr_id", flat=True))
+
+
+def _close_connection():
+    connection.close()
+
+
+@dataclass
+class BackfillStats:
+    teams: int = 0
+    pages: int = 0
+    matches: int = 0
+    failed_matches: int = 0
+    failed_teams: int = 0
+
+
+class TeamBackfill:
+    """Walks every page of teams' match histories and ingests the matches on them
+
+    Teams are walked concurrently, each one page at a time from the most
+    recent, while their match pages go through a shared pipeline. A team's
+    checkpoint only moves past a page once every match on it is through the
+    pipeline, so an interrupted backfill resumes without losing matches.
+    Matches that failed are recorded with the team and retried at the start
+    of its next run, since later runs may never walk their page again.
+
+    The first backfill of a team walks its whole history, only skipping the
+    matches already in the Match table. Once a team has been backfilled,
+    later runs stop at the first page with a match already in the Match
+    table, since everything older was ingested (or recorded as failed) by
+    the earlier run. Such a top-up leaves the team's checkpoint as it was,
+    so an interrupted one does not restart the whole history.
+    """
+
+    def __init__(
+        self,
+        client: AsyncVLRClient,
+        path: str,
+        teams_at_once: int = 8,
+        workers: Optional[int] = None,
+        parser: str = HTML_PARSER,
+        fingerprints: Optional[FingerprintStore] = None,
+    ):
+        """Initializes a new TeamBackfill Object
+
+        Args:
+            client (AsyncVLRClient): Client to fetch pages with
+            path (str): SQLite file to keep the checkpoints in, created if missing
+            teams_at_once (int, optional): Number of teams walked concurrently. Defaults to 8.
+            workers (int, optional): Number of parser processes. Defaults to the number of CPUs.
+            parser (str, optional): Parser backend, one of backends.BACKENDS. Defaults to HTML_PARSER.
+            fingerprints (FingerprintStore, optional): Fingerprints of the pages as last ingested, unchanged pages are skipped. Defaults to None.
+        """
+        self.client = client
+        self.teams_at_once = teams_at_once
+        self.stats = BackfillStats()
+        self.pipeline = Pipeline(
+            client,
+            workers=workers,
+            parser=parser,
+            on_finished=self._finished,
+            fingerprints=fingerprints,
+        )
+        self._waiting: Dict[str, asyncio.Future] = {}
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS backfill (
+                team TEXT PRIMARY KEY,
+                next_page INTEGER NOT NULL,
+                complete INTEGER NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS backfill_failed (
+                team TEXT NOT NULL,
+                url TEXT NOT NULL,
+                PRIMARY KEY (team, url)
+            )
+            """
+        )
+
+    def _checkpoint(self, team: str) -> Tuple[int, bool]:
+        row = self._db.execute(
+            "SELECT next_page, complete FROM backfill WHERE team = ?", (team,)
+        ).fetchone()
+        return (1, False) if row is None else (row[0], bool(row[1]))
+
+    def _save_checkpoint(self, team: str, next_page: int, complete: bool):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO backfill (team, next_page, complete, updated) VALUES (?, ?, ?, ?)",
+                (team, next_page, int(complete), time.time()),
+            )
+
+    def _failed_matches(self, team: str) -> List[str]:
+        rows = self._db.execute("SELECT url FROM backfill_failed WHERE team = ?", (team,))
+        return [url for url, in rows]
+
+    def _save_failed_matches(self, team: str, urls: List[str], failed: List[str]):
+        with self._db:
+            self._db.executemany(
+                "DELETE FROM backfill_failed WHERE team = ? AND url = ?",
+                [(team, url) for url in urls if url not in failed],
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO backfill_failed (team, url) VALUES (?, ?)",
+                [(team, url) for url in failed],
+            )
+
+    def _finished(self, url: str, ok: bool):
+        future = self._waiting.pop(url, None)
+        if future is not None and not future.done():
+            future.set_result(ok)
+
+    async def _ingest_matches(self, team: str, urls: List[str]):
+        """Runs match pages through the pipeline and records the ones that failed for the team's next run"""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for url in urls:
+            future = self._waiting.get(url)
+            if future is None:
+                future = self._waiting[url] = loop.create_future()
+                self.pipeline.submit(url)
+            futures.append(future)
+        results = await asyncio.gather(*futures)
+
+        failed = [url for url, ok in zip(urls, results) if not ok]
+        self._save_failed_matches(team, urls, failed)
+        self.stats.matches += len(urls) - len(failed)
+        self.stats.failed_matches += len(failed)
+
+    async def _walk(self, team: str):
+        page, complete = self._checkpoint(team)
+        # A finished history is topped up from its most recent page
+        if complete:
+            page = 1
+        last_page = page
+
+        retries = self._failed_matches(team)
+        if retries:
+            logger.info("Retrying %d matches of team %s that failed before", len(retries), team)
+            await self._ingest_matches(team, retries)
+
+        while page <= last_page:
+            soup = await self.client.get(team_matches_url(team, page))
+            last_page = max(last_page, extract_page_count(soup))
+            urls = [normalize_url(url) for url in parse_team_matches_page(soup)]
+            self.stats.pages += 1
+            if not urls:
+                break
+
+            ids = {get_match_id_from_url(url): url for url in urls}
+            known = await sync_to_async(_known_matches)(list(ids))
+            new = [url for vlr_id, url in ids.items() if vlr_id not in known]
+            await self._ingest_matches(team, new)
+
+            page += 1
+            if complete:
+                if known:
+                    break
+                continue
+            self._save_checkpoint(team, page, False)
+
+        self._save_checkpoint(team, 1, True)
+        self.stats.teams += 1
+
+    async def _walker(self, teams: asyncio.Queue):
+        while True:
+            team = await teams.get()
+            try:
+                await self._walk(team)
+            except Exception as e:
+                logger.warning("Error backfilling team %s: %s", team, e)
+                self.stats.failed_teams += 1
+            finally:
+                teams.task_done()
+
+    async def _walk_all(self, teams: Iterable[str]):
+        queue = asyncio.Queue()
+        for team in teams:
+            queue.put_nowait(team)
+
+        walkers = [
+            asyncio.create_task(self._walker(queue)) for _ in range(self.teams_at_once)
+        ]
+        try:
+            await queue.join()
+        finally:
+            for walker in walkers:
+                walker.cancel()
+            await asyncio.gather(*walkers, return_exceptions=True)
+
+    async def run(self, teams: Optional[Iterable[str]] = None) -> BackfillStats:
+        """Backfills the match history of the teams
+
+        Args:
+            teams (Iterable[str], optional): VLR IDs of the teams to backfill. Defaults to every team in the Team table.
+
+        Returns:
+            BackfillStats: how many teams, pages and matches were walked
+        """
+        try:
+            if teams is None:
+                teams = await sync_to_async(_all_teams)()
+            await self.pipeline.run([], until=self._walk_all(teams))
+        finally:
+            # The thread sync_to_async runs queries in outlives the backfill
+            await sync_to_async(_close_connection)()
+        return self.stats
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,91 @@
+from typing import List, Sequence
+
+from django.db import connections, router, transaction
+from django.db.models import Model
+
+
+# Smallest batch streamed with COPY on PostgreSQL, smaller ones are cheaper as one multi-row INSERT
+COPY_MIN_ROWS = 50
+
+
+def _can_copy(connection) -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    return is_psycopg3
+
+
+def _copy_upsert(connection, model, objs: Sequence[Model], unique_fields: List[str], update_fields: List[str]):
+    opts = model._meta
+    qn = connection.ops.quote_name
+    fields = [field for field in opts.concrete_fields if not field.primary_key]
+    columns = ", ".join(qn(field.column) for field in fields)
+    unique = [opts.get_field(name).column for name in unique_fields]
+    update = ", ".join(
+        f"{qn(column)} = EXCLUDED.{qn(column)}"
+        for column in (opts.get_field(name).column for name in update_fields)
+    )
+    table = qn(opts.db_table)
+    staging = qn(f"_copy_{opts.db_table}")
+
+    with transaction.atomic(using=connection.alias, savepoint=False), connection.cursor() as cursor:
+        # A staging table with the columns but none of the constraints of the
+        # target, kept for the rest of the session and emptied before each use
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} AS SELECT {columns} FROM {table} WITH NO DATA"
+        )
+        cursor.execute(f"TRUNCATE {staging}")
+        with cursor.copy(f"COPY {staging} ({columns}) FROM STDIN") as copy:
+            for obj in objs:
+                copy.write_row(
+                    [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+                )
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} "
+            f"ON CONFLICT ({', '.join(qn(column) for column in unique)}) DO UPDATE SET {update} "
+            f"RETURNING {qn(opts.pk.column)}, {', '.join(qn(column) for column in unique)}"
+        )
+        pks = {tuple(row[1:]): row[0] for row in cursor.fetchall()}
+
+    for obj in objs:
+        key = tuple(
+            opts.get_field(name).get_db_prep_save(getattr(obj, opts.get_field(name).attname), connection)
+            for name in unique_fields
+        )
+        obj.pk = pks[key]
+        obj._state.adding = False
+        obj._state.db = connection.alias
+
+
+def bulk_upsert(model, objs: Sequence[Model], unique_fields: List[str], update_fields: List[str]) -> Sequence[Model]:
+    """Inserts rows in bulk, updating the ones that conflict with a stored row instead
+
+    Same as bulk_create(update_conflicts=True), but on PostgreSQL batches of
+    at least COPY_MIN_ROWS rows are streamed into a temporary table with
+    COPY and merged into the table with one INSERT ... SELECT ... ON
+    CONFLICT, which is much faster than binding every value of a multi-row
+    INSERT.
+
+    Args:
+        model (Type[Model]): model of the rows
+        objs (Sequence[Model]): the rows, at most one per unique key
+        unique_fields (List[str]): fields of the unique constraint the rows conflict on
+        update_fields (List[str]): fields updated when a row conflicts
+
+    Returns:
+        Sequence[Model]: the rows, with their primary keys set if the backend returns them
+    """
+    if not objs:
+        return objs
+    connection = connections[router.db_for_write(model)]
+    if _can_copy(connection) and len(objs) >= COPY_MIN_ROWS:
+        _copy_upsert(connection, model, objs, unique_fields, update_fields)
+        return objs
+
+    return model.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=update_fields,
+    )
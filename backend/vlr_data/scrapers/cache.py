@@ -0,0 +1,276 @@
+from dataclasses import dataclass
+import hashlib
+import os
+from pathlib import Path
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Mapping, Optional
+import zlib
+
+from . import url_types
+
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+_FINISHED_MATCH_RE = re.compile(
+    rb"match-header-vs-note[^>]*>\s*final\s*<", re.IGNORECASE
+)
+
+
+def default_ttl(url: str, content: bytes) -> Optional[float]:
+    """Gets how long a fetched page stays fresh in the cache
+
+    Args:
+        url (str): URL of the page
+        content (bytes): raw content of the page
+
+    Returns:
+        Optional[float]: seconds the page stays fresh, or None if it never expires
+    """
+    kind = url_types.classify_url(url)
+
+    if kind == url_types.MATCH:
+        if _FINISHED_MATCH_RE.search(content):
+            return None
+        return MINUTE
+    if kind == url_types.HOMEPAGE:
+        return MINUTE
+    if kind in (url_types.EVENT, url_types.EVENT_MATCHES):
+        return 10 * MINUTE
+    if kind == url_types.TEAM_MATCHES:
+        return HOUR
+    if kind in (url_types.TEAM, url_types.PLAYER):
+        return DAY
+    return HOUR
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    content: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    expires_at: Optional[float]  # None if the response never expires
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """Whether the response can be used without revalidating it"""
+        if self.expires_at is None:
+            return True
+        return (time.time() if now is None else now) < self.expires_at
+
+    def revalidation_headers(self) -> dict:
+        """Conditional request headers to revalidate the response with VLR"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Persistent on-disk cache of VLR responses
+
+    Bodies are stored zlib compressed and content addressed by their SHA-256,
+    so identical pages share one blob. A SQLite index maps each URL to its
+    blob, validators and expiry, and the least recently used entries are
+    evicted once the blobs exceed max_bytes.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes: int = 512 * 1024 * 1024,
+        ttl: Callable[[str, bytes], Optional[float]] = default_ttl,
+    ):
+        """Initializes a new ResponseCache Object
+
+        Args:
+            path (str | Path): Directory to store the cache in, created if missing
+            max_bytes (int, optional): Max total size (compressed) of the stored bodies. Defaults to 512 MiB.
+            ttl (Callable[[str, bytes], Optional[float]], optional): Gets the seconds a page stays fresh from its URL and content, None for never. Defaults to default_ttl.
+        """
+        self.path = Path(path)
+        self.blob_dir = self.path / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path / "index.sqlite3", check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+            CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            """
+        )
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest[2:]
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        """Gets the cached response for a URL, fresh or not
+
+        Args:
+            url (str): URL to look up
+
+        Returns:
+            Optional[CachedResponse]: the cached response, or None if the URL is not cached
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, etag, last_modified, fetched_at, expires_at "
+                "FROM entries WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            digest, etag, last_modified, fetched_at, expires_at = row
+            try:
+                content = zlib.decompress(self._blob_path(digest).read_bytes())
+            except (OSError, zlib.error):
+                self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self._db.commit()
+                return None
+
+            self._db.execute(
+                "UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), url)
+            )
+            self._db.commit()
+
+        return CachedResponse(url, content, etag, last_modified, fetched_at, expires_at)
+
+    def store(self, url: str, content: bytes, headers: Mapping[str, str]):
+        """Stores a fetched response, replacing any previous entry for the URL
+
+        Args:
+            url (str): URL that was fetched
+            content (bytes): raw content of the response
+            headers (Mapping[str, str]): headers of the response, used for its validators
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(digest)
+        now = time.time()
+        ttl = self.ttl(url, content)
+
+        with self._lock:
+            if not blob_path.exists():
+                blob = zlib.compress(content, 6)
+                blob_path.parent.mkdir(exist_ok=True)
+                tmp_path = blob_path.with_suffix(f".{os.getpid()}.tmp")
+                tmp_path.write_bytes(blob)
+                os.replace(tmp_path, blob_path)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO blobs (digest, size) VALUES (?, ?)",
+                    (digest, len(blob)),
+                )
+
+            old = self._db.execute(
+                "SELECT digest FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(url, digest, etag, last_modified, fetched_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    digest,
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    now,
+                    None if ttl is None else now + ttl,
+                    now,
+                ),
+            )
+            if old is not None and old[0] != digest:
+                self._drop_blob_if_unused(old[0])
+
+            self._evict()
+            self._db.commit()
+
+    def refresh(self, url: str, headers: Mapping[str, str]):
+        """Marks a cached response as fresh again after a 304 Not Modified
+
+        The body is unchanged, so it stays fresh for as long as when it was
+        stored: the TTL is read back from the index row (expires_at minus
+        fetched_at, never expiring if expires_at is NULL) rather than
+        recomputed from the body.
+
+        Args:
+            url (str): URL that was revalidated
+            headers (Mapping[str, str]): headers of the 304 response
+        """
+        now = time.time()
+        with self._lock:
+            # Every expression in SET sees the row as it was before the update
+            self._db.execute(
+                "UPDATE entries SET expires_at = ? + (expires_at - fetched_at), "
+                "fetched_at = ?, last_access = ?, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) "
+                "WHERE url = ?",
+                (
+                    now,
+                    now,
+                    now,
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    url,
+                ),
+            )
+            self._db.commit()
+
+    def _drop_blob_if_unused(self, digest: str):
+        in_use = self._db.execute(
+            "SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)
+        ).fetchone()
+        if in_use:
+            return
+        self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        try:
+            self._blob_path(digest).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        if total <= self.max_bytes:
+            return
+
+        lru = self._db.execute(
+            "SELECT url, digest FROM entries ORDER BY last_access"
+        ).fetchall()
+        for url, digest in lru:
+            self._db.execute("DELETE FROM entries WHERE url = ?", (url,))
+            size = self._db.execute(
+                "SELECT size FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+            self._drop_blob_if_unused(digest)
+            if size is not None and not self._blob_path(digest).exists():
+                total -= size[0]
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        """Closes the cache index"""
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,140 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import models
+from django.utils import timezone
+
+from ..models import ChangeLog
+
+
+def changed_fields(row: models.Model, values: dict) -> List[str]:
+    """Gets the fields of a row whose stored value differs from the incoming one
+
+    Args:
+        row (Model): the row as stored in the database
+        values (dict): incoming value of each field, keyed by attribute name (e.g. team_id rather than team)
+
+    Returns:
+        List[str]: names of the fields that changed
+    """
+    return [name for name, value in values.items() if getattr(row, name) != value]
+
+
+def log_changes(model, changes: Dict[str, List[str]], changed_at=None):
+    """Appends a ChangeLog entry for every row with changed fields, in one query
+
+    Args:
+        model (Type[Model]): model of the rows
+        changes (Dict[str, List[str]]): names of the changed fields keyed by the row's VLR ID, rows with no changes are skipped
+        changed_at (datetime, optional): time of the changes. Defaults to now.
+    """
+    changed_at = changed_at or timezone.now()
+    ChangeLog.objects.bulk_create(
+        [
+            ChangeLog(
+                entity=model._meta.model_name,
+                entity_id=entity_id,
+                fields=fields,
+                changed_at=changed_at,
+            )
+            for entity_id, fields in changes.items()
+            if fields
+        ]
+    )
+
+
+def upsert_many(
+    model,
+    key: str,
+    rows: Dict[str, dict],
+    touch: Optional[str] = None,
+) -> Dict[str, models.Model]:
+    """Creates or updates rows, writing only the ones whose fields changed
+
+    The stored rows are read in one query and compared field by field with
+    the incoming values. New rows are inserted, rows with changed fields are
+    saved with only those fields, and unchanged rows are not written at all.
+    Every insert and update is appended to the ChangeLog. Rows are saved one
+    by one rather than in bulk so post_save signals (and the identity map)
+    still see them.
+
+    Args:
+        model (Type[Model]): model of the rows
+        key (str): unique field the rows are looked up by, e.g. vlr_id
+        rows (Dict[str, dict]): incoming value of each field keyed by attribute name, keyed by the row's key
+        touch (str, optional): timestamp field set to now whenever the row is written, e.g. last_updated. Defaults to None.
+
+    Returns:
+        Dict[str, Model]: the rows as now stored, keyed by their key
+    """
+    return _upsert_many(model, key, rows, touch)[0]
+
+
+def _upsert_many(
+    model, key: str, rows: Dict[str, dict], touch: Optional[str]
+) -> Tuple[Dict[str, models.Model], Dict[str, List[str]]]:
+    now = timezone.now()
+    stored = model.objects.in_bulk(list(rows), field_name=key)
+    changes = {}
+
+    for value, fields in rows.items():
+        row = stored.get(value)
+        if row is None:
+            row = stored[value] = model(**{key: value}, **fields)
+            if touch:
+                setattr(row, touch, now)
+            row.save()
+            changes[value] = sorted(fields)
+            continue
+
+        changed = changed_fields(row, fields)
+        if not changed:
+            continue
+        for name in changed:
+            setattr(row, name, fields[name])
+        update_fields = changed + [touch] if touch else changed
+        if touch:
+            setattr(row, touch, now)
+        row.save(update_fields=update_fields)
+        changes[value] = changed
+
+    log_changes(model, changes, now)
+    return stored, changes
+
+
+def upsert(
+    model, key: str, value: str, fields: dict, touch: Optional[str] = None
+) -> Tuple[models.Model, List[str]]:
+    """Creates or updates one row, writing it only if its fields changed, see upsert_many
+
+    Args:
+        model (Type[Model]): model of the row
+        key (str): unique field the row is looked up by, e.g. vlr_id
+        value (str): value of the key
+        fields (dict): incoming value of each field keyed by attribute name
+        touch (str, optional): timestamp field set to now whenever the row is written. Defaults to None.
+
+    Returns:
+        Tuple[Model, List[str]]: the row as now stored and the names of the fields written, empty if it was unchanged
+    """
+    rows, changes = _upsert_many(model, key, {value: fields}, touch)
+    return rows[value], changes.get(value, [])
+
+
+def changes_since(last_id: int = 0, entities: Optional[Iterable[str]] = None, limit: int = 1000) -> List[ChangeLog]:
+    """Gets the changes logged after a given entry, for consumers that follow the log incrementally
+
+    Consumers keep the id of the last entry they processed and pass it back
+    on their next call.
+
+    Args:
+        last_id (int, optional): id of the last entry already processed. Defaults to 0, the start of the log.
+        entities (Iterable[str], optional): model names to keep, e.g. ["team", "player"]. Defaults to every model.
+        limit (int, optional): max number of entries returned. Defaults to 1000.
+
+    Returns:
+        List[ChangeLog]: the entries, oldest first
+    """
+    changes = ChangeLog.objects.filter(pk__gt=last_id)
+    if entities is not None:
+        changes = changes.filter(entity__in=list(entities))
+    return list(changes.order_by("pk")[:limit])
@@ -0,0 +1,180 @@
+from dataclasses import dataclass
+import logging
+import re
+from typing import Dict, Iterable, List, Optional
+
+from . import url_types
+from .async_client import AsyncVLRClient
+from .backends import HTML_PARSER
+from .fingerprint import FingerprintStore
+from .frontier import DONE, FAILED, PENDING, Frontier
+from .pipeline import UNCHANGED, Pipeline, PipelineStats
+from .url_types import normalize_url
+
+
+logger = logging.getLogger(__name__)
+
+
+def _matches_page_url(url: str, section: str) -> str:
+    # /team/2/sentinels -> /team/matches/2/sentinels
+    return re.sub(rf"/{section}/(\d+)", rf"/{section}/matches/\1", url, count=1)
+
+
+def discover_urls(kind: str, data, url: str) -> List[str]:
+    """Gets the URLs a parsed page links to that are worth crawling
+
+    Args:
+        kind (str): kind of the page, from url_types.classify_url
+        data: output of the page's parser
+        url (str): URL of the page
+
+    Returns:
+        List[str]: the linked URLs, unfiltered and possibly repeated
+    """
+    if kind in (url_types.HOMEPAGE, url_types.EVENT_MATCHES, url_types.TEAM_MATCHES):
+        return list(data)
+
+    if kind == url_types.EVENT:
+        return data["stages_url"] + [_matches_page_url(url, "event")]
+
+    if kind == url_types.MATCH:
+        urls = [data.event, data.team_1, data.team_2]
+        for map_data in data.maps:
+            urls += [line.player for line in map_data.team_1_stats]
+            urls += [line.player for line in map_data.team_2_stats]
+        return urls
+
+    if kind == url_types.TEAM:
+        return [player.url for player in data.players] + [
+            _matches_page_url(url, "team")
+        ]
+
+    if kind == url_types.PLAYER:
+        return [data.team]
+
+    return []
+
+
+@dataclass
+class CrawlStats:
+    pipeline: PipelineStats
+    resumed: bool
+    finished: bool
+    statuses: Dict[str, int]
+
+
+class Crawler:
+    """Crawls VLR outwards from a set of seed pages
+
+    The frontier decides which URL is fetched next, and every page that gets
+    through the pipeline queues the pages it links to. Only a window of URLs
+    is claimed from the frontier at a time, so higher priority pages that are
+    discovered later still jump ahead of the rest of the queue. Pages the
+    pipeline fetches as dependencies of others count as crawled, so no page
+    is fetched twice in a crawl.
+    """
+
+    def __init__(
+        self,
+        client: AsyncVLRClient,
+        frontier: Frontier,
+        workers: Optional[int] = None,
+        queue_size: int = 64,
+        parser: str = HTML_PARSER,
+        fingerprints: Optional[FingerprintStore] = None,
+    ):
+        """Initializes a new Crawler Object
+
+        Args:
+            client (AsyncVLRClient): Client to fetch pages with
+            frontier (Frontier): Frontier to take URLs from and queue discovered ones into
+            workers (int, optional): Number of parser processes. Defaults to the number of CPUs.
+            queue_size (int, optional): Max pages waiting between two pipeline stages, also the number of URLs claimed at a time. Defaults to 64.
+            parser (str, optional): Parser backend, one of backends.BACKENDS. Defaults to HTML_PARSER.
+            fingerprints (FingerprintStore, optional): Fingerprints of the pages as last ingested, unchanged pages are skipped. Defaults to None.
+        """
+        self.frontier = frontier
+        self.window = queue_size
+        self.pipeline = Pipeline(
+            client,
+            workers=workers,
+            queue_size=queue_size,
+            parser=parser,
+            on_parsed=self._discover,
+            on_finished=self._finished,
+            fingerprints=fingerprints,
+        )
+        self._depths: Dict[str, int] = {}
+        # Whether each dependency the pipeline fetched outside the frontier got through
+        self._dependencies: Dict[str, bool] = {}
+
+    def _claim(self) -> List[str]:
+        claimed = self.frontier.claim(self.window - len(self._depths))
+        self._depths.update(claimed)
+        return [url for url, _ in claimed]
+
+    def _queue(self, links: Iterable[str], depth: int):
+        self.frontier.add(links, depth)
+        # Pages the pipeline already fetched as dependencies are not fetched
+        # again when the crawl reaches them, their links are queued instead
+        for url in {normalize_url(link) for link in links if link} & self._dependencies.keys():
+            entry = self.frontier.entry(url)
+            if entry is not None and entry[0] == PENDING:
+                ok = self._dependencies.pop(url)
+                self.frontier.mark(url, DONE if ok else FAILED)
+                if ok:
+                    self._queue(self.frontier.links(url), entry[1] + 1)
+
+    async def _discover(self, url: str, kind: str, data):
+        # An unchanged page links to the same pages as last time, which may have changed
+        if data is UNCHANGED:
+            links = self.frontier.links(url)
+        else:
+            links = discover_urls(kind, data, url)
+            self.frontier.set_links(url, links)
+
+        depth = self._depths.get(url)
+        if depth is None:
+            # A dependency the pipeline fetched by itself, crawled from where
+            # the frontier already queued it
+            entry = self.frontier.entry(url)
+            if entry is not None and entry[0] == PENDING:
+                depth = entry[1]
+        if depth is not None:
+            self._queue(links, depth + 1)
+
+    def _finished(self, url: str, ok: bool):
+        if self._depths.pop(url, None) is not None:
+            self.frontier.mark(url, DONE if ok else FAILED)
+        else:
+            # A dependency is fetched at most once per crawl: if the frontier
+            # already queued it, it is done there, otherwise it is done once
+            # the crawl reaches it
+            entry = self.frontier.entry(url)
+            if entry is not None and entry[0] == PENDING:
+                self.frontier.mark(url, DONE if ok else FAILED)
+            else:
+                self._dependencies[url] = ok
+        for next_url in self._claim():
+            self.pipeline.submit(next_url)
+
+    async def run(self, seeds: Iterable[str]) -> CrawlStats:
+        """Crawls from the seeds, or resumes the last crawl if it did not finish
+
+        Args:
+            seeds (Iterable[str]): URLs to start crawling from
+
+        Returns:
+            CrawlStats: what the pipeline did, and how many URLs of the crawl ended in each status
+        """
+        resumed = self.frontier.start(seeds)
+        if resumed:
+            logger.info("Resuming crawl %d", self.frontier.crawl)
+
+        stats = await self.pipeline.run(self._claim())
+        return CrawlStats(
+            pipeline=stats,
+            resumed=resumed,
+            finished=self.frontier.finish(),
+            statuses=self.frontier.counts(),
+        )
@@ -0,0 +1,143 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional, Union
+
+
+# Markup that changes between fetches without the data on the page changing:
+# scripts, styles and comments hold ad slots, analytics and cache busters
+_MARKUP = [
+    re.compile(rb"<script\b.*?</script\s*>", re.IGNORECASE | re.DOTALL),
+    re.compile(rb"<style\b.*?</style\s*>", re.IGNORECASE | re.DOTALL),
+    re.compile(rb"<noscript\b.*?</noscript\s*>", re.IGNORECASE | re.DOTALL),
+    re.compile(rb"<iframe\b.*?</iframe\s*>", re.IGNORECASE | re.DOTALL),
+    re.compile(rb"<!--.*?-->", re.DOTALL),
+]
+
+# Opening tag of an ad container, e.g. <div id="wf-ad-1234">, <div class="... mod-ad ..."> or <ins class="adsbygoogle">
+_AD = re.compile(
+    rb"""<([a-z][a-z0-9]*)\b[^>]*\s(?:id|class)="[^"]*\b(?:(?:wf-)?ad(?:s|-[\w-]+)?|adsbygoogle)\b[^"]*"[^>]*>""",
+    re.IGNORECASE,
+)
+_VOID_ELEMENTS = {b"area", b"br", b"embed", b"hr", b"img", b"input", b"link", b"meta", b"source", b"wbr"}
+
+# Text that changes between fetches without the data on the page changing
+_VOLATILE = [
+    # countdowns and relative times, e.g. <div class="ml-eta">2h 10m</div>,
+    # <span class="match-header-vs-note mod-upcoming">2h 38m</span> or "5m ago"
+    re.compile(rb"""(class="[^"]*-eta\b[^"]*"[^>]*>)[^<]*""", re.IGNORECASE),
+    re.compile(rb">\s*(?:\d+[wdhms]\s*)+<", re.IGNORECASE),
+    re.compile(rb"(?:\d+\s*(?:[smhdwy]|mo|mins?|hours?|days?|weeks?|months?|years?)\s+)+ago\b", re.IGNORECASE),
+    # per-request tokens and asset versions
+    re.compile(rb"""(?:csrf|token|nonce)[\w-]*"?\s*(?:=|:|value=)\s*"[^"]*\"""", re.IGNORECASE),
+    re.compile(rb"\?v=[\w.]+"),
+    re.compile(rb"\s+"),
+]
+
+
+def _strip_ads(content: bytes) -> bytes:
+    """Removes every ad container along with everything inside it, which rotates between fetches"""
+    parts = []
+    position = 0
+    while True:
+        opening = _AD.search(content, position)
+        if opening is None:
+            break
+        parts.append(content[position : opening.start()])
+        tag = opening.group(1).lower()
+        end = opening.end()
+        if tag not in _VOID_ELEMENTS and not opening.group(0).endswith(b"/>"):
+            # The closing tag that balances the opening one, past any nested elements of the same tag
+            depth = 1
+            for match in re.finditer(rb"<(/?)" + re.escape(tag) + rb"\b[^>]*>", content[end:], re.IGNORECASE):
+                depth += -1 if match.group(1) else 1
+                if depth == 0:
+                    end += match.end()
+                    break
+        position = end
+    parts.append(content[position:])
+    return b" ".join(parts)
+
+
+def fingerprint(content: Union[bytes, str]) -> str:
+    """Gets a hash of a page that ignores the parts that change on every fetch
+
+    Args:
+        content (bytes | str): raw content of the page
+
+    Returns:
+        str: hex digest of the normalized page
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    for pattern in _MARKUP:
+        content = pattern.sub(b" ", content)
+    content = _strip_ads(content)
+    for pattern in _VOLATILE:
+        content = pattern.sub(b" ", content)
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class FingerprintStore:
+    """Fingerprint of every page as of the last time it was ingested, stored in a SQLite file
+
+    Can share a file with the crawl Frontier.
+    """
+
+    def __init__(self, path: str):
+        """Initializes a new FingerprintStore Object
+
+        Args:
+            path (str): SQLite file to keep the fingerprints in, created if missing
+        """
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                url TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+
+    def get(self, url: str) -> Optional[str]:
+        """Gets the fingerprint a page had when it was last ingested
+
+        Args:
+            url (str): URL of the page
+
+        Returns:
+            Optional[str]: the fingerprint, or None if the page was never ingested
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint FROM fingerprints WHERE url = ?", (url,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def store(self, url: str, value: str):
+        """Records the fingerprint of a page that was just ingested
+
+        Args:
+            url (str): URL of the page
+            value (str): its fingerprint
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO fingerprints (url, fingerprint, updated) VALUES (?, ?, ?)",
+                (url, value, time.time()),
+            )
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
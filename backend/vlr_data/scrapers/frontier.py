@@ -0,0 +1,270 @@
+from dataclasses import dataclass, field
+import json
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import url_types
+from .url_types import classify_url, normalize_url
+
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+# Lower is crawled first. Events, teams and players come before matches so
+# the rows a match refers to are usually ingested by the time it is.
+DEFAULT_PRIORITIES = {
+    url_types.HOMEPAGE: 0,
+    url_types.EVENT: 1,
+    url_types.EVENT_MATCHES: 2,
+    url_types.TEAM: 3,
+    url_types.PLAYER: 4,
+    url_types.TEAM_MATCHES: 5,
+    url_types.MATCH: 6,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawls (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    crawl INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS frontier_queue ON frontier (crawl, status, priority, depth);
+CREATE TABLE IF NOT EXISTS links (
+    url TEXT PRIMARY KEY,
+    links TEXT NOT NULL
+);
+"""
+
+
+@dataclass
+class CrawlPolicy:
+    """Which discovered URLs get crawled, and in what order
+
+    Attributes:
+        priorities (Dict[str, int]): Priority of each kind of page, lower is crawled first. Kinds missing from it are never crawled.
+        max_depth (int): Max number of links between a seed and a crawled page
+    """
+
+    priorities: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_PRIORITIES))
+    max_depth: int = 3
+
+
+class Frontier:
+    """Persistent queue of the URLs to crawl, stored in a SQLite file
+
+    Every URL has one row holding the last crawl it was queued in and where it
+    is up to in that crawl, so a URL is fetched at most once per crawl and a
+    crawl that stopped half way can be resumed from the file.
+    """
+
+    def __init__(self, path: str, policy: Optional[CrawlPolicy] = None):
+        """Initializes a new Frontier Object
+
+        Args:
+            path (str): SQLite file to keep the frontier in, created if missing
+            policy (CrawlPolicy, optional): Which URLs get queued and in what order. Defaults to CrawlPolicy().
+        """
+        self.policy = policy or CrawlPolicy()
+        self.crawl: Optional[int] = None
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def start(self, seeds: Iterable[str]) -> bool:
+        """Resumes the last crawl if it did not finish, otherwise starts a new one
+
+        Args:
+            seeds (Iterable[str]): URLs to start crawling from, queued at depth 0
+
+        Returns:
+            bool: whether an unfinished crawl was resumed
+        """
+        row = self._db.execute(
+            "SELECT id, finished FROM crawls ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        resumed = row is not None and row[1] is None
+
+        with self._db:
+            if resumed:
+                self.crawl = row[0]
+                # Pages that were in flight when the crawl stopped are fetched again
+                self._db.execute(
+                    "UPDATE frontier SET status = ? WHERE crawl = ? AND status = ?",
+                    (PENDING, self.crawl, IN_PROGRESS),
+                )
+            else:
+                self.crawl = self._db.execute(
+                    "INSERT INTO crawls (started) VALUES (?)", (time.time(),)
+                ).lastrowid
+        self.add(seeds, 0)
+        return resumed
+
+    def add(self, urls: Iterable[str], depth: int) -> int:
+        """Queues the URLs that the policy allows and this crawl has not seen yet
+
+        Args:
+            urls (Iterable[str]): discovered URLs
+            depth (int): number of links between a seed and these URLs
+
+        Returns:
+            int: how many URLs were queued
+        """
+        if depth > self.policy.max_depth:
+            return 0
+
+        now = time.time()
+        rows = []
+        for url in urls:
+            if not url:
+                continue
+            url = normalize_url(url)
+            kind = classify_url(url)
+            priority = self.policy.priorities.get(kind)
+            if priority is not None:
+                rows.append((url, kind, priority, depth, self.crawl, PENDING, now))
+
+        with self._db:
+            cursor = self._db.executemany(
+                """
+                INSERT INTO frontier (url, kind, priority, depth, crawl, status, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    priority = excluded.priority,
+                    depth = excluded.depth,
+                    crawl = excluded.crawl,
+                    status = excluded.status,
+                    updated = excluded.updated
+                WHERE frontier.crawl < excluded.crawl
+                """,
+                rows,
+            )
+        return cursor.rowcount
+
+    def claim(self, limit: int) -> List[Tuple[str, int]]:
+        """Takes the highest priority pending URLs and marks them in progress
+
+        Args:
+            limit (int): max number of URLs to take
+
+        Returns:
+            List[Tuple[str, int]]: each URL with its depth
+        """
+        if limit <= 0:
+            return []
+
+        with self._db:
+            rows = self._db.execute(
+                """
+                SELECT url, depth FROM frontier
+                WHERE crawl = ? AND status = ?
+                ORDER BY priority, depth
+                LIMIT ?
+                """,
+                (self.crawl, PENDING, limit),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE frontier SET status = ?, updated = ? WHERE url = ?",
+                [(IN_PROGRESS, time.time(), url) for url, _ in rows],
+            )
+        return rows
+
+    def mark(self, url: str, status: str):
+        """Records how a claimed URL ended up
+
+        Args:
+            url (str): URL from claim
+            status (str): DONE or FAILED
+        """
+        with self._db:
+            self._db.execute(
+                "UPDATE frontier SET status = ?, updated = ? WHERE url = ?",
+                (status, time.time(), url),
+            )
+
+    def entry(self, url: str) -> Optional[Tuple[str, int]]:
+        """Gets where a URL is up to in this crawl
+
+        Args:
+            url (str): URL to look up
+
+        Returns:
+            Optional[Tuple[str, int]]: the URL's status and depth, or None if this crawl has not queued it
+        """
+        return self._db.execute(
+            "SELECT status, depth FROM frontier WHERE url = ? AND crawl = ?",
+            (normalize_url(url), self.crawl),
+        ).fetchone()
+
+    def set_links(self, url: str, links: List[str]):
+        """Remembers the URLs a page links to, for when it is next skipped as unchanged
+
+        Args:
+            url (str): URL of the page
+            links (List[str]): the URLs it links to
+        """
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO links (url, links) VALUES (?, ?)",
+                (url, json.dumps([link for link in links if link])),
+            )
+
+    def links(self, url: str) -> List[str]:
+        """Gets the URLs a page linked to when it was last parsed
+
+        Args:
+            url (str): URL of the page
+
+        Returns:
+            List[str]: the URLs it links to, empty if it was never parsed
+        """
+        row = self._db.execute("SELECT links FROM links WHERE url = ?", (url,)).fetchone()
+        return [] if row is None else json.loads(row[0])
+
+    def counts(self) -> Dict[str, int]:
+        """Gets how many URLs of this crawl are in each status
+
+        Returns:
+            Dict[str, int]: number of URLs keyed by status
+        """
+        return dict(
+            self._db.execute(
+                "SELECT status, COUNT(*) FROM frontier WHERE crawl = ? GROUP BY status",
+                (self.crawl,),
+            )
+        )
+
+    def finish(self) -> bool:
+        """Marks this crawl finished if nothing is left to fetch
+
+        Returns:
+            bool: whether the crawl is finished
+        """
+        counts = self.counts()
+        if counts.get(PENDING) or counts.get(IN_PROGRESS):
+            return False
+        with self._db:
+            self._db.execute(
+                "UPDATE crawls SET finished = ? WHERE id = ?", (time.time(), self.crawl)
+            )
+        return True
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+import threading
+from typing import Dict, Iterable, Optional
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from ..models import Event, Player, Team
+
+
+# Field each model is looked up by while ingesting
+LOOKUP_FIELDS = {
+    Team: "vlr_id",
+    Player: "vlr_id",
+    Event: "vlr_url",
+}
+
+
+class IdentityMap:
+    """Bounded LRU map from the VLR ID (or URL) of a Team, Player or Event to its primary key
+
+    Ingest looks up the same popular teams and players over and over during
+    a crawl; this answers those lookups from memory. Entries are kept up to
+    date from the post_save and post_delete signals of the models, so writes
+    that bypass signals (QuerySet.update, QuerySet.delete, bulk_create) must
+    be followed by clear(). Rows read or saved inside a transaction are only
+    added once it commits, so a rollback never leaves the primary key of a
+    row that no longer exists behind.
+    """
+
+    def __init__(self, max_size: int = 100_000):
+        """Initializes a new IdentityMap Object
+
+        Args:
+            max_size (int, optional): Max number of entries kept across all models. Defaults to 100_000.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, int]" = OrderedDict()
+        self._keys: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _put(self, model, value: str, pk: int):
+        key = (model, value)
+        with self._lock:
+            old_key = self._keys.get((model, pk))
+            if old_key is not None and old_key != key:
+                self._entries.pop(old_key, None)
+            self._entries[key] = pk
+            self._entries.move_to_end(key)
+            self._keys[(model, pk)] = key
+            while len(self._entries) > self.max_size:
+                (old_model, _), old_pk = self._entries.popitem(last=False)
+                self._keys.pop((old_model, old_pk), None)
+
+    def _put_many(self, model, rows: Dict[str, int]):
+        for value, pk in rows.items():
+            self._put(model, value, pk)
+
+    def _put_on_commit(self, model, rows: Dict[str, int]):
+        # Rows read in a transaction may have been inserted by it, so they are
+        # only cached once it commits; right away outside of a transaction
+        transaction.on_commit(lambda: self._put_many(model, rows))
+
+    def get_many(self, model, values: Iterable[str]) -> Dict[str, int]:
+        """Gets the primary keys of rows from their lookup field, querying the database once for any not in the map
+
+        Args:
+            model (Type[Model]): Team, Player or Event
+            values (Iterable[str]): values of the model's lookup field, see LOOKUP_FIELDS
+
+        Returns:
+            Dict[str, int]: primary key keyed by value, missing the values with no row
+        """
+        pks = {}
+        missing = []
+        with self._lock:
+            for value in set(values):
+                pk = self._entries.get((model, value))
+                if pk is None:
+                    missing.append(value)
+                else:
+                    self._entries.move_to_end((model, value))
+                    pks[value] = pk
+            self.hits += len(pks)
+            self.misses += len(missing)
+
+        if missing:
+            field = LOOKUP_FIELDS[model]
+            rows = dict(model.objects.filter(**{f"{field}__in": missing}).values_list(field, "pk"))
+            self._put_on_commit(model, rows)
+            pks.update(rows)
+        return pks
+
+    def get(self, model, value: str) -> Optional[int]:
+        """Gets the primary key of a row from its lookup field
+
+        Args:
+            model (Type[Model]): Team, Player or Event
+            value (str): value of the model's lookup field, see LOOKUP_FIELDS
+
+        Returns:
+            Optional[int]: the primary key, or None if there is no such row
+        """
+        return self.get_many(model, [value]).get(value)
+
+    def warm(self, models: Iterable = tuple(LOOKUP_FIELDS)) -> int:
+        """Loads the rows of the models into the map in one query per model, up to max_size
+
+        Args:
+            models (Iterable[Type[Model]], optional): models to load. Defaults to every model in LOOKUP_FIELDS.
+
+        Returns:
+            int: number of entries loaded
+        """
+        loaded = 0
+        for model in models:
+            rows = dict(model.objects.values_list(LOOKUP_FIELDS[model], "pk")[: self.max_size - loaded])
+            self._put_on_commit(model, rows)
+            loaded += len(rows)
+        return loaded
+
+    def remember(self, instance):
+        """Adds a saved row to the map once the transaction it was saved in commits
+
+        Args:
+            instance (Model): a saved Team, Player or Event
+        """
+        model = type(instance)
+        value = getattr(instance, LOOKUP_FIELDS[model])
+        transaction.on_commit(lambda: self._put(model, value, instance.pk))
+
+    def forget(self, instance):
+        """Removes a row from the map
+
+        Args:
+            instance (Model): a Team, Player or Event
+        """
+        model = type(instance)
+        with self._lock:
+            key = self._keys.pop((model, instance.pk), None)
+            if key is not None:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+
+identity_map = IdentityMap()
+
+
+def _saved(sender, instance, **kwargs):
+    identity_map.remember(instance)
+
+
+def _deleted(sender, instance, **kwargs):
+    identity_map.forget(instance)
+
+
+for _model in LOOKUP_FIELDS:
+    post_save.connect(_saved, sender=_model, dispatch_uid=f"identity_map_save_{_model.__name__}")
+    post_delete.connect(_deleted, sender=_model, dispatch_uid=f"identity_map_delete_{_model.__name__}")
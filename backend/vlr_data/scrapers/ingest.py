@@ -1,7 +1,23 @@
-from django.utils import timezone
+from django.db import transaction
 import re
+from typing import Dict, List
 
 from ..models import Event, Map, Match, Player, PlayerStats, Team
+from . import url_types
+from .aggregates import schedule_team_summaries, update_player_aggregates
+from .bulk import bulk_upsert
+from .changes import changed_fields, log_changes, upsert, upsert_many
+from .identity import identity_map
+from .lookups import agents, map_names
+from .records import MapRecord, MatchRecord, PlayerRecord, TeamRecord
+
+
+class MissingDependencies(ValueError):
+    """Raised when a page refers to an event, team or player that is not yet in the database"""
+
+    def __init__(self, message: str, urls: List[str]):
+        super().__init__(message)
+        self.urls = urls
 
 
 def get_team_id_from_url(url: str) -> str:
@@ -58,86 +74,75 @@ def get_player_id_from_url(url: str) -> str:
     return match.group(1)
 
 
-def ingest_team(team_data: dict, team_url: str):
+def ingest_team(team_data: TeamRecord, team_url: str):
     """Ingests the team data and stores it in the database
 
     Args:
-        team_data (dict): Parsed data about the team, should include keys:
-                            - "team_name": str - full name of the team
-                            - "team_tag": str - shortened name for the team
-                            - "team_logo_url": str - URL for the team logo
-                            - "team_rating": int - VLR team rating
-                            - "player": List[dict] - List of active player info with keys:
-                                - "real_name": str - player's real name
-                                - "ign": str - player's in game name
+        team_data (TeamRecord): Parsed data about the team, with each active player's url set
         team_url (str): URL for the team's VLR page
     """
-    try:
-        team_id = get_team_id_from_url(team_url)
-
-        team, _ = Team.objects.update_or_create(
-            vlr_id=team_id,
-            defaults={
-                "name": team_data["team_name"],
-                "team_tag": team_data["team_tag"],
-                "team_logo_url": team_data["team_logo_url"],
-                "team_rating": team_data["team_rating"],
-                "last_updated": timezone.now(),
-            },
-        )
-
-        for player in team_data["players"]:
-            player_id = get_player_id_from_url(player["url"])
-
-            player, _ = Player.objects.update_or_create(
-                vlr_id=player_id,
-                defaults={
-                    "real_name": player["real_name"],
-                    "ign": player["ign"],
-                    "team": team,
-                    "last_updated": timezone.now(),
-                },
-            )
-
-    except Exception as e:
-        print(f"Error while ingesting team data: {e}")
-
-
-def ingest_player(player_data: dict, player_url: str):
+    team_id = get_team_id_from_url(team_url)
+
+    team, _ = upsert(
+        Team,
+        "vlr_id",
+        team_id,
+        {
+            "name": team_data.team_name,
+            "team_tag": team_data.team_tag,
+            "team_logo_url": team_data.team_logo_url,
+            "team_rating": team_data.team_rating,
+        },
+        touch="last_updated",
+    )
+
+    upsert_many(
+        Player,
+        "vlr_id",
+        {
+            get_player_id_from_url(player.url): {
+                "real_name": player.real_name,
+                "ign": player.ign,
+                "team_id": team.pk,
+            }
+            for player in team_data.players
+        },
+        touch="last_updated",
+    )
+
+
+def ingest_player(player_data: PlayerRecord, player_url: str):
     """Ingests the player data and stores it in the database
 
     Args:
-        player_data (dict): Parsed data about the player, should include keys:
-                            - "real_name": str - player's real name
-                            - "ign": str - player's in game name
-                            - "team": str - URL of the VLR page of the team the player belongs to
+        player_data (PlayerRecord): Parsed data about the player, with the URL of the team they belong to
         player_url (str): URL for the player's VLR page
 
     Raises:
-        ValueError: If the team specified in the player data does not yet exist in the database
+        MissingDependencies: If the team specified in the player data does not yet exist in the database
     """
 
-    try:
-        player_id = get_player_id_from_url(player_url)
-        team_id = get_team_id_from_url(player_data["team"])
+    player_id = get_player_id_from_url(player_url)
+    team_id = get_team_id_from_url(player_data.team)
 
-        team = Team.objects.get(vlr_id=team_id)
-
-        _, _ = Player.objects.update_or_create(
-            vlr_id=player_id,
-            defaults={
-                "real_name": player_data["real_name"],
-                "ign": player_data["ign"],
-                "team": team,
-                "last_updated": timezone.now(),
-            },
-        )
-    except Team.DoesNotExist:
-        raise ValueError(
-            f"Team with ID {team_id} must be created before ingesting players in the team."
+    team_pk = identity_map.get(Team, team_id)
+    if team_pk is None:
+        raise MissingDependencies(
+            f"Team with ID {team_id} must be created before ingesting players in the team.",
+            [player_data.team],
         )
-    except Exception as e:
-        print(f"Error while ingesting player data: {e}")
+
+    _, _ = upsert(
+        Player,
+        "vlr_id",
+        player_id,
+        {
+            "real_name": player_data.real_name,
+            "ign": player_data.ign,
+            "team_id": team_pk,
+        },
+        touch="last_updated",
+    )
 
 
 def ingest_event(event_data: dict):
@@ -149,163 +154,232 @@ def ingest_event(event_data: dict):
                             - "stages": List[str]         # names of the stages in the event
                             - "stages_url": List[str]     # URL of the stages in the event
     """
-    try:
-        for i, stage_url in enumerate(event_data["stages_url"]):
-            _, _ = Event.objects.update_or_create(
-                vlr_url=stage_url,
-                defaults={
-                    "name": event_data["name"],
-                    "series": event_data["stages"][i],
-                },
+    upsert_many(
+        Event,
+        "vlr_url",
+        {
+            stage_url: {
+                "name": event_data["name"],
+                "series": event_data["stages"][i],
+            }
+            for i, stage_url in enumerate(event_data["stages_url"])
+        },
+    )
+
+
+def _ingest_maps(match: Match, maps: List[MapRecord], players: Dict[str, int]) -> bool:
+    """Upserts the maps of a finished match and every player's stats on them
+
+    The stored maps and stats are read in one query each and compared with
+    the incoming ones, then only the rows that changed are written, in one
+    bulk upsert per model (see bulk.bulk_upsert). Changes are appended to the ChangeLog, with stats
+    logged as "<game ID>/<player VLR ID>", and applied to the player
+    aggregate tables.
+
+    Args:
+        match (Match): the match the maps were played in
+        maps (List[MapRecord]): the maps, in the order they were played
+        players (Dict[str, int]): primary key of every player in the stats, keyed by VLR ID
+
+    Returns:
+        bool: whether any map was added or changed
+    """
+    map_ids = map_names.get_many(map_data.map_played for map_data in maps)
+    agent_ids = agents.get_many(
+        line.agent_played
+        for map_data in maps
+        for line in map_data.team_1_stats + map_data.team_2_stats
+    )
+    map_values = {
+        map_data.game_id: {
+            "match_id": match.pk,
+            "name_id": map_ids[map_data.map_played],
+            "map_number": i + 1,
+            "team1_score": map_data.team_1_score,
+            "team2_score": map_data.team_2_score,
+        }
+        for i, map_data in enumerate(maps)
+    }
+    stored_maps = Map.objects.in_bulk(list(map_values), field_name="game_id")
+    map_changes = {
+        game_id: changed_fields(stored_maps[game_id], values)
+        if game_id in stored_maps
+        else sorted(values)
+        for game_id, values in map_values.items()
+    }
+    map_pks = {game_id: row.pk for game_id, row in stored_maps.items()}
+
+    changed_maps = [game_id for game_id, fields in map_changes.items() if fields]
+    if changed_maps:
+        map_rows = bulk_upsert(
+            Map,
+            [Map(game_id=game_id, **map_values[game_id]) for game_id in changed_maps],
+            unique_fields=["game_id"],
+            update_fields=["match", "name", "map_number", "team1_score", "team2_score"],
+        )
+        map_pks.update((row.game_id, row.pk) for row in map_rows if row.pk is not None)
+        # Backends that cannot return the ids of upserted rows leave them unset
+        if len(map_pks) < len(map_values):
+            map_pks.update(
+                Map.objects.filter(game_id__in=changed_maps).values_list("game_id", "pk")
             )
-    except Exception as e:
-        print(f"Error while ingesting event data: {e}")
+        log_changes(Map, map_changes)
+
+    stats_values = {}
+    for map_data in maps:
+        for line in map_data.team_1_stats + map_data.team_2_stats:
+            player_id = get_player_id_from_url(line.player)
+            stats_values[(map_data.game_id, player_id)] = {
+                "kills": line.kills,
+                "deaths": line.deaths,
+                "assists": line.assists,
+                "acs": line.acs,
+                "agent_id": agent_ids[line.agent_played],
+            }
+    stored_stats = {
+        (row.map_id, row.player_id): row
+        for row in PlayerStats.objects.filter(map_id__in=map_pks.values())
+    }
+    stats_changes = {}
+    changed_stats = []
+    # Stats rows whose values or map name changed, removed with their old values and added with their new ones
+    aggregate_changes = []
+    for (game_id, player_id), values in stats_values.items():
+        row = stored_stats.get((map_pks[game_id], players[player_id]))
+        changed = sorted(values) if row is None else changed_fields(row, values)
+        stats_changes[f"{game_id}/{player_id}"] = changed
+
+        new_row = PlayerStats(map_id=map_pks[game_id], player_id=players[player_id], **values)
+        if changed:
+            changed_stats.append(new_row)
+        map_name = map_values[game_id]["name_id"]
+        if row is not None:
+            old_map_name = stored_maps[game_id].name_id
+            if not changed and old_map_name == map_name:
+                continue
+            aggregate_changes.append((row, map_names.name(old_map_name), -1))
+        aggregate_changes.append((new_row, map_names.name(map_name), 1))
+
+    if changed_stats:
+        bulk_upsert(
+            PlayerStats,
+            changed_stats,
+            unique_fields=["player", "map"],
+            update_fields=["kills", "deaths", "assists", "acs", "agent"],
+        )
+        log_changes(PlayerStats, stats_changes)
+    update_player_aggregates(aggregate_changes)
+    return bool(changed_maps)
 
 
-def ingest_match(match_data: dict, match_url: str):
+def ingest_match(match_data: MatchRecord, match_url: str):
     """Ingests the match data and stores it in the database
 
+    Everything is written in one transaction, so a match is never left
+    without some of its maps or stats. If a finished match changed, its
+    teams' summaries and head to head are refreshed once it commits.
+
     Args:
-        match_data (dict): Parsed data about the match, should include keys:
-                        If the match is not finished:
-                            - "event": str,               # URL of the event's VLR page
-                            - "date": datetime,           # Match start time in UTC
-                            - "team_1": str,              # URL of the first team's VLR page
-                            - "team_2": str,              # URL of the second team's VLR page
-                            - "finished": bool,           # whether the match is finished
-                        If the match is finished:
-                            - "event": str,               # URL of the event's VLR page
-                            - "date": datetime,           # Match start time in UTC
-                            - "team_1": str,              # URL of the first team's VLR page
-                            - "team_2": str,              # URL of the second team's VLR page
-                            - "finished": bool,           # whether the match is finished
-                            - "team_1_match_score": int,  # maps won by the first team
-                            - "team_2_match_score": int,  # maps won by the second team
-                            - "maps_played": int,         # number of maps played
-                            - "maps": List[dict]          # stats for each map
-                        Where each maps dict should contain the keys:
-                            - "team_1_score": int,        # rounds won in this map by the first team
-                            - "team_2_score": int,        # rounds won in this map by the second team
-                            - "map_played": str,          # which map was played
-                            - "game_id": str,             # VLR game id for this map
-                            - "team_1_stats": List[dict]  # the stats for the first team (5 players)
-                            - "team_2_stats": List[dict]  # the stats for the the second team (5 players)
-                        Where each team_x_stats dict should contain the keys:
-                            - "player": str,              # URL of the player's VLR page
-                            - "kills": int,               # number of kills the player got
-                            - "deaths": int,              # number of times the player died
-                            - "assists": int,             # number of assists the player got
-                            - "agent_played": str,        # the agent the player played
-                            - "acs": int,                 # player's acs for this map
+        match_data (MatchRecord): Parsed data about the match, with the maps and their stats if it is finished
         match_url (str): URL for the match's VLR page
 
     Raises:
-        ValueError: If the event the match is part of does not yet exist in the database
-        ValueError: If the teams who are playing in the match does not yet exist in the database
-        ValueError: If the player whose stats is trying to be created does not yet exist in the database
+        MissingDependencies: If the event, either team or any player in the match does not yet exist in the database. Lists the URLs of all of them.
     """
-    try:
-        event_url = match_data["event"]
-        event = Event.objects.get(vlr_url=event_url)
-
-        team_1_id = get_team_id_from_url(match_data["team_1"])
-        team_2_id = get_team_id_from_url(match_data["team_2"])
-
-        team_1 = Team.objects.get(vlr_id=team_1_id)
-        team_2 = Team.objects.get(vlr_id=team_2_id)
-
-        date_played = match_data["date"]
-        match_id = get_match_id_from_url(match_url)
-
-        is_finished = match_data["finished"]
-        if not is_finished:
-            _, _ = Match.objects.update_or_create(
-                vlr_id=match_id,
-                defaults={
-                    "event": event,
-                    "team1": team_1,
-                    "team2": team_2,
-                    "date_played": date_played,
-                    "is_finished": is_finished,
-                    "team1_score": 0,
-                    "team2_score": 0,
-                },
-            )
-            return
-
-        team_1_score = match_data["team_1_match_score"]
-        team_2_score = match_data["team_2_match_score"]
-
-        match, _ = Match.objects.update_or_create(
-            vlr_id=match_id,
-            defaults={
-                "event": event,
-                "team1": team_1,
-                "team2": team_2,
-                "date_played": date_played,
-                "is_finished": is_finished,
-                "team1_score": team_1_score,
-                "team2_score": team_2_score,
+    event_url = match_data.event
+    team_urls = {
+        get_team_id_from_url(match_data.team_1): match_data.team_1,
+        get_team_id_from_url(match_data.team_2): match_data.team_2,
+    }
+    player_urls = {}
+    if match_data.finished:
+        for map_data in match_data.maps:
+            for line in map_data.team_1_stats + map_data.team_2_stats:
+                player_urls[get_player_id_from_url(line.player)] = line.player
+    match_id = get_match_id_from_url(match_url)
+
+    event_pk = identity_map.get(Event, event_url)
+    teams = identity_map.get_many(Team, team_urls)
+    players = identity_map.get_many(Player, player_urls)
+
+    missing = []
+    messages = []
+    if event_pk is None:
+        missing.append(event_url)
+        messages.append(
+            f'Event with URL: "{event_url}" must be created before ingesting matches in the event.'
+        )
+    missing_teams = [vlr_id for vlr_id in team_urls if vlr_id not in teams]
+    if missing_teams:
+        missing += [team_urls[vlr_id] for vlr_id in missing_teams]
+        messages.append(
+            f"Team with IDs: {', '.join(missing_teams)} must be created before ingesting teams in this match."
+        )
+    missing_players = [vlr_id for vlr_id in player_urls if vlr_id not in players]
+    if missing_players:
+        missing += [player_urls[vlr_id] for vlr_id in missing_players]
+        messages.append(
+            f"Players with IDs: {', '.join(missing_players)} must be created before ingesting players' stats in this match."
+        )
+    if missing:
+        raise MissingDependencies(" ".join(messages), missing)
+
+    with transaction.atomic():
+        match, match_changes = upsert(
+            Match,
+            "vlr_id",
+            match_id,
+            {
+                "event_id": event_pk,
+                "team1_id": teams[get_team_id_from_url(match_data.team_1)],
+                "team2_id": teams[get_team_id_from_url(match_data.team_2)],
+                "date_played": match_data.date,
+                "is_finished": match_data.finished,
+                "team1_score": match_data.team_1_match_score,
+                "team2_score": match_data.team_2_match_score,
             },
         )
-        
-        maps = match_data["maps"]
-        for i in range(match_data["maps_played"]):
-            map_data = maps[i]
-            team1_map_score = map_data["team_1_score"]
-            team2_map_score = map_data["team_2_score"]
-            map_played = map_data["map_played"]
-            game_id = map_data["game_id"]
-            map, _ = Map.objects.update_or_create(
-                game_id=game_id,
-                defaults={
-                    "match": match,
-                    "name": map_played,
-                    "map_number": i + 1,
-                    "team1_score": team1_map_score,
-                    "team2_score": team2_map_score,
-                },
-            )
 
-            team_1_stats = map_data["team_1_stats"]
-            team_2_stats = map_data["team_2_stats"]
-
-            for player_stat in team_1_stats + team_2_stats:
-                player_id = get_player_id_from_url(player_stat["player"])
-                kills = player_stat["kills"]
-                deaths = player_stat["deaths"]
-                assists = player_stat["assists"]
-                acs = player_stat["acs"]
-                agent_played = player_stat["agent_played"]
-
-                player = Player.objects.get(vlr_id=player_id)
-
-                _, _ = PlayerStats.objects.get_or_create(
-                    player=player,
-                    map=map,
-                    defaults={
-                        "kills": kills,
-                        "deaths": deaths,
-                        "assists": assists,
-                        "acs": acs,
-                        "agent": agent_played,
-                    },
-                )
-
-    except Event.DoesNotExist:
-        raise ValueError(
-            f'Event with URL: "{event_url}" must be created before ingesting matches in the event.'
-        )
+        maps_changed = False
+        if match_data.finished and match_data.maps:
+            maps_changed = _ingest_maps(match, match_data.maps, players)
+        if match_data.finished and (match_changes or maps_changed):
+            schedule_team_summaries(match.team1_id, match.team2_id)
 
-    except Team.DoesNotExist:
-        raise ValueError(
-            f"Team with IDs: {team_1_id}, {team_2_id} must be created before ingesting teams in this match."
-        )
 
-    except Player.DoesNotExist:
-        raise ValueError(
-            f"Players must be created before ingesting players' stats in this match."
-        )
+# Order pages must be ingested in for their dependencies to exist: players
+# need their team and matches need their event, teams and players.
+INGEST_ORDER = [
+    url_types.EVENT,
+    url_types.TEAM,
+    url_types.PLAYER,
+    url_types.MATCH,
+]
+
+
+def ingest_page(kind: str, data, url: str) -> bool:
+    """Ingests a parsed page with the ingest function for its kind
+
+    Args:
+        kind (str): kind of the page, from url_types.classify_url
+        data: output of the page's parser
+        url (str): URL of the page
+
+    Returns:
+        bool: whether the kind of page has anything to ingest
 
-    except Exception as e:
-        print(f"Error while ingesting match data: {e}")
+    Raises:
+        MissingDependencies: if the page refers to rows not in the database yet
+        Exception: any other error while ingesting, so the caller's transaction rolls the page back
+    """
+    if kind == url_types.EVENT:
+        ingest_event(data)
+    elif kind == url_types.TEAM:
+        ingest_team(data, url)
+    elif kind == url_types.PLAYER:
+        ingest_player(data, url)
+    elif kind == url_types.MATCH:
+        ingest_match(data, url)
+    else:
+        return False
+    return True
@@ -0,0 +1,85 @@
+import threading
+from typing import Dict, Iterable
+
+from django.db import transaction
+
+from ..models import Agent, MapName
+
+
+class LookupCache:
+    """In-process map between the names and ids of a small lookup table (Agent or MapName)
+
+    Lookup tables hold a few dozen rows and only grow when a new agent or map
+    is released, so the whole table is loaded on the first miss and names
+    not in it yet are inserted. Entries are only cached once the transaction
+    that read or inserted them commits, so a rolled back insert never leaves
+    a dangling id behind.
+    """
+
+    def __init__(self, model):
+        """Initializes a new LookupCache Object
+
+        Args:
+            model (Type[Model]): Agent or MapName
+        """
+        self.model = model
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _fill(self, rows: Dict[str, int]):
+        with self._lock:
+            self._ids.update(rows)
+            self._names.update((pk, name) for name, pk in rows.items())
+
+    def _load(self, names: Iterable[str] = ()) -> Dict[str, int]:
+        rows = dict(self.model.objects.values_list("name", "pk"))
+        new = set(names) - rows.keys()
+        if new:
+            self.model.objects.bulk_create(
+                [self.model(name=name) for name in new], ignore_conflicts=True
+            )
+            rows.update(self.model.objects.filter(name__in=new).values_list("name", "pk"))
+        transaction.on_commit(lambda: self._fill(rows))
+        return rows
+
+    def get_many(self, names: Iterable[str]) -> Dict[str, int]:
+        """Gets the ids of names, inserting the ones not in the table yet
+
+        Args:
+            names (Iterable[str]): agent or map names
+
+        Returns:
+            Dict[str, int]: id of every name, keyed by name
+        """
+        names = set(names)
+        with self._lock:
+            ids = {name: self._ids[name] for name in names if name in self._ids}
+        if len(ids) < len(names):
+            rows = self._load(names - ids.keys())
+            ids.update((name, rows[name]) for name in names - ids.keys())
+        return ids
+
+    def name(self, pk: int) -> str:
+        """Gets a name from its id
+
+        Args:
+            pk (int): id of the row
+
+        Returns:
+            str: the name
+        """
+        with self._lock:
+            name = self._names.get(pk)
+        if name is None:
+            name = {pk: name for name, pk in self._load().items()}[pk]
+        return name
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+
+
+agents = LookupCache(Agent)
+map_names = LookupCache(MapName)
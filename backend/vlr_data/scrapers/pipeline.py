@@ -0,0 +1,328 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import close_old_connections
+
+from .async_client import AsyncVLRClient
+from .backends import HTML_PARSER, parse_html
+from .fingerprint import FingerprintStore, fingerprint
+from .identity import identity_map
+from .ingest import MissingDependencies
+from .stats_table import PAGE_STRAINERS
+from .url_types import classify_url, normalize_url
+from .vlr_scraper import PAGE_PARSERS
+from .writer import IngestWriter
+
+
+logger = logging.getLogger(__name__)
+
+# Passed to on_parsed in place of the data of a page that has not changed since it was last ingested
+UNCHANGED = object()
+
+
+def parse_page(url: str, content: bytes, backend: str = HTML_PARSER) -> Tuple[str, object]:
+    """Parses a fetched page with the parser for its kind
+
+    Runs in the pipeline's worker processes, so it takes raw bytes and
+    returns plain data rather than soups, which cannot be pickled.
+
+    Args:
+        url (str): URL the page was fetched from
+        content (bytes): raw content of the page
+        backend (str, optional): parser backend, one of backends.BACKENDS. Defaults to HTML_PARSER.
+
+    Returns:
+        Tuple[str, object]: the kind of the page and its parsed data, or None if the kind has no parser
+    """
+    kind = classify_url(url)
+    parser = PAGE_PARSERS.get(kind)
+    if parser is None:
+        return kind, None
+    return kind, parser(parse_html(content, backend, PAGE_STRAINERS.get(kind)))
+
+
+def parse_changed_page(
+    url: str, content: bytes, backend: str = HTML_PARSER, previous: Optional[str] = None
+) -> Tuple[str, str, object]:
+    """Parses a fetched page unless its fingerprint matches the previous one
+
+    Args:
+        url (str): URL the page was fetched from
+        content (bytes): raw content of the page
+        backend (str, optional): parser backend, one of backends.BACKENDS. Defaults to HTML_PARSER.
+        previous (str, optional): fingerprint of the page when it was last ingested. Defaults to None.
+
+    Returns:
+        Tuple[str, str, object]: the kind of the page, its fingerprint and its parsed data, or None if it is unchanged or has no parser
+    """
+    value = fingerprint(content)
+    if value == previous:
+        return classify_url(url), value, None
+    kind, data = parse_page(url, content, backend)
+    return kind, value, data
+
+
+@dataclass
+class PipelineStats:
+    fetched: int = 0
+    parsed: int = 0
+    ingested: int = 0
+    skipped: int = 0
+    deferred: int = 0
+    failed: int = 0
+
+
+class Pipeline:
+    """Fetches, parses and ingests pages with every stage running concurrently
+
+    Pages are fetched by async tasks on the client, parsed in a process pool
+    and ingested in batched transactions by an IngestWriter. The queues
+    between the stages are bounded so a slow stage holds back the ones before
+    it instead of letting pages pile up in memory.
+
+    A page that refers to events, teams or players missing from the database
+    is set aside while the pages of those dependencies go through the
+    pipeline, and is ingested again once they are all out of it.
+    """
+
+    def __init__(
+        self,
+        client: AsyncVLRClient,
+        workers: Optional[int] = None,
+        queue_size: int = 64,
+        parser: str = HTML_PARSER,
+        on_parsed: Optional[Callable[[str, str, object], Awaitable[None]]] = None,
+        on_finished: Optional[Callable[[str, bool], None]] = None,
+        fingerprints: Optional[FingerprintStore] = None,
+        max_deferrals: int = 2,
+        writer: Optional[IngestWriter] = None,
+    ):
+        """Initializes a new Pipeline Object
+
+        Args:
+            client (AsyncVLRClient): Client to fetch pages with, its concurrency sets the number of fetch tasks
+            workers (int, optional): Number of parser processes. Defaults to the number of CPUs.
+            queue_size (int, optional): Max pages waiting between two stages. Defaults to 64.
+            parser (str, optional): Parser backend used by the workers, one of backends.BACKENDS. Defaults to HTML_PARSER.
+            on_parsed (Callable[[str, str, object], Awaitable[None]], optional): Coroutine function awaited with the url, kind and data of every parsed page before it is ingested. Defaults to None.
+            on_finished (Callable[[str, bool], None], optional): Called with the url of every page once it is out of the pipeline and whether it got through without errors. It can submit more URLs. Defaults to None.
+            fingerprints (FingerprintStore, optional): Fingerprints of the pages as last ingested. Pages whose fingerprint has not changed are neither parsed nor ingested, and on_parsed gets UNCHANGED as their data. Defaults to None.
+            max_deferrals (int, optional): Max times a page is set aside to fetch its missing dependencies before it fails, 0 to never fetch them. Defaults to 2.
+            writer (IngestWriter, optional): Writer to ingest pages with, so several pipelines in a process can share one. Defaults to a writer owned by this pipeline.
+        """
+        self.client = client
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.parser = parser
+        self.on_parsed = on_parsed
+        self.on_finished = on_finished
+        self.fingerprints = fingerprints
+        self.max_deferrals = max_deferrals
+        self.writer = writer
+        self.stats = PipelineStats()
+
+        self._urls: Optional[asyncio.Queue] = None
+        self._parsed: Optional[asyncio.Queue] = None
+        self._pending = 0
+        self._done: Optional[asyncio.Event] = None
+        self._in_flight: Set[str] = set()
+        self._failed: Set[str] = set()
+
+        # Pages set aside until their dependencies are out of the pipeline
+        self._deferrals: Dict[str, int] = {}
+        self._blocked: Dict[str, Tuple[tuple, Set[str]]] = {}
+        self._waiting_on: Dict[str, List[str]] = {}
+        self._replays: Set[asyncio.Task] = set()
+
+    def submit(self, url: str):
+        """Adds a URL to the pipeline, can be called while it is running
+
+        URLs already in the pipeline are ignored, so on_finished is called
+        once for them however many times they were submitted.
+
+        Args:
+            url (str): URL to fetch, parse and ingest
+        """
+        if url in self._in_flight:
+            return
+        self._pending += 1
+        self._in_flight.add(url)
+        self._done.clear()
+        self._urls.put_nowait(url)
+
+    def _finish(self, url: str, ok: bool):
+        self._in_flight.discard(url)
+        self._deferrals.pop(url, None)
+        if not ok:
+            self._failed.add(url)
+        if self.on_finished is not None:
+            self.on_finished(url, ok)
+
+        for waiting in self._waiting_on.pop(url, []):
+            item, blockers = self._blocked[waiting]
+            blockers.discard(url)
+            if not blockers:
+                del self._blocked[waiting]
+                task = asyncio.create_task(self._parsed.put(item))
+                self._replays.add(task)
+                task.add_done_callback(self._replays.discard)
+
+        self._pending -= 1
+        if self._pending == 0:
+            self._done.set()
+
+    async def _fetcher(self, pages: asyncio.Queue):
+        while True:
+            url = await self._urls.get()
+            try:
+                content = await self.client.fetch(url)
+            except Exception as e:
+                logger.warning("Error fetching %s: %s", url, e)
+                self.stats.failed += 1
+                self._finish(url, False)
+            else:
+                self.stats.fetched += 1
+                await pages.put((url, content))
+            finally:
+                self._urls.task_done()
+
+    async def _parser(self, pages: asyncio.Queue, parsed: asyncio.Queue, pool):
+        loop = asyncio.get_running_loop()
+        while True:
+            url, content = await pages.get()
+            try:
+                if self.fingerprints is None:
+                    value = None
+                    kind, data = await loop.run_in_executor(
+                        pool, parse_page, url, content, self.parser
+                    )
+                else:
+                    previous = self.fingerprints.get(url)
+                    kind, value, data = await loop.run_in_executor(
+                        pool, parse_changed_page, url, content, self.parser, previous
+                    )
+                    if value == previous:
+                        data = UNCHANGED
+            except Exception as e:
+                logger.warning("Error parsing %s: %s", url, e)
+                self.stats.failed += 1
+                self._finish(url, False)
+            else:
+                if data is not UNCHANGED:
+                    self.stats.parsed += 1
+                await parsed.put((url, kind, data, value))
+            finally:
+                pages.task_done()
+
+    def _warm(self):
+        close_old_connections()
+        identity_map.warm()
+
+    def _defer(self, item: tuple, missing: List[str]) -> bool:
+        url = item[0]
+        deferrals = self._deferrals.get(url, 0)
+        if deferrals >= self.max_deferrals:
+            return False
+        self._deferrals[url] = deferrals + 1
+
+        blockers = {normalize_url(dependency) for dependency in missing} - {url}
+        # A dependency that already failed in this run would just fail again
+        if not blockers or blockers & self._failed:
+            return False
+        for dependency in blockers:
+            self._waiting_on.setdefault(dependency, []).append(url)
+            self.submit(dependency)
+        self._blocked[url] = (item, blockers)
+        self.stats.deferred += 1
+        logger.info("Deferring %s until %d dependencies are ingested", url, len(blockers))
+        return True
+
+    async def _writer(self, parsed: asyncio.Queue, writer: IngestWriter):
+        while True:
+            item = await parsed.get()
+            url, kind, data, value = item
+            ok = False
+            deferred = False
+            try:
+                if self.on_parsed is not None and url not in self._deferrals:
+                    await self.on_parsed(url, kind, data)
+                if data is UNCHANGED:
+                    self.stats.skipped += 1
+                else:
+                    # Raises if the page failed to ingest, so a page's fingerprint
+                    # is only stored once it is committed and it is retried otherwise
+                    if await asyncio.wrap_future(writer.submit(kind, data, url)):
+                        self.stats.ingested += 1
+                    if value is not None:
+                        self.fingerprints.store(url, value)
+                ok = True
+            except MissingDependencies as e:
+                deferred = self._defer(item, e.urls)
+                if not deferred:
+                    logger.warning("Error ingesting %s: %s", url, e)
+                    self.stats.failed += 1
+            except Exception as e:
+                logger.warning("Error ingesting %s: %s", url, e)
+                self.stats.failed += 1
+            finally:
+                parsed.task_done()
+                if not deferred:
+                    self._finish(url, ok)
+
+    async def run(
+        self, urls: Iterable[str], until: Optional[Awaitable] = None
+    ) -> PipelineStats:
+        """Runs every URL (and any submitted while running) through the pipeline
+
+        Args:
+            urls (Iterable[str]): URLs to fetch, parse and ingest
+            until (Awaitable, optional): Keeps the pipeline running until it is done, for producers that submit URLs over time. Defaults to None.
+
+        Returns:
+            PipelineStats: how many pages went through each stage
+        """
+        self._urls = asyncio.Queue()
+        self._done = asyncio.Event()
+        self._done.set()
+        pages = asyncio.Queue(self.queue_size)
+        parsed = self._parsed = asyncio.Queue(self.queue_size)
+
+        writer = self.writer or IngestWriter()
+        try:
+            await asyncio.wrap_future(writer.call(self._warm))
+        except Exception as e:
+            logger.warning("Error warming the identity map: %s", e)
+
+        with ProcessPoolExecutor(self.workers) as pool:
+            tasks = [
+                asyncio.create_task(self._fetcher(pages))
+                for _ in range(self.client.concurrency)
+            ]
+            tasks += [
+                asyncio.create_task(self._parser(pages, parsed, pool))
+                for _ in range(self.workers)
+            ]
+            # Enough pages in flight to the writer for it to fill its batches
+            tasks += [
+                asyncio.create_task(self._writer(parsed, writer))
+                for _ in range(writer.batch_size)
+            ]
+
+            try:
+                for url in urls:
+                    self.submit(url)
+                if until is not None:
+                    await until
+                await self._done.wait()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if self.writer is None:
+                    writer.close()
+
+        return self.stats
@@ -0,0 +1,73 @@
+from dataclasses import dataclass, field
+import datetime
+from typing import List
+
+
+def to_int(text: str) -> int:
+    """Converts a number scraped from VLR to an int, treating blanks like "" or "-" as 0
+
+    Args:
+        text (str): the scraped text
+
+    Returns:
+        int: the number
+    """
+    text = text.strip().replace(",", "")
+    try:
+        return int(text)
+    except ValueError:
+        return 0
+
+
+@dataclass(slots=True)
+class PlayerStatLine:
+    player: str             # URL of the player's VLR page
+    kills: int              # number of kills the player got
+    deaths: int             # number of times the player died
+    assists: int            # number of assists the player got
+    agent_played: str       # the agent the player played
+    acs: int                # player's acs for this map
+
+
+@dataclass(slots=True)
+class MapRecord:
+    team_1_score: int                       # rounds won in this map by the first team
+    team_2_score: int                       # rounds won in this map by the second team
+    map_played: str                         # which map was played
+    game_id: str                            # VLR game id for this map
+    team_1_stats: List[PlayerStatLine]      # the stats for the first team (5 players)
+    team_2_stats: List[PlayerStatLine]      # the stats for the second team (5 players)
+
+
+@dataclass(slots=True)
+class MatchRecord:
+    event: str                  # URL of the event's VLR page
+    date: datetime.datetime     # Match start time in UTC
+    team_1: str                 # URL of the first team's VLR page
+    team_2: str                 # URL of the second team's VLR page
+    finished: bool              # whether the match is finished
+    team_1_match_score: int = 0                             # maps won by the first team
+    team_2_match_score: int = 0                             # maps won by the second team
+    maps: List[MapRecord] = field(default_factory=list)     # stats for each map, empty if not finished
+
+    @property
+    def maps_played(self) -> int:
+        """Number of maps played"""
+        return len(self.maps)
+
+
+@dataclass(slots=True)
+class PlayerRecord:
+    ign: str                # player's in game name
+    real_name: str          # player's real name
+    team: str = ""          # URL of the VLR page of the team the player belongs to, "" if unknown
+    url: str = ""           # URL of the player's VLR page, "" if unknown
+
+
+@dataclass(slots=True)
+class TeamRecord:
+    team_name: str                  # name of the team
+    team_tag: str                   # shortened name for the team
+    team_logo_url: str              # logo URL for the team
+    team_rating: int                # VLR team rating, 0 if unranked
+    players: List[PlayerRecord]     # all active players in the team
@@ -0,0 +1,184 @@
+import asyncio
+from dataclasses import dataclass
+import email.utils
+import logging
+import random
+import time
+from typing import Mapping, Optional
+
+
+logger = logging.getLogger(__name__)
+
+SUCCESS = "success"
+RETRY = "retry"
+RATE_LIMITED = "rate_limited"
+PERMANENT = "permanent"
+
+
+class FetchError(RuntimeError):
+    """Raised when a URL could not be fetched"""
+
+    def __init__(self, url: str, reason: str, status: Optional[int] = None):
+        super().__init__(f"Failed to fetch {url}: {reason}")
+        self.url = url
+        self.status = status
+
+
+class PermanentFetchError(FetchError):
+    """Raised when VLR answers with a status that retrying will not fix (e.g. 404)"""
+
+
+@dataclass
+class RetryPolicy:
+    """How failed requests are classified and how long to wait before retrying them
+
+    Attributes:
+        max_retries (int): Max times to try fetching a url, including the first try
+        base_delay (float): Backoff (in seconds) after the first failure, doubled after each further failure
+        max_delay (float): Max backoff (in seconds) between tries
+        max_retry_after (float): Max time (in seconds) to honour from a Retry-After header
+    """
+
+    max_retries: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    max_retry_after: float = 300.0
+
+    def classify(self, status: int) -> str:
+        """Gets what should happen after a response with this status
+
+        Args:
+            status (int): HTTP status of the response
+
+        Returns:
+            str: SUCCESS, RETRY (5xx and request timeouts), RATE_LIMITED (429) or PERMANENT (any other 4xx)
+        """
+        if status in (200, 304):
+            return SUCCESS
+        if status == 429:
+            return RATE_LIMITED
+        if status in (408, 425) or status >= 500:
+            return RETRY
+        return PERMANENT
+
+    def backoff(self, attempt: int) -> float:
+        """Gets the exponential backoff with full jitter before the next try
+
+        Args:
+            attempt (int): how many tries have failed so far, minus one
+
+        Returns:
+            float: seconds to wait
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def retry_after(self, headers: Mapping[str, str]) -> Optional[float]:
+        """Gets how long VLR asked us to wait from a Retry-After header
+
+        Args:
+            headers (Mapping[str, str]): headers of the response
+
+        Returns:
+            Optional[float]: seconds to wait, or None if the header is missing or invalid
+        """
+        value = headers.get("Retry-After")
+        if value is None:
+            return None
+
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                date = email.utils.parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            delay = date.timestamp() - time.time()
+        return min(max(delay, 0.0), self.max_retry_after)
+
+
+class CircuitBreaker:
+    """Pauses every request to a host once it looks degraded
+
+    After failure_threshold consecutive transient failures the circuit opens
+    and every request waits out the cooldown. The circuit is then half open:
+    a single request is let through as a probe while the others keep
+    waiting. If the probe succeeds they all go through, if it fails the
+    circuit reopens with double the cooldown, up to max_cooldown.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_cooldown=600.0):
+        """Initializes a new CircuitBreaker Object
+
+        Args:
+            failure_threshold (int, optional): Consecutive failures that open the circuit. Defaults to 5.
+            cooldown (float, optional): Time (in seconds) the circuit stays open the first time. Defaults to 30.0.
+            max_cooldown (float, optional): Max time (in seconds) the circuit stays open. Defaults to 600.0.
+        """
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.half_open = False
+        self._probing = False
+        self._probe_ended: Optional[asyncio.Event] = None
+
+    @property
+    def is_open(self) -> bool:
+        return time.monotonic() < self.open_until
+
+    async def wait(self) -> bool:
+        """Waits until the circuit is closed, or until the caller is let through a half-open circuit as its probe
+
+        Returns:
+            bool: whether the caller is the probe, which must call end_probe once its request is done
+        """
+        while True:
+            remaining = self.open_until - time.monotonic()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            elif not self.half_open:
+                return False
+            elif not self._probing:
+                self._probing = True
+                self._probe_ended = asyncio.Event()
+                return True
+            else:
+                await self._probe_ended.wait()
+
+    def end_probe(self):
+        """Wakes the requests waiting on the probe, letting the next one probe if it ended without an outcome (e.g. a 404)"""
+        self._probing = False
+        if self._probe_ended is not None:
+            self._probe_ended.set()
+
+    def pause(self, seconds: float):
+        """Holds every request for at least this long, e.g. after a 429
+
+        Args:
+            seconds (float): time to pause for
+        """
+        self.open_until = max(self.open_until, time.monotonic() + seconds)
+        self.end_probe()
+
+    def record_success(self):
+        self.failures = 0
+        self.half_open = False
+        self.cooldown = self.base_cooldown
+        self.end_probe()
+
+    def record_failure(self):
+        self.failures += 1
+        if self.half_open:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        elif self.failures < self.failure_threshold:
+            return
+
+        logger.warning(
+            "Circuit opened after %d consecutive failures, pausing for %.0fs",
+            self.failures,
+            self.cooldown,
+        )
+        self.pause(self.cooldown)
+        self.half_open = True
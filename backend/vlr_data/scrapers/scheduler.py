@@ -0,0 +1,238 @@
+import asyncio
+from dataclasses import dataclass, field
+import datetime
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from ..models import Match
+from .async_client import AsyncVLRClient
+from .backends import HTML_PARSER
+from .fingerprint import FingerprintStore
+from .pipeline import Pipeline
+from . import url_types
+from .url_types import BASE_URL, classify_url
+
+
+logger = logging.getLogger(__name__)
+
+MINUTE = datetime.timedelta(minutes=1)
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
+
+
+@dataclass
+class RefreshPolicy:
+    """How often an unfinished match is polled, based on when it starts
+
+    Attributes:
+        upcoming (List[Tuple[datetime.timedelta, datetime.timedelta]]): (lead, interval) pairs, sorted by lead descending. A match starting at least lead from now is polled every interval.
+        live_interval (datetime.timedelta): Interval once a match has started, until live_window after its start
+        live_window (datetime.timedelta): How long after its start a match is expected to finish
+        overdue_interval (datetime.timedelta): Interval for a match past its live window that is still not final
+        stale_after (datetime.timedelta): Time after its start from which a match is assumed postponed or abandoned
+        stale_interval (datetime.timedelta): Interval for a stale match
+    """
+
+    upcoming: List[Tuple[datetime.timedelta, datetime.timedelta]] = field(
+        default_factory=lambda: [
+            (7 * DAY, DAY),
+            (DAY, 6 * HOUR),
+            (6 * HOUR, HOUR),
+            (HOUR, 15 * MINUTE),
+            (datetime.timedelta(0), 5 * MINUTE),
+        ]
+    )
+    live_interval: datetime.timedelta = 2 * MINUTE
+    live_window: datetime.timedelta = 6 * HOUR
+    overdue_interval: datetime.timedelta = 30 * MINUTE
+    stale_after: datetime.timedelta = 2 * DAY
+    stale_interval: datetime.timedelta = 6 * HOUR
+
+    def interval(
+        self, date_played: datetime.datetime, now: datetime.datetime
+    ) -> datetime.timedelta:
+        """Gets how long to wait between two polls of an unfinished match
+
+        Args:
+            date_played (datetime.datetime): when the match starts
+            now (datetime.datetime): the current time
+
+        Returns:
+            datetime.timedelta: time between polls
+        """
+        lead = date_played - now
+        for min_lead, interval in self.upcoming:
+            if lead >= min_lead:
+                return interval
+
+        if -lead < self.live_window:
+            return self.live_interval
+        if -lead < self.stale_after:
+            return self.overdue_interval
+        return self.stale_interval
+
+
+@dataclass
+class RefreshStats:
+    unfinished: int = 0
+    polled: int = 0
+    finished: int = 0
+
+
+def _close_connection():
+    connection.close()
+
+
+def match_url(vlr_id: str) -> str:
+    """Gets the URL of a match's VLR page from its VLR ID
+
+    Args:
+        vlr_id (str): the match's VLR ID
+
+    Returns:
+        str: URL for the match's VLR page
+    """
+    return f"{BASE_URL}/{vlr_id}/"
+
+
+class RefreshScheduler:
+    """Polls unfinished matches until VLR reports them final
+
+    Matches are read from the database, so anything ingest_match stored as
+    unfinished gets picked up, and drops out once a poll ingests it as
+    finished. When each match was last polled is kept in a SQLite file so a
+    restart does not poll every match at once.
+    """
+
+    def __init__(
+        self,
+        client: AsyncVLRClient,
+        path: str,
+        policy: Optional[RefreshPolicy] = None,
+        workers: int = 1,
+        parser: str = HTML_PARSER,
+        fingerprints: Optional[FingerprintStore] = None,
+    ):
+        """Initializes a new RefreshScheduler Object
+
+        Args:
+            client (AsyncVLRClient): Client to fetch match pages with
+            path (str): SQLite file to keep the poll times in, created if missing
+            policy (RefreshPolicy, optional): How often matches are polled. Defaults to RefreshPolicy().
+            workers (int, optional): Number of parser processes. Defaults to 1.
+            parser (str, optional): Parser backend, one of backends.BACKENDS. Defaults to HTML_PARSER.
+            fingerprints (FingerprintStore, optional): Fingerprints of the pages as last ingested, unchanged pages are skipped. Defaults to None.
+        """
+        self.client = client
+        self.policy = policy or RefreshPolicy()
+        self.workers = workers
+        self.parser = parser
+        self.fingerprints = fingerprints
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS refresh (vlr_id TEXT PRIMARY KEY, polled REAL NOT NULL)"
+        )
+
+    def _unfinished_matches(self) -> Dict[str, datetime.datetime]:
+        close_old_connections()
+        return dict(
+            Match.objects.filter(is_finished=False).values_list("vlr_id", "date_played")
+        )
+
+    def _count_finished(self, vlr_ids: List[str]) -> int:
+        close_old_connections()
+        return Match.objects.filter(vlr_id__in=vlr_ids, is_finished=True).count()
+
+    def _schedule(
+        self, matches: Dict[str, datetime.datetime], now: datetime.datetime
+    ) -> Tuple[List[str], datetime.datetime]:
+        polled = dict(self._db.execute("SELECT vlr_id, polled FROM refresh"))
+
+        # Forget matches that have finished (or were deleted) since they were polled
+        retired = [(vlr_id,) for vlr_id in polled if vlr_id not in matches]
+        with self._db:
+            self._db.executemany("DELETE FROM refresh WHERE vlr_id = ?", retired)
+
+        due = []
+        next_poll = None
+        for vlr_id, date_played in matches.items():
+            interval = self.policy.interval(date_played, now)
+            last = polled.get(vlr_id)
+            if last is None:
+                poll_at = now
+            else:
+                poll_at = datetime.datetime.fromtimestamp(last, datetime.timezone.utc) + interval
+            if poll_at <= now:
+                due.append(vlr_id)
+                poll_at = now + interval
+            next_poll = poll_at if next_poll is None else min(next_poll, poll_at)
+
+        if next_poll is None:
+            next_poll = now + self.policy.stale_interval
+        return due, next_poll
+
+    def _polled(self, url: str, ok: bool):
+        # Teams, players and events fetched as dependencies of a match
+        if classify_url(url) != url_types.MATCH:
+            return
+        vlr_id = url.rstrip("/").rsplit("/", 1)[-1]
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO refresh (vlr_id, polled) VALUES (?, ?)",
+                (vlr_id, time.time()),
+            )
+
+    async def poll(self) -> Tuple[RefreshStats, datetime.datetime]:
+        """Polls every unfinished match that is due
+
+        Returns:
+            Tuple[RefreshStats, datetime.datetime]: what was polled, and when the next match is due
+        """
+        try:
+            matches = await sync_to_async(self._unfinished_matches)()
+            due, next_poll = self._schedule(matches, timezone.now())
+            stats = RefreshStats(unfinished=len(matches), polled=len(due))
+            if not due:
+                return stats, next_poll
+
+            pipeline = Pipeline(
+                self.client,
+                workers=self.workers,
+                parser=self.parser,
+                on_finished=self._polled,
+                fingerprints=self.fingerprints,
+            )
+            await pipeline.run([match_url(vlr_id) for vlr_id in due])
+            stats.finished = await sync_to_async(self._count_finished)(due)
+            return stats, next_poll
+        finally:
+            # The thread sync_to_async runs queries in outlives the poll
+            await sync_to_async(_close_connection)()
+
+    async def run(self, min_sleep: float = 10.0, max_sleep: float = 300.0):
+        """Polls matches as they fall due, forever
+
+        Args:
+            min_sleep (float, optional): Min time (in seconds) between two polls. Defaults to 10.0.
+            max_sleep (float, optional): Max time (in seconds) between two polls, so newly ingested matches get picked up. Defaults to 300.0.
+        """
+        while True:
+            stats, next_poll = await self.poll()
+            logger.info(
+                "Polled %d of %d unfinished matches, %d now finished",
+                stats.polled,
+                stats.unfinished,
+                stats.finished,
+            )
+            delay = (next_poll - timezone.now()).total_seconds()
+            await asyncio.sleep(min(max(delay, min_sleep), max_sleep))
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,243 @@
+from typing import Dict, List
+from bs4 import SoupStrainer
+
+from . import url_types
+from .backends import Document
+from .records import MapRecord, PlayerStatLine, to_int
+from .url_types import BASE_URL
+
+
+PLAYER = "player"
+AGENT = "agent_played"
+ACS = "acs"
+KILLS = "kills"
+DEATHS = "deaths"
+ASSISTS = "assists"
+
+# Where the value of each column sits inside its cell
+_CELL_SELECTORS = {
+    PLAYER: "a",
+    AGENT: "img",
+    ACS: ".side.mod-side.mod-both",
+    KILLS: ".side.mod-side.mod-both",
+    DEATHS: ".side.mod-both",
+    ASSISTS: ".side.mod-both",
+}
+
+
+def _is_match_page_section(classes) -> bool:
+    if not classes:
+        return False
+    if isinstance(classes, str):
+        classes = classes.split()
+    return any(c.startswith("match-header") or c == "vm-stats-container" for c in classes)
+
+
+# Everything parse_match_page reads lives in the match header or the stats
+# container, so html.parser can skip building the rest of the page (nav,
+# comments, streams, ...).
+MATCH_PAGE_STRAINER = SoupStrainer(class_=_is_match_page_section)
+
+# SoupStrainer to parse each kind of page with, keyed by url_types.classify_url
+PAGE_STRAINERS = {url_types.MATCH: MATCH_PAGE_STRAINER}
+
+
+def build_column_map(cells: List[Document]) -> Dict[str, int]:
+    """Gets which column of a stats table row holds each stat
+
+    Args:
+        cells (List[Document]): the td elements of one row
+
+    Returns:
+        Dict[str, int]: position of the player, agent, acs, kills, deaths and assists cells
+    """
+    columns = {}
+    stat_columns = 0
+    for i, cell in enumerate(cells):
+        classes = cell.get("class") or []
+        if "mod-player" in classes:
+            columns.setdefault(PLAYER, i)
+        elif "mod-agents" in classes:
+            columns.setdefault(AGENT, i)
+        elif "mod-stat" in classes:
+            stat_columns += 1
+            if stat_columns == 2:
+                columns[ACS] = i
+            if "mod-vlr-kills" in classes:
+                columns[KILLS] = i
+            elif "mod-vlr-deaths" in classes:
+                columns[DEATHS] = i
+            elif "mod-vlr-assists" in classes:
+                columns[ASSISTS] = i
+    return columns
+
+
+def extract_team_stats(tbody: Document) -> List[PlayerStatLine]:
+    """Extracts every player's stat line from one team's stats table
+
+    The column map is built once from the first row, then each row is read
+    by position so every cell is visited once.
+
+    Args:
+        tbody (Document): tbody element of the team's stats table
+
+    Returns:
+        List[PlayerStatLine]: the stats of each player
+    """
+    team_stats = []
+    columns = None
+    for row in tbody.find_all("tr", recursive=False):
+        cells = row.find_all("td", recursive=False)
+        if columns is None:
+            columns = build_column_map(cells)
+
+        values = {
+            key: cells[i].select_one(_CELL_SELECTORS[key]) for key, i in columns.items()
+        }
+        team_stats.append(
+            PlayerStatLine(
+                player=BASE_URL + values[PLAYER].get("href"),
+                kills=to_int(values[KILLS].get_text(strip=True)),
+                deaths=to_int(values[DEATHS].get_text(strip=True)),
+                assists=to_int(values[ASSISTS].get_text(strip=True)),
+                agent_played=values[AGENT].get("title"),
+                acs=to_int(values[ACS].get_text(strip=True)),
+            )
+        )
+    return team_stats
+
+
+def _map_name(span: Document) -> str:
+    # The map name is the span's first string, followed by a "PICK" badge
+    # when a team picked the map
+    return span.get_text("\n", strip=True).split("\n")[0]
+
+
+def extract_map(game: Document) -> MapRecord:
+    """Extracts the scores and stats of one map from its .vm-stats-game element
+
+    Args:
+        game (Document): the .vm-stats-game element of the map
+
+    Returns:
+        MapRecord: the map's scores and stats
+    """
+    header = game.select_one(".vm-stats-game-header")
+    scores = [to_int(score.get_text(strip=True)) for score in header.select(".team .score")]
+    map_played = _map_name(header.select_one(".map span"))
+    teams_stats = [extract_team_stats(tbody) for tbody in game.find_all("tbody")]
+
+    return MapRecord(
+        team_1_score=scores[0],
+        team_2_score=scores[1],
+        map_played=map_played,
+        game_id=game.get("data-game-id"),
+        team_1_stats=teams_stats[0],
+        team_2_stats=teams_stats[1],
+    )
+
+
+def find_games(soup: Document) -> List[Document]:
+    """Gets the .vm-stats-game element of every map played, without the "all maps" one
+
+    Args:
+        soup (Document): BeautifulSoup (or compatible) object for a match page
+
+    Returns:
+        List[Document]: the .vm-stats-game element of each map, in order
+    """
+    container = soup.select_one(".vm-stats-container")
+    if container is None:
+        return []
+
+    # The games are direct children of the container, which is far cheaper
+    # to walk than matching a descendant selector against the whole page.
+    games = [
+        div
+        for div in container.find_all("div", recursive=False)
+        if "vm-stats-game" in (div.get("class") or [])
+    ] or container.select(".vm-stats-game")
+    return [game for game in games if game.get("data-game-id") != "all"]
+
+
+def extract_maps(soup: Document) -> List[MapRecord]:
+    """Extracts the scores and stats of every map played in a match
+
+    Args:
+        soup (Document): BeautifulSoup (or compatible) object for a match page
+
+    Returns:
+        List[MapRecord]: the scores and stats of each map
+    """
+    return [extract_map(game) for game in find_games(soup)]
+
+
+def extract_maps_by_selectors(soup: Document) -> List[MapRecord]:
+    """Extracts every map with a separate selector per stat, the way parse_match_page used to
+
+    Kept as the reference extract_maps is verified and benchmarked against.
+
+    Args:
+        soup (Document): BeautifulSoup (or compatible) object for a match page
+
+    Returns:
+        List[MapRecord]: the scores and stats of each map
+    """
+    maps = soup.select(".vm-stats-container .vm-stats-game")
+    for i in range(len(maps)):
+        if maps[i].get("data-game-id") == "all":
+            maps.pop(i)
+            break
+    return [_extract_map_by_selectors(game) for game in maps]
+
+
+def _extract_map_by_selectors(game: Document) -> MapRecord:
+    scores = game.select(".vm-stats-game-header .team .score")
+    scores = [to_int(score.get_text()) for score in scores]
+    map_played = (
+        game.select_one(".vm-stats-game-header .map span")
+        .get_text(strip=True)
+        .replace("PICK", "")
+    )
+    game_id = game.get("data-game-id")
+
+    teams_stats = []
+    for team in game.select("tbody"):
+        team_stats = []
+        for stat in team.select("tr"):
+            team_stats.append(
+                PlayerStatLine(
+                    player=BASE_URL + stat.select_one(".mod-player a").get("href"),
+                    kills=to_int(
+                        stat.select_one(
+                            ".mod-stat.mod-vlr-kills .side.mod-side.mod-both"
+                        ).get_text(strip=True)
+                    ),
+                    deaths=to_int(
+                        stat.select_one(
+                            ".mod-stat.mod-vlr-deaths .side.mod-both"
+                        ).get_text(strip=True)
+                    ),
+                    assists=to_int(
+                        stat.select_one(
+                            ".mod-stat.mod-vlr-assists .side.mod-both"
+                        ).get_text(strip=True)
+                    ),
+                    agent_played=stat.select_one(".mod-agents img").get("title"),
+                    acs=to_int(
+                        stat.select(".mod-stat")[1]
+                        .select_one(".side.mod-side.mod-both")
+                        .get_text(strip=True)
+                    ),
+                )
+            )
+        teams_stats.append(team_stats)
+
+    return MapRecord(
+        team_1_score=scores[0],
+        team_2_score=scores[1],
+        map_played=map_played,
+        game_id=game_id,
+        team_1_stats=teams_stats[0],
+        team_2_stats=teams_stats[1],
+    )
@@ -0,0 +1,68 @@
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+
+BASE_URL = "https://www.vlr.gg"
+
+HOMEPAGE = "homepage"
+MATCH = "match"
+TEAM = "team"
+TEAM_MATCHES = "team_matches"
+PLAYER = "player"
+EVENT = "event"
+EVENT_MATCHES = "event_matches"
+OTHER = "other"
+
+_PATTERNS = [
+    (TEAM_MATCHES, re.compile(r"^/team/matches/\d+(/|$)")),
+    (TEAM, re.compile(r"^/team/\d+(/|$)")),
+    (PLAYER, re.compile(r"^/player/\d+(/|$)")),
+    (EVENT_MATCHES, re.compile(r"^/event/matches/\d+(/|$)")),
+    (EVENT, re.compile(r"^/event/")),
+    (MATCH, re.compile(r"^/\d+(/|$)")),
+]
+
+
+def classify_url(url: str) -> str:
+    """Gets which kind of VLR page a URL points to
+
+    Args:
+        url (str): URL of a VLR page
+
+    Returns:
+        str: one of HOMEPAGE, MATCH, TEAM, TEAM_MATCHES, PLAYER, EVENT, EVENT_MATCHES or OTHER
+    """
+    path = re.sub(r"/{2,}", "/", urlsplit(url).path)
+    if path in ("", "/"):
+        return HOMEPAGE
+
+    for kind, pattern in _PATTERNS:
+        if pattern.match(path):
+            return kind
+    return OTHER
+
+
+def normalize_url(url: str) -> str:
+    """Gets the canonical form of a VLR URL, so the same page is only crawled once
+
+    Relative URLs are resolved against BASE_URL, duplicate slashes are
+    collapsed and the fragment is dropped.
+
+    Args:
+        url (str): URL or path of a VLR page
+
+    Returns:
+        str: the canonical URL
+    """
+    parts = urlsplit(url)
+    base = urlsplit(BASE_URL)
+    path = re.sub(r"/{2,}", "/", parts.path)
+    return urlunsplit(
+        (
+            parts.scheme or base.scheme,
+            parts.netloc or base.netloc,
+            path,
+            parts.query,
+            "",
+        )
+    )
@@ -1,29 +1,71 @@
+import asyncio
 import datetime
-import time
-from typing import List
+from typing import List, Optional
 from bs4 import BeautifulSoup
 import pytz
-import requests
 
-
-BASE_URL = "https://www.vlr.gg"
+from .async_client import AsyncVLRClient
+from .archive import ArchiveReader, ArchiveWriter
+from .backends import HTML_PARSER
+from .cache import ResponseCache
+from .records import MatchRecord, PlayerRecord, TeamRecord, to_int
+from .retry import RetryPolicy
+from . import url_types
+from .stats_table import extract_maps
+from .url_types import BASE_URL
 
 
 class VLRClient:
-    """Class to get URLs from VLR"""
+    """Class to get URLs from VLR
+
+    Thin synchronous wrapper over AsyncVLRClient, so requests are still rate
+    limited per host and get_many can keep several requests in flight.
+    """
 
-    def __init__(self, sleep=1.0, max_retries=3, timeout=20.0):
+    def __init__(
+        self,
+        sleep=1.0,
+        max_retries=3,
+        timeout=20.0,
+        concurrency=4,
+        cache: Optional[ResponseCache] = None,
+        recorder: Optional[ArchiveWriter] = None,
+        replay: Optional[ArchiveReader] = None,
+        retry: Optional[RetryPolicy] = None,
+        parser: str = HTML_PARSER,
+    ):
         """Initializes a new VLRScraper Object
 
         Args:
             sleep (float, optional): Time to wait (in seconds) between requests. Defaults to 1.0.
-            max_retries (int, optional): Max times to try fetching a url if it fails. Defaults to 3.
+            max_retries (int, optional): Max times to try fetching a url if it fails, ignored if retry is given. Defaults to 3.
             timeout (float, optional): Max time to wait (in seconds) for a url before giving up. Defaults to 20.0.
+            concurrency (int, optional): Max number of requests in flight at once for get_many. Defaults to 4.
+            cache (ResponseCache, optional): On-disk cache to serve fresh responses from and revalidate stale ones with. Defaults to None.
+            recorder (ArchiveWriter, optional): Archive to record every fetched page into. Defaults to None.
+            replay (ArchiveReader, optional): Archive to serve every page from instead of the network. Defaults to None.
+            retry (RetryPolicy, optional): How failed requests are retried. Defaults to RetryPolicy(max_retries=max_retries).
+            parser (str, optional): Parser backend used to build the returned soups, one of backends.BACKENDS. Defaults to HTML_PARSER.
         """
-        self.session = requests.Session()
+        self.client = AsyncVLRClient(
+            sleep=sleep,
+            max_retries=max_retries,
+            timeout=timeout,
+            concurrency=concurrency,
+            cache=cache,
+            recorder=recorder,
+            replay=replay,
+            retry=retry,
+            parser=parser,
+        )
+        self.session = self.client.session
         self.sleep = sleep
         self.max_retries = max_retries
         self.timeout = timeout
+        self._loop = asyncio.new_event_loop()
+
+    def _run(self, coro):
+        return self._loop.run_until_complete(coro)
 
     def get(self, url: str) -> BeautifulSoup:
         """Fetches a URL with custom constraints
@@ -34,16 +76,29 @@ class VLRClient:
         Returns:
             BeautifulSoup: BeautifulSoup object with request content
         """
-        for _ in range(self.max_retries):
-            try:
-                r = self.session.get(url, timeout=self.timeout)
-                if r.status_code == 200:
-                    time.sleep(self.sleep)
-                    return BeautifulSoup(r.content, "html.parser")
-            except Exception as e:
-                print(f"Error fetching {url}: {e}")
-            time.sleep(self.sleep)
-        raise RuntimeError(f"Failed to fetch {url}")
+        return self._run(self.client.get(url))
+
+    def get_many(self, urls: List[str]) -> List[BeautifulSoup]:
+        """Fetches many URLs concurrently with custom constraints
+
+        Args:
+            urls (List[str]): URLs to get
+
+        Returns:
+            List[BeautifulSoup]: BeautifulSoup object for each URL, in the same order as urls
+        """
+        return self._run(self.client.get_many(urls))
+
+    def close(self):
+        """Closes the underlying async client and its event loop"""
+        self.client.close()
+        self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 def get_homepage_soup() -> BeautifulSoup:
@@ -52,8 +107,8 @@ def get_homepage_soup() -> BeautifulSoup:
     Returns:
         BeautifulSoup: BeautifulSoup object with the homepage content
     """
-    client = VLRClient()
-    return client.get(BASE_URL)
+    with VLRClient() as client:
+        return client.get(BASE_URL)
 
 
 def extract_upcoming_match_urls(soup: BeautifulSoup) -> List[str]:
@@ -111,55 +166,16 @@ def extract_match_urls_from_event(soup: BeautifulSoup) -> List[str]:
     return [BASE_URL + a.get("href") for a in anchors]
 
 
-def parse_match_page(soup: BeautifulSoup) -> dict:
+def parse_match_page(soup: BeautifulSoup, extract_maps=extract_maps) -> MatchRecord:
     """Parses a VLR match page and returns structured match data.
 
     Args:
         soup (BeautifulSoup): BeautifulSoup object containing content for a match
+        extract_maps (Callable, optional): Extracts the MapRecord of every map played from the page. Defaults to stats_table.extract_maps.
 
     Returns:
-        dict: Structured dict containing either one of two dicts if the match isn't finished:
-        {
-            "event": str,               # URL of the event's VLR page
-            "date": datetime,           # Match start time in UTC
-            "team_1": str,              # URL of the first team's VLR page
-            "team_2": str,              # URL of the second team's VLR page
-            "finished": bool,           # whether the match is finished
-        }
-
-        or this dict if the match is finished:
-        {
-            "event": str,               # URL of the event's VLR page
-            "date": datetime,           # Match start time in UTC
-            "team_1": str,              # URL of the first team's VLR page
-            "team_2": str,              # URL of the second team's VLR page
-            "finished": bool,           # whether the match is finished
-            "team_1_match_score": int,  # maps won by the first team
-            "team_2_match_score": int,  # maps won by the second team
-            "maps_played": int,         # number of maps played
-            "maps": List[dict]          # stats for each map
-        }
-
-
-        Each maps dict includes:
-        {
-            "team_1_score": int,        # rounds won in this map by the first team
-            "team_2_score": int,        # rounds won in this map by the second team
-            "map_played": str,          # which map was played
-            "game_id": str,             # VLR game id for this map
-            "team_1_stats": List[dict]  # the stats for the first team (5 players)
-            "team_2_stats": List[dict]  # the stats for the the second team (5 players)
-        }
-
-        Each of the team_x_stats dict includes:
-        {
-            "player": str,              # URL of the player's VLR page
-            "kills": int,               # number of kills the player got
-            "deaths": int,              # number of times the player died
-            "assists": int,             # number of assists the player got
-            "agent_played": str,        # the agent the player played
-            "acs": int,                 # player's acs for this map
-        }
+        MatchRecord: the match, see records.MatchRecord. If the match isn't
+        finished its scores are 0 and it has no maps.
     """
     event_url = BASE_URL + soup.select_one(".match-header-super a").get("href")
 
@@ -187,121 +203,42 @@ def parse_match_page(soup: BeautifulSoup) -> dict:
     )
 
     if not is_finished:
-        return {
-            "event": event_url,
-            "date": match_date,
-            "team_1": team_urls[0],
-            "team_2": team_urls[1],
-            "finished": is_finished,
-        }
+        return MatchRecord(
+            event=event_url,
+            date=match_date,
+            team_1=team_urls[0],
+            team_2=team_urls[1],
+            finished=is_finished,
+        )
 
-    match_scores = soup.select(".match-header-vs-score .js-spoiler span")
+    match_scores = soup.select_one(".match-header-vs-score").select(".js-spoiler span")
     match_scores = [
         match_scores[0].get_text(strip=True),
         match_scores[2].get_text(strip=True),
     ]
     match_scores = [int(score) for score in match_scores]
 
-    maps = soup.select(".vm-stats-container .vm-stats-game")
-    for i in range(len(maps)):
-        if maps[i].get("data-game-id") == "all":
-            maps.pop(i)
-            break
-    maps_played = len(maps)
-
-    map_data = []
-    for map in maps:
-        scores = map.select(".vm-stats-game-header .team .score")
-        scores = [score.get_text(strip=True) for score in scores]
-        map_played = (
-            map.select_one(".vm-stats-game-header .map span")
-            .get_text(strip=True)
-            .replace("PICK", "")
-        )
-        game_id = map.get("data-game-id")
-
-        stats = map.select("tbody")
-        teams_stats = []
-        for team in stats:
-            players_stats = team.select("tr")
-            team_stats = []
-            for stat in players_stats:
-                player = BASE_URL + stat.select_one(".mod-player a").get("href")
-                agent = stat.select_one(".mod-agents img").get("title")
-                acs = (
-                    stat.select(".mod-stat")[1]
-                    .select_one(".side.mod-side.mod-both")
-                    .get_text(strip=True)
-                )
-                kills = stat.select_one(
-                    ".mod-stat.mod-vlr-kills .side.mod-side.mod-both"
-                ).get_text(strip=True)
-                deaths = stat.select_one(
-                    ".mod-stat.mod-vlr-deaths .side.mod-both"
-                ).get_text(strip=True)
-                assists = stat.select_one(
-                    ".mod-stat.mod-vlr-assists .side.mod-both"
-                ).get_text(strip=True)
-
-                team_stats.append(
-                    {
-                        "player": player,
-                        "kills": kills,
-                        "deaths": deaths,
-                        "assists": assists,
-                        "agent_played": agent,
-                        "acs": acs,
-                    }
-                )
-
-            teams_stats.append(team_stats)
-
-        map_data.append(
-            {
-                "team_1_score": scores[0],
-                "team_2_score": scores[1],
-                "map_played": map_played,
-                "game_id": game_id,
-                "team_1_stats": teams_stats[0],
-                "team_2_stats": teams_stats[1],
-            }
-        )
-
-    return {
-        "event": event_url,
-        "date": match_date,
-        "team_1": team_urls[0],
-        "team_2": team_urls[1],
-        "finished": is_finished,
-        "team_1_match_score": match_scores[0],
-        "team_2_match_score": match_scores[1],
-        "maps_played": maps_played,
-        "maps": map_data,
-    }
+    return MatchRecord(
+        event=event_url,
+        date=match_date,
+        team_1=team_urls[0],
+        team_2=team_urls[1],
+        finished=is_finished,
+        team_1_match_score=match_scores[0],
+        team_2_match_score=match_scores[1],
+        maps=extract_maps(soup),
+    )
 
 
-def parse_team_page(soup: BeautifulSoup) -> dict:
+def parse_team_page(soup: BeautifulSoup) -> TeamRecord:
     """Parses a VLR team page and returns structured team data.
 
     Args:
         soup (BeautifulSoup): BeautifulSoup object containing content for a team
 
     Returns:
-        dict: Structured dict containing either one of two dicts if the match isn't finished:
-        {
-            "team_name": str,               # name of the team
-            "team_tag": str,                # shortened name for the team
-            "team_logo_url": str,           # logo URL for the team
-            "players": List[dict],   # all active players in the team
-            "team_rating": int,             # VLR team rating
-        }
-
-    Each active player dict includes:
-    {
-        "real_name": str,                   # player's real name
-        "ign": str,                         # player's in game name
-        "url": player_url                   # URL of the player's VLR page
-    }
+        TeamRecord: the team, see records.TeamRecord. Each active player is a
+        PlayerRecord with its url set and no team.
     """
     team_name = soup.select_one(".team-header-name .wf-title").get_text(strip=True)
     team_logo = soup.select_one(".team-header-logo img").get("src")
@@ -330,56 +267,70 @@ def parse_team_page(soup: BeautifulSoup) -> dict:
         else:
             real_name = real_name.get_text(strip=True)
         
-        players[i] = {"real_name": real_name, "ign": ign, "url": player_url}
-
-    team_rating = soup.select_one(".rating-num").get_text(strip=True)
+        players[i] = PlayerRecord(ign=ign, real_name=real_name, url=player_url)
 
-    if team_rating.lower() == "unranked":
-        team_rating = 0
-    else:
-        team_rating = int(team_rating)
+    # "Unranked" teams get a rating of 0
+    team_rating = to_int(soup.select_one(".rating-num").get_text(strip=True))
 
-    return {
-        "team_name": team_name,
-        "team_tag": team_tag,
-        "team_logo_url": team_logo,
-        "players": players,
-        "team_rating": team_rating,
-    }
+    return TeamRecord(
+        team_name=team_name,
+        team_tag=team_tag,
+        team_logo_url=team_logo,
+        team_rating=team_rating,
+        players=players,
+    )
 
 
 def parse_team_matches_page(soup: BeautifulSoup) -> List[str]:
-    """Parses a VLR matches page for a team and returns a list of URLs
+    """Parses one page of a team's VLR matches and returns a list of URLs
 
     Args:
-        soup (BeautifulSoup): BeautifulSoup object containing content for a team's matches
+        soup (BeautifulSoup): BeautifulSoup object containing content for a page of a team's matches
 
     Returns:
-        List[str]: A list of URLs of past 50 completed matches for a team
+        List[str]: A list of URLs of the matches on the page (up to 50), most recent first
     """
     anchors = soup.select(".wf-card.fc-flex.m-item")
 
     return [BASE_URL + a.get("href") for a in anchors]
 
 
-def parse_player_page(soup: BeautifulSoup) -> dict:
-    """Parses a VLR players page and returns a structured dict
+def extract_page_count(soup: BeautifulSoup) -> int:
+    """Gets how many pages a paginated VLR list (e.g. a team's matches) has
+
+    Args:
+        soup (BeautifulSoup): BeautifulSoup object containing content for any page of the list
+
+    Returns:
+        int: the number of pages, 1 if the list is not paginated
+    """
+    pages = soup.select(".action-container-pages .btn.mod-page, .action-container .btn.mod-page")
+    return max([to_int(page.get_text()) for page in pages] + [1])
+
+
+def parse_player_page(soup: BeautifulSoup) -> PlayerRecord:
+    """Parses a VLR players page and returns a structured record
     Args:
         soup (BeautifulSoup): BeautifulSoup object containing content for a player
 
     Returns:
-        dict: {
-            "ign": str,         # player's in game name
-            "real_name": str,   # player's real name
-            "team": str,        # URL of the VLR page of the team the player belongs to
-        }
+        PlayerRecord: the player, see records.PlayerRecord. Its url is left
+        empty since the page does not link to itself.
     """
     ign = soup.select_one(".wf-title").get_text(strip=True)
     real_name = soup.select_one(".player-real-name").get_text(strip=True)
     team = BASE_URL + soup.select_one(".wf-card .wf-module-item.mod-first").get("href")
 
-    return {
-        "ign": ign,
-        "real_name": real_name,
-        "team": team,
-    }
+    return PlayerRecord(ign=ign, real_name=real_name, team=team)
+
+
+# Parser for each kind of VLR page, keyed by url_types.classify_url
+PAGE_PARSERS = {
+    url_types.HOMEPAGE: extract_upcoming_match_urls,
+    url_types.EVENT: parse_event_page,
+    url_types.EVENT_MATCHES: extract_match_urls_from_event,
+    url_types.MATCH: parse_match_page,
+    url_types.TEAM: parse_team_page,
+    url_types.TEAM_MATCHES: parse_team_matches_page,
+    url_types.PLAYER: parse_player_page,
+}
@@ -0,0 +1,180 @@
+from concurrent.futures import Future
+from dataclasses import dataclass
+import logging
+import queue
+import threading
+import time
+from typing import Callable, List
+
+from django.db import OperationalError, close_old_connections, connection, transaction
+
+from .ingest import MissingDependencies, ingest_page
+
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+@dataclass
+class _Write:
+    kind: str
+    data: object
+    url: str
+    future: Future
+
+
+@dataclass
+class WriterStats:
+    batches: int = 0
+    writes: int = 0
+    retries: int = 0
+
+
+class IngestWriter:
+    """Single thread that runs every ingest write, grouped into large transactions
+
+    Producers on any thread submit parsed pages and get a future back. The
+    writer takes whatever has queued up (up to batch_size pages, waiting at
+    most linger seconds for more) and ingests it in one transaction, with a
+    savepoint per page so one bad page does not roll back the others. Futures
+    only resolve once the transaction has committed.
+
+    Having one writer per process, plus the IMMEDIATE transactions and busy
+    timeout in settings, is what lets several scraper processes share a
+    SQLite database: their writers queue for the lock a batch at a time
+    instead of failing on every update_or_create.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 64,
+        linger: float = 0.05,
+        max_retries: int = 5,
+    ):
+        """Initializes a new IngestWriter Object and starts its thread
+
+        Args:
+            batch_size (int, optional): Max pages ingested in one transaction. Defaults to 64.
+            linger (float, optional): Max time (in seconds) to wait for more pages before committing a batch. Defaults to 0.05.
+            max_retries (int, optional): Max times to retry a batch when the database is locked. Defaults to 5.
+        """
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_retries = max_retries
+        self.stats = WriterStats()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="vlr-ingest", daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: str, data, url: str) -> Future:
+        """Queues a parsed page to be ingested
+
+        Args:
+            kind (str): kind of the page, from url_types.classify_url
+            data: output of the page's parser
+            url (str): URL of the page
+
+        Returns:
+            Future: resolves to ingest_page's result once the page is committed, or to its exception
+        """
+        future = Future()
+        self._queue.put(_Write(kind, data, url, future))
+        return future
+
+    def call(self, func: Callable, *args) -> Future:
+        """Runs a function on the writer thread, between two batches
+
+        Args:
+            func (Callable): function to run, e.g. one that needs the writer's database connection
+
+        Returns:
+            Future: resolves to the function's result
+        """
+        future = Future()
+        self._queue.put((func, args, future))
+        return future
+
+    def _take_batch(self, first) -> List[_Write]:
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if not isinstance(item, _Write):
+                # Calls and the stop signal run after this batch, in the order they came
+                self._pending_call = item
+                break
+            batch.append(item)
+        return batch
+
+    def _write_batch(self, batch: List[_Write]):
+        for attempt in range(self.max_retries + 1):
+            results = []
+            try:
+                close_old_connections()
+                with transaction.atomic():
+                    for write in batch:
+                        try:
+                            with transaction.atomic():
+                                results.append((ingest_page(write.kind, write.data, write.url), None))
+                        except OperationalError:
+                            raise
+                        except Exception as e:
+                            results.append((None, e))
+            except OperationalError as e:
+                if attempt == self.max_retries:
+                    logger.error("Giving up on a batch of %d pages: %s", len(batch), e)
+                    for write in batch:
+                        write.future.set_exception(e)
+                    return
+                self.stats.retries += 1
+                logger.warning("Retrying a batch of %d pages: %s", len(batch), e)
+                time.sleep(min(2**attempt * 0.1, 5.0))
+                continue
+
+            self.stats.batches += 1
+            self.stats.writes += len(batch)
+            for write, (result, error) in zip(batch, results):
+                if error is None:
+                    write.future.set_result(result)
+                else:
+                    # Missing dependencies are expected, the caller defers the page
+                    if not isinstance(error, MissingDependencies):
+                        logger.error("Error ingesting %s", write.url, exc_info=error)
+                    write.future.set_exception(error)
+            return
+
+    def _run_call(self, item):
+        func, args, future = item
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _run(self):
+        self._pending_call = None
+        while True:
+            item = self._queue.get()
+            if isinstance(item, _Write):
+                self._write_batch(self._take_batch(item))
+                item, self._pending_call = self._pending_call, None
+                if item is None:
+                    continue
+            if item is _STOP:
+                break
+            self._run_call(item)
+        connection.close()
+
+    def close(self):
+        """Ingests everything already submitted, then stops the thread"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,6 +1,15 @@
-from rest_framework.serializers import ModelSerializer, CharField
+from rest_framework.serializers import ModelSerializer, CharField, FloatField
 
-from .models import Match, Player, Team
+from .models import (
+    Match,
+    Player,
+    PlayerAgentSplit,
+    PlayerCareer,
+    PlayerMapSplit,
+    Team,
+    TeamMapRecord,
+    TeamSummary,
+)
 
 
 class TeamSerializer(ModelSerializer):
@@ -46,3 +55,53 @@ class PlayerSerializer(ModelSerializer):
             "team",
             "vlr_id"
         ]
+
+
+TOTALS_FIELDS = ["maps_played", "kills", "deaths", "assists", "kd", "average_acs"]
+
+
+class PlayerAgentSplitSerializer(ModelSerializer):
+    kd = FloatField(read_only=True)
+    average_acs = FloatField(read_only=True)
+
+    class Meta:
+        model = PlayerAgentSplit
+        fields = ["agent"] + TOTALS_FIELDS
+
+
+class PlayerMapSplitSerializer(ModelSerializer):
+    kd = FloatField(read_only=True)
+    average_acs = FloatField(read_only=True)
+
+    class Meta:
+        model = PlayerMapSplit
+        fields = ["map_name"] + TOTALS_FIELDS
+
+
+class PlayerCareerSerializer(ModelSerializer):
+    player = CharField(source="player.vlr_id", read_only=True)
+    kd = FloatField(read_only=True)
+    average_acs = FloatField(read_only=True)
+    agents = PlayerAgentSplitSerializer(source="player.agent_splits", many=True, read_only=True)
+    maps = PlayerMapSplitSerializer(source="player.map_splits", many=True, read_only=True)
+
+    class Meta:
+        model = PlayerCareer
+        fields = ["player"] + TOTALS_FIELDS + ["agents", "maps"]
+
+
+class TeamMapRecordSerializer(ModelSerializer):
+    win_rate = FloatField(read_only=True)
+
+    class Meta:
+        model = TeamMapRecord
+        fields = ["map_name", "played", "won", "win_rate"]
+
+
+class TeamSummarySerializer(ModelSerializer):
+    team = CharField(source="team.vlr_id", read_only=True)
+    maps = TeamMapRecordSerializer(source="team.map_records", many=True, read_only=True)
+
+    class Meta:
+        model = TeamSummary
+        fields = ["team", "matches_played", "wins", "losses", "form", "last_played", "maps"]
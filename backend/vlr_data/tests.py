@@ -1,3 +1,1551 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import os
+from pathlib import Path
+import pickle
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, routers
+from .export import EVENT, MONTH, PARTITION_KEYS, ParquetExporter
+from .models import (
+    Agent,
+    Event,
+    HeadToHead,
+    Map,
+    MapName,
+    Match,
+    Player,
+    PlayerAgentSplit,
+    PlayerCareer,
+    PlayerMapSplit,
+    PlayerStats,
+    Team,
+    TeamMapRecord,
+    TeamSummary,
+)
+from .pagination import KeysetPagination
+from .routers import REPLICA, read_from_replica, replica_configured
+from .scrapers import async_client, bulk, url_types
+from .scrapers.aggregates import rebuild_player_aggregates, rebuild_team_summaries, schedule_team_summaries
+from .scrapers.archive import _FOOTER, MAGIC, ArchiveReader, ArchiveWriter, _encode_record
+from .scrapers.async_client import AsyncVLRClient, TokenBucket
+from .scrapers.backfill import TeamBackfill, team_matches_url
+from .scrapers.backends import BACKENDS, HTML_PARSER, parse_html, verify_backends
+from .scrapers.cache import DAY, MINUTE, ResponseCache, default_ttl
+from .scrapers.changes import changes_since
+from .scrapers.crawler import Crawler
+from .scrapers.fingerprint import FingerprintStore, fingerprint
+from .scrapers.frontier import DONE, PENDING, CrawlPolicy, Frontier
+from .scrapers.identity import IdentityMap, identity_map
+from .scrapers.ingest import get_player_id_from_url, ingest_match, ingest_team
+from .scrapers.lookups import agents, map_names
+from .scrapers.pipeline import Pipeline, parse_page
+from .scrapers.records import MatchRecord, PlayerRecord, PlayerStatLine, TeamRecord, to_int
+from .scrapers.retry import PERMANENT, RATE_LIMITED, RETRY, SUCCESS, CircuitBreaker, RetryPolicy
+from .scrapers.scheduler import RefreshPolicy, RefreshScheduler, match_url
+from .scrapers.stats_table import MATCH_PAGE_STRAINER, extract_maps, extract_maps_by_selectors
+from .scrapers.vlr_scraper import parse_event_page, parse_match_page, parse_player_page, parse_team_page
+from .scrapers.writer import IngestWriter
+from .views import MatchListView, UpcomingMatchView
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite only")
+class QueryPlanTests(TestCase):
+    """Checks the hot API queries are answered from indexes rather than full scans
+
+    Seeds enough rows for the planner's choices to matter and runs ANALYZE,
+    as a populated production database would have, before checking the plan
+    SQLite picks for each query.
+    """
+
+    TEAMS = 200
+    MATCHES = 20_000
+    UPCOMING = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        event = Event.objects.create(name="Event", series="Series", vlr_url="https://www.vlr.gg/event/1/")
+        teams = Team.objects.bulk_create(
+            Team(
+                name=f"Team {i}",
+                team_tag=f"T{i}",
+                team_logo_url="",
+                team_rating=i,
+                vlr_id=str(i),
+                last_updated=now,
+            )
+            for i in range(cls.TEAMS)
+        )
+        matches = Match.objects.bulk_create(
+            Match(
+                event=event,
+                team1=teams[i % cls.TEAMS],
+                team2=teams[(i * 7 + 1) % cls.TEAMS],
+                date_played=now - datetime.timedelta(hours=cls.MATCHES - cls.UPCOMING - i),
+                vlr_id=str(i),
+                is_finished=i < cls.MATCHES - cls.UPCOMING,
+                team1_score=2,
+                team2_score=1,
+            )
+            for i in range(cls.MATCHES)
+        )
+        players = Player.objects.bulk_create(
+            Player(ign=f"Player {i}", real_name="", team=teams[i // 5], vlr_id=str(i), last_updated=now)
+            for i in range(cls.TEAMS * 5)
+        )
+        ascent = MapName.objects.create(name="Ascent")
+        jett = Agent.objects.create(name="Jett")
+        maps = Map.objects.bulk_create(
+            Map(match=match, name=ascent, map_number=1, game_id=match.vlr_id, team1_score=13, team2_score=11)
+            for match in matches[:2_000]
+        )
+        PlayerStats.objects.bulk_create(
+            PlayerStats(player=player, map=game, kills=20, deaths=15, assists=5, acs=250, agent=jett)
+            for i, game in enumerate(maps)
+            for player in players[(i % cls.TEAMS) * 5 : (i % cls.TEAMS) * 5 + 5]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.team = teams[0]
+        cls.player = players[0]
+
+    def assertUsesIndex(self, queryset, index: str):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+        self.assertNotIn("USE TEMP B-TREE", plan)
+
+    def test_upcoming_matches(self):
+        self.assertUsesIndex(UpcomingMatchView.queryset, "match_upcoming_date_idx")
+
+    def test_match_list(self):
+        self.assertUsesIndex(MatchListView.queryset[:50], "match_date_idx")
+
+    def assertPageUsesIndex(self, view, index: str):
+        # A page deep into the list, after the cursor of an arbitrary match
+        queryset = view.queryset.all()
+        paginator = KeysetPagination()
+        paginator.ordering = paginator._ordering(queryset)
+        row = queryset[queryset.count() // 2]
+        after = paginator._after([getattr(row, name) for name, _ in paginator.ordering])
+        self.assertUsesIndex(queryset.filter(after)[:51], index)
+
+    def test_upcoming_matches_page(self):
+        self.assertPageUsesIndex(UpcomingMatchView, "match_upcoming_date_idx")
+
+    def test_match_list_page(self):
+        self.assertPageUsesIndex(MatchListView, "match_date_idx")
+
+    def test_team_matches(self):
+        self.assertUsesIndex(
+            Match.objects.filter(team1=self.team).order_by("-date_played"),
+            "match_team1_date_idx",
+        )
+        self.assertUsesIndex(
+            Match.objects.filter(team2=self.team).order_by("-date_played"),
+            "match_team2_date_idx",
+        )
+
+    def test_player_stats(self):
+        # Either the player foreign key index or the one behind unique_together = ("player", "map")
+        plan = PlayerStats.objects.filter(player=self.player).explain()
+        self.assertRegex(plan, r"SEARCH vlr_data_playerstats USING (COVERING )?INDEX \S+ \(player_id=\?")
+
+
+# The rows are only in the test's transaction, which a replica's connection cannot see
+@mock.patch.object(routers, "replica_is_fresh", lambda: False)
+class MatchPaginationTests(TestCase):
+    """Checks the match list endpoints page through every match once, in order, in one query per page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        event = Event.objects.create(name="Event", series="Series", vlr_url="https://www.vlr.gg/event/1/")
+        teams = Team.objects.bulk_create(
+            Team(name=f"Team {i}", team_tag=f"T{i}", team_logo_url="", team_rating=i, vlr_id=str(i), last_updated=now)
+            for i in range(4)
+        )
+        # Pairs of matches at the same time, so pages have to break ties on the VLR ID
+        Match.objects.bulk_create(
+            Match(
+                event=event,
+                team1=teams[i % 4],
+                team2=teams[(i + 1) % 4],
+                date_played=now + datetime.timedelta(hours=i // 2 - 5),
+                vlr_id=str(100 + i),
+                is_finished=i < 10,
+                team1_score=2,
+                team2_score=0,
+            )
+            for i in range(20)
+        )
+
+    def walk(self, url: str, page_size: int):
+        vlr_ids = []
+        url = f"{url}?page_size={page_size}"
+        while url:
+            with self.assertNumQueries(1):
+                page = self.client.get(url).json()
+            self.assertLessEqual(len(page["results"]), page_size)
+            vlr_ids += [match["vlr_id"] for match in page["results"]]
+            url = page["next"]
+        return vlr_ids
+
+    def test_match_list(self):
+        expected = list(
+            Match.objects.order_by("-date_played", "-vlr_id").values_list("vlr_id", flat=True)
+        )
+        for page_size in (1, 3, 7, 20, 50):
+            self.assertEqual(self.walk(reverse("match_list"), page_size), expected)
+
+    def test_upcoming_matches(self):
+        expected = list(
+            Match.objects.filter(is_finished=False).order_by("date_played", "vlr_id").values_list("vlr_id", flat=True)
+        )
+        for page_size in (1, 3, 10):
+            self.assertEqual(self.walk(reverse("upcoming_matches"), page_size), expected)
+
+    def test_invalid_cursor(self):
+        for cursor in ("not-base64!", "bm90IGpzb24=", "WyJub3QgYSBkYXRlIiwgIjEiXQ=="):
+            response = self.client.get(reverse("match_list"), {"cursor": cursor})
+            self.assertEqual(response.status_code, 404)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "COPY is PostgreSQL only, run it with runtests_postgres.py")
+class CopyUpsertTests(TestCase):
+    """Checks bulk upserts streamed with COPY store the same rows as bulk_create would"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        event = Event.objects.create(name="Event", series="Series", vlr_url="https://www.vlr.gg/event/1/")
+        team = Team.objects.create(
+            name="Team", team_tag="T", team_logo_url="", team_rating=1, vlr_id="1", last_updated=now
+        )
+        cls.match = Match.objects.create(
+            event=event,
+            team1=team,
+            team2=team,
+            date_played=now,
+            vlr_id="1",
+            is_finished=True,
+            team1_score=2,
+            team2_score=0,
+        )
+        cls.players = Player.objects.bulk_create(
+            Player(ign=f"Player {i}", real_name="", team=team, vlr_id=str(i), last_updated=now)
+            for i in range(10)
+        )
+        cls.ascent = MapName.objects.create(name="Ascent")
+        cls.jett = Agent.objects.create(name="Jett")
+        cls.sova = Agent.objects.create(name="Sova")
+
+    def upsert_maps(self, count: int, team1_score: int):
+        return bulk.bulk_upsert(
+            Map,
+            [
+                Map(match=self.match, name=self.ascent, map_number=i + 1, game_id=str(i), team1_score=team1_score, team2_score=11)
+                for i in range(count)
+            ],
+            unique_fields=["game_id"],
+            update_fields=["match", "name", "map_number", "team1_score", "team2_score"],
+        )
+
+    def upsert_stats(self, maps, kills: int, agent: Agent):
+        return bulk.bulk_upsert(
+            PlayerStats,
+            [
+                PlayerStats(player=player, map=game, kills=kills, deaths=15, assists=5, acs=250, agent=agent)
+                for game in maps
+                for player in self.players
+            ],
+            unique_fields=["player", "map"],
+            update_fields=["kills", "deaths", "assists", "acs", "agent"],
+        )
+
+    def test_inserts_then_updates(self):
+        with mock.patch.object(bulk, "COPY_MIN_ROWS", 1), mock.patch.object(
+            bulk, "_copy_upsert", wraps=bulk._copy_upsert
+        ) as copy_upsert:
+            maps = self.upsert_maps(5, 13)
+            stats = self.upsert_stats(maps, 20, self.jett)
+            self.assertEqual(
+                {row.pk for row in stats}, set(PlayerStats.objects.values_list("pk", flat=True))
+            )
+
+            # The staging tables are reused within the same transaction
+            updated_maps = self.upsert_maps(5, 10)
+            updated_stats = self.upsert_stats(updated_maps, 25, self.sova)
+
+        self.assertEqual(copy_upsert.call_count, 4)
+        self.assertEqual([row.pk for row in updated_maps], [row.pk for row in maps])
+        self.assertEqual([row.pk for row in updated_stats], [row.pk for row in stats])
+        self.assertEqual(Map.objects.filter(team1_score=10).count(), 5)
+        self.assertEqual(PlayerStats.objects.filter(kills=25, agent=self.sova).count(), 50)
+
+    def test_small_batches_are_inserted(self):
+        with mock.patch.object(bulk, "_copy_upsert") as copy_upsert:
+            self.upsert_maps(bulk.COPY_MIN_ROWS - 1, 13)
+        copy_upsert.assert_not_called()
+        self.assertEqual(Map.objects.count(), bulk.COPY_MIN_ROWS - 1)
+
+
+class RetryPolicyTests(SimpleTestCase):
+    """Checks responses are classified by status, and backoffs and Retry-After waits are bounded"""
+
+    def test_classify(self):
+        policy = RetryPolicy()
+        for outcome, statuses in (
+            (SUCCESS, (200, 304)),
+            (RATE_LIMITED, (429,)),
+            (RETRY, (408, 425, 500, 502, 503)),
+            (PERMANENT, (400, 403, 404, 410)),
+        ):
+            for status in statuses:
+                with self.subTest(status):
+                    self.assertEqual(policy.classify(status), outcome)
+
+    def test_backoff(self):
+        policy = RetryPolicy(base_delay=1, max_delay=10)
+        # The upper bound of the jitter, which doubles per attempt up to max_delay
+        with mock.patch("random.uniform", side_effect=lambda low, high: high):
+            self.assertEqual([policy.backoff(attempt) for attempt in range(6)], [1, 2, 4, 8, 10, 10])
+        for attempt in range(6):
+            self.assertTrue(0 <= policy.backoff(attempt) <= 10)
+
+    def test_retry_after(self):
+        policy = RetryPolicy(max_retry_after=60)
+        self.assertEqual(policy.retry_after({"Retry-After": "5"}), 5)
+        self.assertEqual(policy.retry_after({"Retry-After": "3600"}), 60)
+        self.assertEqual(policy.retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}), 0)
+        self.assertIsNone(policy.retry_after({"Retry-After": "soon"}))
+        self.assertIsNone(policy.retry_after({}))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """Checks the circuit opens after consecutive failures, and only one probe goes through once half open"""
+
+    def open_breaker(self, cooldown: float) -> CircuitBreaker:
+        breaker = CircuitBreaker(failure_threshold=2, cooldown=cooldown)
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+        with self.assertLogs("vlr_data.scrapers.retry", "WARNING"):
+            breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        return breaker
+
+    def test_single_probe(self):
+        async def run():
+            breaker = self.open_breaker(cooldown=0.05)
+            waiters = [asyncio.create_task(breaker.wait()) for _ in range(3)]
+            await asyncio.sleep(0.1)
+            self.assertEqual([waiter.result() for waiter in waiters if waiter.done()], [True])
+
+            # The probe failed: the others wait out the doubled cooldown, then one of them probes
+            with self.assertLogs("vlr_data.scrapers.retry", "WARNING"):
+                breaker.record_failure()
+            self.assertEqual(breaker.cooldown, 0.1)
+            await asyncio.sleep(0.05)
+            self.assertEqual(sum(waiter.done() for waiter in waiters), 1)
+            await asyncio.sleep(0.1)
+            self.assertEqual([waiter.result() for waiter in waiters if waiter.done()], [True, True])
+
+            # The probe succeeded: the last one goes through without probing
+            breaker.record_success()
+            (last,) = [waiter for waiter in waiters if not waiter.done()]
+            self.assertFalse(await last)
+            self.assertFalse(await breaker.wait())
+
+        asyncio.run(run())
+
+    def test_probe_without_outcome(self):
+        async def run():
+            breaker = self.open_breaker(cooldown=0.01)
+            self.assertTrue(await breaker.wait())
+            waiter = asyncio.create_task(breaker.wait())
+            await asyncio.sleep(0.02)
+            self.assertFalse(waiter.done())
+
+            # e.g. the probe got a 404 or was cancelled, so the next request probes instead
+            breaker.end_probe()
+            self.assertTrue(await waiter)
+
+        asyncio.run(run())
+
+    def test_waiting_host_frees_slot(self):
+        limited, other = "https://www.vlr.gg/matches", "https://owcdn.net/img/1.png"
+        responses = {
+            limited: [
+                mock.Mock(status_code=429, headers={"Retry-After": "1"}),
+                mock.Mock(status_code=200, content=b"matches"),
+            ],
+            other: [mock.Mock(status_code=200, content=b"image")],
+        }
+
+        async def run():
+            client = AsyncVLRClient(sleep=0, concurrency=1)
+            with mock.patch.object(
+                client, "_request", mock.AsyncMock(side_effect=lambda url, headers: responses[url].pop(0))
+            ), self.assertLogs("vlr_data.scrapers.async_client", "WARNING"):
+                waiting = asyncio.create_task(client.fetch(limited))
+                await asyncio.sleep(0.05)
+                # The only slot is free while the first host waits out its Retry-After
+                self.assertEqual(await asyncio.wait_for(client.fetch(other), 0.5), b"image")
+                self.assertFalse(waiting.done())
+                self.assertEqual(await waiting, b"matches")
+
+        asyncio.run(run())
+
+
+class FakeClock:
+    """Stands in for time.monotonic and asyncio.sleep, so waiting advances the clock instantly"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.now += seconds
+
+
+class TokenBucketTests(SimpleTestCase):
+    """Checks requests to a host burst up to the bucket's capacity, then go out at its rate"""
+
+    def acquire_times(self, bucket: TokenBucket, clock: FakeClock, count: int):
+        async def run():
+            times = []
+            for _ in range(count):
+                await bucket.acquire()
+                times.append(clock.now)
+            return times
+
+        with mock.patch.object(async_client.asyncio, "sleep", clock.sleep):
+            return asyncio.run(run())
+
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        with mock.patch.object(async_client, "time", clock):
+            bucket = TokenBucket(rate=2, capacity=3)
+            self.assertEqual(self.acquire_times(bucket, clock, 6), [0, 0, 0, 0.5, 1, 1.5])
+
+            # An idle host only builds up a burst of capacity requests, however long it was idle
+            clock.now += 60
+            self.assertEqual(self.acquire_times(bucket, clock, 4), [61.5, 61.5, 61.5, 62])
+
+    def test_client_buckets_per_host(self):
+        client = AsyncVLRClient(sleep=0.5, burst=2)
+        bucket = client._bucket("https://www.vlr.gg/team/2/sentinels")
+        self.assertIs(client._bucket("https://www.vlr.gg/player/1/a"), bucket)
+        self.assertIsNot(client._bucket("https://owcdn.net/img/1.png"), bucket)
+        self.assertEqual((bucket.rate, bucket.capacity), (2, 2))
+
+        # No sleep between requests disables limiting
+        clock = FakeClock()
+        with mock.patch.object(async_client, "time", clock):
+            bucket = AsyncVLRClient(sleep=0)._bucket("https://www.vlr.gg/")
+            self.assertEqual(self.acquire_times(bucket, clock, 3), [0, 0, 0])
+
+
+def load_page(name: str) -> bytes:
+    return (Path(__file__).parent / "test_pages" / name).read_bytes()
+
+
+class ParserBackendTests(SimpleTestCase):
+    """Checks every parser backend, the match page SoupStrainer and both map extractors give the same records"""
+
+    PARSERS = {
+        "match.html": parse_match_page,
+        "match_upcoming.html": parse_match_page,
+        "team.html": parse_team_page,
+        "player.html": parse_player_page,
+        "event.html": parse_event_page,
+    }
+
+    def test_backends_match_html_parser(self):
+        for name, parser in self.PARSERS.items():
+            with self.subTest(name):
+                self.assertEqual(verify_backends(load_page(name), parser), [])
+
+    def test_strainer_keeps_match_page(self):
+        for name in ("match.html", "match_upcoming.html"):
+            with self.subTest(name):
+                content = load_page(name)
+                self.assertEqual(
+                    parse_match_page(parse_html(content, HTML_PARSER, MATCH_PAGE_STRAINER)),
+                    parse_match_page(parse_html(content, HTML_PARSER)),
+                )
+
+    def test_map_extractors_agree(self):
+        content = load_page("match.html")
+        soups = {backend: parse_html(content, backend) for backend in BACKENDS}
+        soups["strained"] = parse_html(content, HTML_PARSER, MATCH_PAGE_STRAINER)
+        expected = extract_maps_by_selectors(soups[HTML_PARSER])
+        self.assertEqual([(m.game_id, m.map_played) for m in expected], [("1000", "Ascent"), ("1001", "Bind")])
+        self.assertEqual([len(m.team_1_stats + m.team_2_stats) for m in expected], [10, 10])
+        for name, soup in soups.items():
+            with self.subTest(name):
+                self.assertEqual(extract_maps(soup), expected)
+                self.assertEqual(extract_maps_by_selectors(soup), expected)
+
+
+class ResponseCacheTests(SimpleTestCase):
+    """Checks cached pages expire by kind, are evicted least recently used first, and are revalidated with 304s"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = ResponseCache(directory.name)
+        self.addCleanup(self.cache.close)
+
+    def test_ttl(self):
+        self.assertIsNone(default_ttl("https://www.vlr.gg/100/sen-vs-g2", load_page("match.html")))
+        self.assertEqual(default_ttl("https://www.vlr.gg/100/sen-vs-g2", load_page("match_upcoming.html")), MINUTE)
+        self.assertEqual(default_ttl("https://www.vlr.gg/team/2/sentinels", load_page("team.html")), DAY)
+
+        self.cache.store("https://www.vlr.gg/100/sen-vs-g2", load_page("match.html"), {})
+        self.cache.store("https://www.vlr.gg/200/sen-vs-g2", load_page("match_upcoming.html"), {})
+        finished = self.cache.lookup("https://www.vlr.gg/100/sen-vs-g2")
+        upcoming = self.cache.lookup("https://www.vlr.gg/200/sen-vs-g2")
+        self.assertEqual(finished.content, load_page("match.html"))
+        self.assertTrue(finished.is_fresh(now=time.time() + 365 * DAY))
+        self.assertTrue(upcoming.is_fresh())
+        self.assertFalse(upcoming.is_fresh(now=time.time() + MINUTE + 1))
+
+    def test_eviction(self):
+        cache = ResponseCache(self.cache.path / "small", max_bytes=250)
+        self.addCleanup(cache.close)
+        urls = [f"https://www.vlr.gg/team/{i}/t" for i in range(3)]
+        # Incompressible bodies of a bit over 100 bytes each, so only two fit
+        with mock.patch("time.time", side_effect=range(1000, 2000)):
+            for url in urls[:2]:
+                cache.store(url, os.urandom(100), {})
+            cache.lookup(urls[0])
+            cache.store(urls[2], os.urandom(100), {})
+
+        self.assertIsNotNone(cache.lookup(urls[0]))
+        self.assertIsNone(cache.lookup(urls[1]))
+        self.assertIsNotNone(cache.lookup(urls[2]))
+        self.assertEqual(len([path for path in cache.blob_dir.rglob("*") if path.is_file()]), 2)
+
+    def test_refresh_keeps_ttl_without_reading_body(self):
+        url = "https://www.vlr.gg/200/sen-vs-g2"
+        with mock.patch("time.time", return_value=1000):
+            self.cache.store(url, load_page("match_upcoming.html"), {"ETag": '"a"'})
+        with mock.patch("time.time", return_value=5000), mock.patch("zlib.decompress") as decompress:
+            self.cache.refresh(url, {"ETag": '"b"'})
+        decompress.assert_not_called()
+
+        cached = self.cache.lookup(url)
+        self.assertEqual((cached.fetched_at, cached.expires_at), (5000, 5000 + MINUTE))
+        self.assertEqual(cached.revalidation_headers(), {"If-None-Match": '"b"'})
+
+    def test_revalidation(self):
+        url = "https://www.vlr.gg/200/sen-vs-g2"
+        with mock.patch("time.time", return_value=1000):
+            self.cache.store(url, load_page("match_upcoming.html"), {"ETag": '"a"'})
+
+        client = AsyncVLRClient(sleep=0, cache=self.cache)
+        response = mock.Mock(status_code=304, headers={"ETag": '"a"'})
+        with mock.patch.object(client, "_request", mock.AsyncMock(return_value=response)) as request:
+            content = asyncio.run(client.fetch(url))
+        request.assert_called_once_with(url, {"If-None-Match": '"a"'})
+        self.assertEqual(content, load_page("match_upcoming.html"))
+        self.assertTrue(self.cache.lookup(url).is_fresh())
+
+
+class ArchiveTests(SimpleTestCase):
+    """Checks an archive left without its footer or with a corrupt index is recovered by scanning its records"""
+
+    PAGES = {
+        "https://www.vlr.gg/100/sen-vs-g2": load_page("match.html"),
+        "https://www.vlr.gg/team/2/sentinels": load_page("team.html"),
+        "https://www.vlr.gg/player/2/zekken": load_page("player.html"),
+    }
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "pages.vlrarc"
+
+    def record_without_closing(self) -> ArchiveWriter:
+        writer = ArchiveWriter(self.path)
+        for url, content in self.PAGES.items():
+            writer.record(url, content)
+        writer.record("https://www.vlr.gg/100/sen-vs-g2", b"newer copy")
+        writer._file.flush()
+        self.addCleanup(writer._file.close)
+        return writer
+
+    def assertArchived(self, pages: dict):
+        with ArchiveReader(self.path) as reader:
+            self.assertEqual(dict(reader), pages)
+
+    def test_recovers_without_footer(self):
+        # The writer crashed before writing the index, partway through another record
+        writer = self.record_without_closing()
+        partial = _encode_record("https://www.vlr.gg/event/2097/champions", load_page("event.html"), datetime.datetime.now())
+        writer._file.write(partial[: len(partial) // 2])
+        writer._file.flush()
+
+        expected = {**self.PAGES, "https://www.vlr.gg/100/sen-vs-g2": b"newer copy"}
+        self.assertArchived(expected)
+
+        # Reopening drops the partial record and appends after the last whole one
+        with ArchiveWriter(self.path) as writer:
+            self.assertEqual(writer.index.keys(), expected.keys())
+            writer.record("https://www.vlr.gg/event/2097/champions", b"event")
+        self.assertArchived({**expected, "https://www.vlr.gg/event/2097/champions": b"event"})
+
+    def test_recovers_from_corrupt_index(self):
+        with ArchiveWriter(self.path) as writer:
+            for url, content in self.PAGES.items():
+                writer.record(url, content)
+        # The index member starts right after the last record
+        offset, length = writer.index["https://www.vlr.gg/player/2/zekken"]
+        with open(self.path, "r+b") as f:
+            f.seek(offset + length + 10)
+            f.write(b"\x00" * 8)
+        self.assertArchived(self.PAGES)
+
+        # A footer pointing past the end of the file
+        with open(self.path, "r+b") as f:
+            f.seek(-_FOOTER.size, io.SEEK_END)
+            f.write(_FOOTER.pack(MAGIC, 1 << 40))
+        self.assertArchived(self.PAGES)
+
+
+class FingerprintTests(SimpleTestCase):
+    """Checks a page's fingerprint ignores scripts, ads, countdowns, relative times and asset versions, but not its data"""
+
+    def page(self, script="1", ad="A", countdown="2h 38m", posted="3 hours", version="31", replacements=()) -> bytes:
+        """Gets the test match with the parts that vary between fetches filled in"""
+        page = load_page("match.html").decode()
+        page = page.replace("var x=", f"var slot={script}; var x=")
+        page = page.replace(
+            '<ins class="adsbygoogle"></ins>',
+            f'<ins class="adsbygoogle"><div><a href="/sponsor/{ad}"><img src="/ads/{ad}.png"></a></div>Sponsor {ad}</ins>',
+        )
+        page = page.replace("<body>", f'<body><link rel="stylesheet" href="/css/base.css?v={version}"><div id="wf-ad-{ad}"><div>Ad {ad}</div></div>')
+        page = page.replace(
+            '<div class="match-header-vs-note">Bo3</div>',
+            f'<div class="match-header-vs-note">Bo3</div><span class="match-header-vs-note mod-upcoming">{countdown}</span>',
+        )
+        page = page.replace("posted 3 hours ago", f"posted {posted} ago")
+        for old, new in replacements:
+            page = page.replace(old, new)
+        return page.encode()
+
+    def test_volatile_parts_are_ignored(self):
+        expected = fingerprint(self.page())
+        for name, page in (
+            ("script", self.page(script="2")),
+            ("ad", self.page(ad="B")),
+            ("countdown", self.page(countdown="1d 4h")),
+            ("ago", self.page(posted="5m")),
+            ("version", self.page(version="32")),
+            ("all", self.page(script="3", ad="C", countdown="15m", posted="2 days", version="40")),
+        ):
+            with self.subTest(name):
+                self.assertEqual(fingerprint(page), expected)
+
+    def test_data_changes_are_kept(self):
+        expected = fingerprint(self.page())
+        for name, replacements in (
+            ("score", [('match-header-vs-score-winner">2<', 'match-header-vs-score-winner">1<')]),
+            ("roster", [("/player/1/p1", "/player/9/p9")]),
+            ("kills", [('mod-both">14<', 'mod-both">15<')]),
+        ):
+            with self.subTest(name):
+                self.assertNotEqual(fingerprint(self.page(replacements=replacements)), expected)
+
+
+class PageClient:
+    """Serves pages from memory in place of an AsyncVLRClient"""
+
+    concurrency = 2
+
+    def __init__(self, pages: dict):
+        self.pages = pages
+        self.fetched = []
+
+    async def fetch(self, url: str) -> bytes:
+        self.fetched.append(url)
+        return self.pages[url]
+
+
+def team_record(*player_urls: str) -> TeamRecord:
+    return TeamRecord(
+        team_name="Team",
+        team_tag="T",
+        team_logo_url="",
+        team_rating=1,
+        players=[PlayerRecord(ign=f"Player {i}", real_name="", url=url) for i, url in enumerate(player_urls)],
+    )
+
+
+class SiteClient(PageClient):
+    """Serves the test page of a URL's kind for the URLs not given, and parses pages for get()"""
+
+    FALLBACKS = {"/team/": "team.html", "/player/": "player.html", "/event/": "event.html"}
+
+    async def fetch(self, url: str) -> bytes:
+        if url in self.pages:
+            return await super().fetch(url)
+        for kind, name in self.FALLBACKS.items():
+            if kind in url and "/matches/" not in url:
+                self.fetched.append(url)
+                return load_page(name)
+        raise KeyError(url)
+
+    async def get(self, url: str):
+        return parse_html(await self.fetch(url))
+
+
+def clear_caches():
+    # Earlier tests' rows are flushed without the signals that keep the caches up to date
+    for cache in (identity_map, agents, map_names):
+        cache.clear()
+
+
+def ingest_pages(pages: dict, urls):
+    """Runs the URLs through the pipeline, serving test pages for the teams, players and events they need"""
+    pipeline = Pipeline(SiteClient(pages), workers=1)
+    return asyncio.run(pipeline.run(urls))
+
+
+def match_page(
+    team_1: str = "/team/2/sentinels",
+    team_2: str = "/team/1/g2",
+    game_ids=("1000", "1001"),
+    date: str = "2024-08-25 14:00:00",
+    event: str = "/event/2097/champions/playoffs",
+    replacements=(),
+) -> bytes:
+    """Gets the finished test match (team_1 wins 2:0) between other teams, on other maps, at another event, or with other stats"""
+    page = load_page("match.html").decode()
+    page = page.replace("/event/2097/champions/playoffs", event)
+    page = page.replace("/team/2/sentinels", "{team_1}").replace("/team/1/g2", "{team_2}")
+    page = page.replace("{team_1}", team_1).replace("{team_2}", team_2)
+    page = page.replace('data-game-id="1000"', f'data-game-id="{game_ids[0]}"')
+    page = page.replace('data-game-id="1001"', f'data-game-id="{game_ids[1]}"')
+    page = page.replace("2024-08-25 14:00:00", date)
+    for old, new in replacements:
+        page = page.replace(old, new)
+    return page.encode()
+
+
+def table_rows(*models) -> dict:
+    """Gets every row of the models without their surrogate keys, for comparing tables rebuilt from scratch"""
+    return {
+        model.__name__: sorted(
+            tuple(row.values()) for row in model.objects.values(*[
+                field.attname for field in model._meta.concrete_fields if field.name != "id"
+            ])
+        )
+        for model in models
+    }
+
+
+def matches_page(match_urls, pages: int) -> bytes:
+    cards = "".join(f'<a class="wf-card fc-flex m-item" href="{url}"></a>' for url in match_urls)
+    buttons = "".join(f'<a class="btn mod-page" href="?page={n}">{n}</a>' for n in range(1, pages + 1))
+    return f'<html><body>{cards}<div class="action-container"><div>{buttons}</div></div></body></html>'.encode()
+
+
+class IngestWriterTests(TransactionTestCase):
+    """Checks a page that fails to ingest is rolled back and reported, without failing the rest of its batch"""
+
+    def test_failed_page(self):
+        with self.assertLogs("vlr_data.scrapers.writer", "ERROR") as logs, IngestWriter(linger=0.5) as writer:
+            good = writer.submit(url_types.TEAM, team_record("https://www.vlr.gg/player/1/a"), "https://www.vlr.gg/team/1/a")
+            bad = writer.submit(url_types.TEAM, team_record("https://www.vlr.gg/not-a-player"), "https://www.vlr.gg/team/2/b")
+            self.assertTrue(good.result())
+            self.assertIsInstance(bad.exception(), ValueError)
+
+        self.assertEqual([r.getMessage() for r in logs.records], ["Error ingesting https://www.vlr.gg/team/2/b"])
+        self.assertEqual(writer.stats.batches, 1)
+        self.assertEqual(list(Team.objects.values_list("vlr_id", flat=True)), ["1"])
+        self.assertEqual(list(Player.objects.values_list("vlr_id", flat=True)), ["1"])
+
+
+class PipelineTests(TransactionTestCase):
+    """Checks pages go through the pipeline, and failed ones are retried on the next run"""
+
+    def run_pipeline(self, pages: dict, urls, **kwargs):
+        pipeline = Pipeline(PageClient(pages), workers=1, **kwargs)
+        return asyncio.run(pipeline.run(urls))
+
+    def test_failed_page_is_not_fingerprinted(self):
+        good = "https://www.vlr.gg/team/2/sentinels"
+        bad = "https://www.vlr.gg/team/3/broken"
+        pages = {
+            good: load_page("team.html"),
+            # A roster link ingest cannot get a player ID from
+            bad: load_page("team.html").replace(b"/player/2/zekken", b"/players/zekken"),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            with FingerprintStore(os.path.join(directory, "fingerprints.sqlite3")) as fingerprints:
+                with self.assertLogs("vlr_data.scrapers", "WARNING"):
+                    stats = self.run_pipeline(pages, [good, bad], fingerprints=fingerprints)
+                self.assertEqual((stats.ingested, stats.failed), (1, 1))
+                self.assertIsNotNone(fingerprints.get(good))
+                self.assertIsNone(fingerprints.get(bad))
+
+                # The good page is skipped as unchanged, the failed one is parsed and ingested again
+                with self.assertLogs("vlr_data.scrapers", "WARNING"):
+                    stats = self.run_pipeline(pages, [good, bad], fingerprints=fingerprints)
+                self.assertEqual((stats.skipped, stats.parsed, stats.failed), (1, 1, 1))
+
+        self.assertEqual(list(Team.objects.values_list("vlr_id", flat=True)), ["2"])
+
+    def test_queues_hold_back_fetching(self):
+        urls = [f"https://www.vlr.gg/team/{i}/team" for i in range(1, 21)]
+        client = PageClient({url: load_page("team.html") for url in urls})
+        release = asyncio.Event()
+
+        async def on_parsed(url, kind, data):
+            await release.wait()
+
+        async def run(writer: IngestWriter):
+            pipeline = Pipeline(client, workers=1, queue_size=1, on_parsed=on_parsed, writer=writer)
+            task = asyncio.create_task(pipeline.run(urls))
+            # Long enough for the fetchers to get through every page if nothing held them back
+            await asyncio.sleep(1)
+            fetched = len(client.fetched)
+            release.set()
+            return fetched, await task
+
+        with IngestWriter(batch_size=2) as writer:
+            fetched, stats = asyncio.run(run(writer))
+        # A page held by each writer task, parser and fetcher, and one in each queue
+        self.assertLessEqual(fetched, writer.batch_size + 1 + 1 + 1 + client.concurrency)
+        self.assertEqual((stats.fetched, stats.ingested), (20, 20))
+        self.assertEqual(Team.objects.count(), 20)
+
+
+class DependencyTests(TransactionTestCase):
+    """Checks a page with missing dependencies is set aside while they go through the pipeline, and replayed after"""
+
+    MATCH = "https://www.vlr.gg/100/sen-vs-g2"
+
+    def setUp(self):
+        clear_caches()
+
+    def run_pipeline(self, pages: dict, **kwargs):
+        client = SiteClient(pages)
+        finished = {}
+        pipeline = Pipeline(client, workers=1, on_finished=finished.__setitem__, **kwargs)
+        stats = asyncio.run(pipeline.run([self.MATCH]))
+        return client.fetched, finished, stats
+
+    def test_dependencies_are_fetched(self):
+        fetched, finished, stats = self.run_pipeline({self.MATCH: match_page()})
+
+        self.assertTrue(finished[self.MATCH])
+        # Players fetched before their team is ingested are set aside too
+        self.assertGreaterEqual(stats.deferred, 1)
+        # The match, its event, its two teams and their ten players, each once
+        self.assertEqual(len(fetched), 14)
+        self.assertEqual(len(set(fetched)), 14)
+        self.assertTrue(all(finished.values()))
+        self.assertEqual(Map.objects.filter(match__vlr_id="100").count(), 2)
+
+    def test_failed_dependency(self):
+        team = "https://www.vlr.gg/team/2/sentinels"
+        pages = {
+            self.MATCH: match_page(),
+            # A roster link ingest cannot get a player ID from
+            team: load_page("team.html").replace(b"/player/2/zekken", b"/players/zekken"),
+        }
+        with self.assertLogs("vlr_data.scrapers", "WARNING"):
+            fetched, finished, stats = self.run_pipeline(pages)
+
+        # The match is replayed once its dependencies are out, then fails without fetching the team again
+        self.assertFalse(finished[team])
+        self.assertFalse(finished[self.MATCH])
+        self.assertGreaterEqual(stats.deferred, 1)
+        self.assertEqual(fetched.count(team), 1)
+        self.assertFalse(Match.objects.exists())
+
+    def test_max_deferrals(self):
+        with self.assertLogs("vlr_data.scrapers", "WARNING"):
+            fetched, finished, stats = self.run_pipeline({self.MATCH: match_page()}, max_deferrals=0)
+        self.assertEqual(fetched, [self.MATCH])
+        self.assertEqual(finished, {self.MATCH: False})
+        self.assertEqual((stats.deferred, stats.failed), (0, 1))
+
+
+class RecordTests(SimpleTestCase):
+    """Checks parsers return typed records with numbers already converted, which survive the trip back from a worker process"""
+
+    def test_match_record(self):
+        kind, match = parse_page("https://www.vlr.gg/100/sen-vs-g2", load_page("match.html"))
+        self.assertEqual(kind, url_types.MATCH)
+        self.assertIsInstance(match, MatchRecord)
+        self.assertEqual((match.team_1_match_score, match.team_2_match_score, match.maps_played), (2, 0, 2))
+        self.assertEqual([(game.team_1_score, game.team_2_score) for game in match.maps], [(13, 7), (13, 8)])
+        self.assertEqual(
+            match.maps[0].team_1_stats[0],
+            PlayerStatLine(player="https://www.vlr.gg/player/1/p1", kills=14, deaths=5, assists=13, agent_played="Jett", acs=336),
+        )
+        self.assertEqual(pickle.loads(pickle.dumps(match)), match)
+        self.assertFalse(hasattr(match, "__dict__"))
+
+    def test_team_record(self):
+        kind, team = parse_page("https://www.vlr.gg/team/2/sentinels", load_page("team.html"))
+        self.assertEqual(kind, url_types.TEAM)
+        self.assertIsInstance(team, TeamRecord)
+        self.assertEqual(team.team_rating, 1523)
+        self.assertTrue(all(isinstance(player, PlayerRecord) for player in team.players))
+        self.assertEqual(pickle.loads(pickle.dumps(team)), team)
+
+    def test_to_int(self):
+        for text, number in (("13", 13), (" 1,523 ", 1523), ("", 0), ("-", 0)):
+            with self.subTest(text):
+                self.assertEqual(to_int(text), number)
+
+
+class IdentityMapTests(TransactionTestCase):
+    """Checks the identity map only caches rows once the transaction that read them commits"""
+
+    def create_team(self, vlr_id: str) -> Team:
+        return Team.objects.create(
+            name="Team", team_tag="T", team_logo_url="", team_rating=1, vlr_id=vlr_id, last_updated=timezone.now()
+        )
+
+    def test_rolled_back_rows_are_not_cached(self):
+        identity_map = IdentityMap()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            team = self.create_team("1")
+            self.assertEqual(identity_map.get(Team, "1"), team.pk)
+            self.assertEqual(identity_map.warm([Team]), 1)
+            raise RuntimeError
+
+        self.assertIsNone(identity_map.get(Team, "1"))
+        self.assertEqual(identity_map.hits, 0)
+
+    def test_committed_rows_are_cached(self):
+        identity_map = IdentityMap()
+        with transaction.atomic():
+            team = self.create_team("1")
+            self.assertEqual(identity_map.get(Team, "1"), team.pk)
+        self.assertEqual(identity_map.get(Team, "1"), team.pk)
+        self.assertEqual((identity_map.hits, identity_map.misses), (1, 1))
+
+        # Outside of a transaction rows are cached right away
+        other = self.create_team("2")
+        identity_map.get(Team, "2")
+        self.assertEqual(identity_map.get(Team, "2"), other.pk)
+        self.assertEqual(identity_map.hits, 2)
+
+
+class TeamBackfillTests(TransactionTestCase):
+    """Checks failed matches are retried on the next run, and top-ups never lose a team's checkpoint"""
+
+    def setUp(self):
+        clear_caches()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "backfill.sqlite3")
+
+    def run_backfill(self, pages: dict) -> TeamBackfill:
+        backfill = TeamBackfill(SiteClient(pages), self.path, workers=1)
+        self.addCleanup(backfill.close)
+        asyncio.run(backfill.run(["2"]))
+        return backfill
+
+    def test_failed_matches_are_retried(self):
+        first, second, third = "/100/sen-vs-g2", "/200/sen-vs-g2", "/300/sen-vs-g2"
+        pages = {
+            team_matches_url("2", 1): matches_page([first], 2),
+            team_matches_url("2", 2): matches_page([second], 2),
+            "https://www.vlr.gg/100/sen-vs-g2": load_page("match.html"),
+        }
+
+        # The second match cannot be fetched, the history is still walked to its end
+        with self.assertLogs("vlr_data.scrapers", "WARNING"):
+            backfill = self.run_backfill(pages)
+        self.assertEqual((backfill.stats.matches, backfill.stats.failed_matches), (1, 1))
+        self.assertEqual(backfill._checkpoint("2"), (1, True))
+        self.assertEqual(backfill._failed_matches("2"), ["https://www.vlr.gg/200/sen-vs-g2"])
+
+        # The top-up stops at the first page, but retries the failed match
+        pages["https://www.vlr.gg/200/sen-vs-g2"] = load_page("match_upcoming.html")
+        backfill = self.run_backfill(pages)
+        self.assertEqual((backfill.stats.pages, backfill.stats.matches), (1, 1))
+        self.assertEqual(backfill._failed_matches("2"), [])
+        self.assertEqual(set(Match.objects.values_list("vlr_id", flat=True)), {"100", "200"})
+
+        # A top-up interrupted past its first page leaves the finished history as it was
+        pages[team_matches_url("2", 1)] = matches_page([third], 3)
+        del pages[team_matches_url("2", 2)]
+        pages["https://www.vlr.gg/300/sen-vs-g2"] = load_page("match_upcoming.html")
+        with self.assertLogs("vlr_data.scrapers", "WARNING"):
+            backfill = self.run_backfill(pages)
+        self.assertEqual(backfill.stats.failed_teams, 1)
+        self.assertEqual(backfill._checkpoint("2"), (1, True))
+
+
+class PlayerAggregateTests(TransactionTestCase):
+    """Checks the player aggregates updated by ingest match a rebuild from scratch, after inserts and re-ingests"""
+
+    AGGREGATES = (PlayerCareer, PlayerAgentSplit, PlayerMapSplit)
+
+    def setUp(self):
+        clear_caches()
+
+    def assert_rebuilt_equal(self):
+        incremental = table_rows(*self.AGGREGATES)
+        rebuild_player_aggregates()
+        self.assertEqual(incremental, table_rows(*self.AGGREGATES))
+
+    def test_aggregates_match_rebuild(self):
+        pages = {
+            "https://www.vlr.gg/100/sen-vs-g2": match_page(),
+            "https://www.vlr.gg/200/sen-vs-fnc": match_page(team_2="/team/3/fnatic", game_ids=("2000", "2001")),
+        }
+        ingest_pages(pages, list(pages))
+        self.assertEqual(PlayerCareer.objects.get(player__vlr_id="1").maps_played, 4)
+        self.assert_rebuilt_equal()
+
+        # The first match re-ingested with corrected kills, agents and map, moving stats between splits
+        pages["https://www.vlr.gg/100/sen-vs-g2"] = match_page(replacements=[
+            ('alt="jett" title="Jett"', 'alt="raze" title="Raze"'),
+            ("Ascent\n", "Lotus\n"),
+            ('mod-vlr-kills"><span class="stats-sq"><span class="side mod-side mod-both">9<',
+             'mod-vlr-kills"><span class="stats-sq"><span class="side mod-side mod-both">19<'),
+        ])
+        ingest_pages(pages, ["https://www.vlr.gg/100/sen-vs-g2"])
+        self.assertTrue(PlayerAgentSplit.objects.filter(agent="Raze").exists())
+        self.assertTrue(PlayerMapSplit.objects.filter(map_name="Lotus").exists())
+        self.assert_rebuilt_equal()
+
+    def aggregate_queries(self, match, url: str) -> int:
+        tables = [model._meta.db_table for model in self.AGGREGATES]
+        with CaptureQueriesContext(connection) as queries:
+            ingest_match(match, url)
+        return len([query for query in queries if any(table in query["sql"] for table in tables)])
+
+    def test_queries_per_table(self):
+        # Ingested first for its event, teams and players
+        ingest_pages({"https://www.vlr.gg/100/sen-vs-g2": match_page()}, ["https://www.vlr.gg/100/sen-vs-g2"])
+        url = "https://www.vlr.gg/200/sen-vs-g2"
+        _, match = parse_page(url, match_page(game_ids=("2000", "2001")))
+        for game in match.maps:
+            game.map_played = "Lotus"
+
+        # A read and an upsert per table, however many stats rows the match has
+        self.assertEqual(self.aggregate_queries(match, url), 6)
+
+        # Every line changed and every map renamed: the emptied Lotus splits are deleted at once
+        for game in match.maps:
+            game.map_played = "Sunset"
+            for line in game.team_1_stats + game.team_2_stats:
+                line.kills += 1
+        self.assertEqual(self.aggregate_queries(match, url), 7)
+        self.assertFalse(PlayerMapSplit.objects.filter(map_name="Lotus").exists())
+        self.assert_rebuilt_equal()
+
+
+class TeamSummaryTests(TransactionTestCase):
+    """Checks team summaries refreshed after each commit match a rebuild from scratch, and rolled back matches are left out"""
+
+    SUMMARIES = (TeamSummary, TeamMapRecord, HeadToHead)
+
+    def setUp(self):
+        clear_caches()
+
+    def create_team(self, vlr_id: str) -> Team:
+        return Team.objects.create(
+            name="Team", team_tag="T", team_logo_url="", team_rating=1, vlr_id=vlr_id, last_updated=timezone.now()
+        )
+
+    def assert_rebuilt_equal(self):
+        incremental = table_rows(*self.SUMMARIES)
+        rebuild_team_summaries()
+        self.assertEqual(incremental, table_rows(*self.SUMMARIES))
+
+    def test_summaries_match_rebuild(self):
+        pages = {
+            "https://www.vlr.gg/100/sen-vs-g2": match_page(),
+            "https://www.vlr.gg/200/g2-vs-sen": match_page(
+                "/team/1/g2", "/team/2/sentinels", ("2000", "2001"), "2024-08-26 14:00:00"
+            ),
+            "https://www.vlr.gg/300/sen-vs-fnc": match_page(
+                team_2="/team/3/fnatic", game_ids=("3000", "3001"), date="2024-08-27 14:00:00"
+            ),
+        }
+        ingest_pages(pages, list(pages))
+        self.assertEqual(TeamSummary.objects.get(team__vlr_id="2").form, "WLW")
+        self.assertEqual(HeadToHead.objects.get(team_a__vlr_id__in="12", team_b__vlr_id__in="12").matches_played, 2)
+        self.assert_rebuilt_equal()
+
+        # The first match re-ingested with its teams corrected, which changes its winner
+        pages["https://www.vlr.gg/100/sen-vs-g2"] = match_page("/team/1/g2", "/team/2/sentinels")
+        ingest_pages(pages, ["https://www.vlr.gg/100/sen-vs-g2"])
+        self.assertEqual(TeamSummary.objects.get(team__vlr_id="2").form, "WLL")
+        self.assert_rebuilt_equal()
+
+    def test_rolled_back_pairs_are_not_refreshed(self):
+        team_1, team_2, team_3 = (self.create_team(vlr_id) for vlr_id in "123")
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            schedule_team_summaries(team_1.pk, team_2.pk)
+            raise RuntimeError
+
+        with transaction.atomic():
+            schedule_team_summaries(team_2.pk, team_3.pk)
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                schedule_team_summaries(team_1.pk, team_3.pk)
+                raise RuntimeError
+
+        self.assertEqual(sorted(TeamSummary.objects.values_list("team_id", flat=True)), [team_2.pk, team_3.pk])
+        self.assertEqual(list(HeadToHead.objects.values_list("team_a_id", "team_b_id")), [(team_2.pk, team_3.pk)])
+
+
+@unittest.skipUnless(replica_configured(), "Needs a replica, e.g. REPLICA_DATABASE_URL=sqlite:///replica.sqlite3")
+@override_settings(REPLICA_MAX_LAG=30, REPLICA_LAG_CHECK_INTERVAL=0)
+class ReplicaRouterTests(TransactionTestCase):
+    """Checks API reads go to the replica while it is fresh, and everything else to the primary
+
+    In tests the replica is a TEST MIRROR of the primary, so both hold the
+    same rows and only the connection a query went through tells them apart.
+    """
+
+    # Every configured database, which includes the replica when the tests are not skipped
+    databases = "__all__"
+
+    def setUp(self):
+        Team.objects.create(
+            name="Team", team_tag="T", team_logo_url="", team_rating=1, vlr_id="1", last_updated=timezone.now()
+        )
+        # Measure the lag again in the next test, rather than trust this one's
+        self.addCleanup(routers._freshness.update, checked=float("-inf"), fresh=False)
+
+    def get_teams(self, lag: float, **params):
+        """Gets the team list with the replica the given number of seconds behind, capturing each database's queries"""
+        with mock.patch.object(routers, "replica_lag", return_value=lag), \
+                CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get(reverse("team_list"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_fresh_replica(self):
+        primary, replica = self.get_teams(lag=1)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with self.assertLogs("vlr_data.routers", "WARNING"):
+            self.get_teams(lag=1)
+            primary, replica = self.get_teams(lag=31)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_primary_override(self):
+        primary, replica = self.get_teams(lag=0, primary="true")
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_writes_go_to_primary(self):
+        with mock.patch.object(routers, "replica_lag", return_value=0), read_from_replica(), \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            self.assertEqual(Team.objects.all().db, REPLICA)
+            team = Team.objects.get(vlr_id="1")
+            team.team_rating = 2
+            team.save()
+            Team.objects.filter(vlr_id="1").update(team_tag="TT")
+        self.assertEqual(len(replica), 1)
+        self.assertEqual(Team.objects.values_list("team_rating", "team_tag").get(), (2, "TT"))
+
+
+class ParquetExportTests(TransactionTestCase):
+    """Checks both partitionings export, re-export incrementally and load back into the analytics functions"""
+
+    def setUp(self):
+        clear_caches()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.pages = {
+            "https://www.vlr.gg/100/sen-vs-g2": match_page(),
+            "https://www.vlr.gg/200/sen-vs-g2": match_page(
+                game_ids=("2000", "2001"), date="2024-09-01 14:00:00", event="/event/2098/masters/playoffs"
+            ),
+            "https://www.vlr.gg/event/2098/masters/playoffs": (
+                load_page("event.html").replace(b"/event/2097/champions/", b"/event/2098/masters/")
+            ),
+        }
+        ingest_pages(self.pages, ["https://www.vlr.gg/100/sen-vs-g2", "https://www.vlr.gg/200/sen-vs-g2"])
+
+    def load_all(self, path: str) -> dict:
+        return {
+            dataset: sorted(analytics.load(path, dataset).to_pylist(), key=repr)
+            for dataset in ("matches", "maps", "player_stats")
+        }
+
+    def partitions(self, path: str) -> list:
+        return sorted(os.listdir(os.path.join(path, "matches")))
+
+    def test_partitionings(self):
+        for partition in (MONTH, EVENT):
+            with self.subTest(partition):
+                self.check_export(partition)
+
+    def check_export(self, partition: str):
+        key = PARTITION_KEYS[partition]
+        path = os.path.join(self.directory, partition)
+        events = dict(Event.objects.values_list("vlr_url", "pk"))
+        first = events["https://www.vlr.gg/event/2097/champions/playoffs"]
+        second = events["https://www.vlr.gg/event/2098/masters/playoffs"]
+        expected = {MONTH: ["month=2024-08", "month=2024-09"], EVENT: [f"event_id={first}", f"event_id={second}"]}
+
+        counts = ParquetExporter(path, partition).export()
+        self.assertEqual(counts, {"matches": 2, "maps": 4, "player_stats": 40, "partitions": 2})
+        self.assertEqual(self.partitions(path), expected[partition])
+
+        matches = analytics.load(path, "matches", filter=analytics.pc.field("event_id") == second)
+        self.assertEqual(matches.column("match_id").to_pylist(), ["200"])
+        self.assertEqual(matches.column(key).to_pylist(), ["2024-09" if partition == MONTH else second])
+        board = analytics.leaderboard(analytics.load(path), min_maps=1, top=100)
+        self.assertEqual(board.num_rows, 10)
+        self.assertEqual(set(board.column("maps_played").to_pylist()), {4})
+
+        # The first match moves to the second's month and event, emptying its old partition
+        self.pages["https://www.vlr.gg/100/sen-vs-g2"] = match_page(
+            date="2024-09-02 14:00:00", event="/event/2098/masters/playoffs"
+        )
+        ingest_pages(self.pages, ["https://www.vlr.gg/100/sen-vs-g2"])
+        counts = ParquetExporter(path, partition).export()
+        self.assertEqual(counts, {"matches": 2, "maps": 4, "player_stats": 40, "partitions": 2})
+        self.assertEqual(self.partitions(path), expected[partition][1:])
+
+        # Nothing changed since, so nothing is rewritten
+        self.assertEqual(ParquetExporter(path, partition).export()["partitions"], 0)
+
+        full = os.path.join(self.directory, f"{partition}-full")
+        ParquetExporter(full, partition).export()
+        self.assertEqual(self.load_all(path), self.load_all(full))
+
+        # Put the first match back for the other partitioning
+        self.pages["https://www.vlr.gg/100/sen-vs-g2"] = match_page()
+        ingest_pages(self.pages, ["https://www.vlr.gg/100/sen-vs-g2"])
+
+    def test_agent_distribution(self):
+        stats = analytics.pa.table({
+            "agent": ["Jett", "Sova", "Jett", "Jett", "Sova"],
+            "acs": [300, 200, 100, 200, 250],
+            "kills": [20, 10, 10, 15, 12],
+            "deaths": [10, 0, 20, 15, 12],
+        })
+        distribution = analytics.agent_distribution(stats).to_pylist()
+        # Quantiles interpolate linearly between each agent's sorted ACS values
+        expected = [
+            {"agent": "Jett", "picks": 3, "pick_rate": 0.6, "mean_acs": 200, "mean_kd": 3.5 / 3,
+             "acs_p10": 120, "acs_p25": 150, "acs_p50": 200, "acs_p75": 250, "acs_p90": 280},
+            # No deaths counts as one, so a 10/0 is a KD of 10
+            {"agent": "Sova", "picks": 2, "pick_rate": 0.4, "mean_acs": 225, "mean_kd": 5.5,
+             "acs_p10": 205, "acs_p25": 212.5, "acs_p50": 225, "acs_p75": 237.5, "acs_p90": 245},
+        ]
+        self.assertEqual(len(distribution), len(expected))
+        for row, expected_row in zip(distribution, expected):
+            self.assertEqual(row.keys(), expected_row.keys())
+            self.assertEqual(row.pop("agent"), expected_row.pop("agent"))
+            for name, value in expected_row.items():
+                self.assertAlmostEqual(row[name], value, msg=name)
+
+    def test_agent_distribution_without_rows(self):
+        path = os.path.join(self.directory, "export")
+        ParquetExporter(path).export()
+        stats = analytics.load(path, filter=analytics.pc.field("match_id") == "missing")
+        distribution = analytics.agent_distribution(stats, percentiles=(0.5,))
+        self.assertEqual(distribution.num_rows, 0)
+        self.assertEqual(
+            distribution.column_names, ["agent", "picks", "pick_rate", "mean_acs", "mean_kd", "acs_p50"]
+        )
+
+    def test_rolling_average(self):
+        day = datetime.datetime(2024, 8, 1)
+        stats = analytics.pa.table({
+            "player_id": [2, 1, 1, 2, 1],
+            "date_played": [day + datetime.timedelta(days=n) for n in (1, 2, 0, 0, 1)],
+            "game_id": ["5", "3", "1", "4", "2"],
+            "acs": [150, 400, 100, 50, 200],
+        })
+        rolled = analytics.rolling_average(stats, window=2)
+        self.assertEqual(rolled.column("game_id").to_pylist(), ["1", "2", "3", "4", "5"])
+        # The second player's first map is not averaged with the first player's last one
+        self.assertEqual(rolled.column("rolling_acs").to_pylist(), [100, 150, 300, 50, 100])
+
+
+class FrontierTests(SimpleTestCase):
+    """Checks the frontier crawls each URL once, by priority, and resumes a crawl that was interrupted"""
+
+    def test_resume_after_interruption(self):
+        team = "https://www.vlr.gg/team/2/sentinels"
+        player = "https://www.vlr.gg/player/1/tenz"
+        match = "https://www.vlr.gg/100/sen-vs-g2"
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "frontier.sqlite3")
+            with Frontier(path) as frontier:
+                self.assertFalse(frontier.start([team]))
+                self.assertEqual(frontier.claim(10), [(team, 0)])
+                # The seed is not queued again, and players are crawled before matches
+                self.assertEqual(frontier.add([match, player, team], 1), 2)
+                frontier.mark(team, DONE)
+                self.assertEqual(frontier.claim(1), [(player, 1)])
+                # Interrupted with the player in flight
+
+            with Frontier(path) as frontier:
+                self.assertTrue(frontier.start([team]))
+                self.assertEqual(frontier.counts(), {DONE: 1, PENDING: 2})
+                self.assertEqual(frontier.claim(10), [(player, 1), (match, 1)])
+                self.assertFalse(frontier.finish())
+                for url in (player, match):
+                    frontier.mark(url, DONE)
+                self.assertTrue(frontier.finish())
+
+            # The next crawl starts over from the seeds
+            with Frontier(path) as frontier:
+                self.assertFalse(frontier.start([team]))
+                self.assertEqual(frontier.counts(), {PENDING: 1})
+
+
+class CrawlerTests(TransactionTestCase):
+    """Checks the pages the pipeline fetches as dependencies are still crawled, and their links discovered"""
+
+    def setUp(self):
+        clear_caches()
+
+    def test_dependencies_are_crawled(self):
+        match = "https://www.vlr.gg/100/sen-vs-g2"
+        team = "https://www.vlr.gg/team/2/sentinels"
+        with tempfile.TemporaryDirectory() as directory:
+            with Frontier(os.path.join(directory, "frontier.sqlite3"), CrawlPolicy(max_depth=1)) as frontier:
+                client = SiteClient({match: load_page("match.html")})
+                stats = asyncio.run(Crawler(client, frontier, workers=1).run([match]))
+
+                self.assertTrue(stats.finished)
+                # The match, its event, its two teams and their ten players
+                self.assertEqual(stats.statuses, {DONE: 14})
+                self.assertGreater(stats.pipeline.deferred, 0)
+                self.assertIn("https://www.vlr.gg/team/matches/2/sentinels", frontier.links(team))
+        self.assertEqual(Match.objects.count(), 1)
+
+    def test_pages_are_fetched_once(self):
+        match = "https://www.vlr.gg/100/sen-vs-g2"
+        pages = {
+            match: load_page("match.html"),
+            "https://www.vlr.gg/event/matches/2097/champions/playoffs": matches_page([match], 1),
+            "https://www.vlr.gg/team/matches/1/g2": matches_page([match], 1),
+            "https://www.vlr.gg/team/matches/2/sentinels": matches_page([match], 1),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            with Frontier(os.path.join(directory, "frontier.sqlite3"), CrawlPolicy(max_depth=2)) as frontier:
+                client = SiteClient(pages)
+                stats = asyncio.run(Crawler(client, frontier, workers=1).run([match]))
+
+                self.assertTrue(stats.finished)
+                self.assertEqual(set(stats.statuses), {DONE})
+        fetches = {url: client.fetched.count(url) for url in client.fetched}
+        self.assertEqual(fetches, dict.fromkeys(fetches, 1))
+
+
+class RefreshSchedulerTests(TransactionTestCase):
+    """Checks unfinished matches are polled more often as they approach and while live, and retired once final"""
+
+    NOW = datetime.datetime(2024, 8, 25, 12, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        clear_caches()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "refresh.sqlite3")
+
+    def scheduler(self, pages: dict) -> RefreshScheduler:
+        scheduler = RefreshScheduler(SiteClient(pages), self.path)
+        self.addCleanup(scheduler.close)
+        return scheduler
+
+    def test_intervals(self):
+        policy = RefreshPolicy()
+        for lead, interval in (
+            (datetime.timedelta(days=10), datetime.timedelta(days=1)),
+            (datetime.timedelta(days=2), datetime.timedelta(hours=6)),
+            (datetime.timedelta(hours=8), datetime.timedelta(hours=1)),
+            (datetime.timedelta(hours=3), datetime.timedelta(minutes=15)),
+            (datetime.timedelta(minutes=30), datetime.timedelta(minutes=5)),
+            (-datetime.timedelta(hours=1), policy.live_interval),
+            (-datetime.timedelta(hours=8), policy.overdue_interval),
+            (-datetime.timedelta(days=3), policy.stale_interval),
+        ):
+            with self.subTest(lead):
+                self.assertEqual(policy.interval(self.NOW + lead, self.NOW), interval)
+
+    def test_schedule(self):
+        scheduler = self.scheduler({})
+        matches = {
+            "1": self.NOW + datetime.timedelta(days=10),
+            "2": self.NOW + datetime.timedelta(minutes=30),
+            "3": self.NOW - datetime.timedelta(hours=1),
+        }
+        # Never polled, so all due now
+        due, next_poll = scheduler._schedule(matches, self.NOW)
+        self.assertEqual(sorted(due), ["1", "2", "3"])
+        self.assertEqual(next_poll, self.NOW + datetime.timedelta(minutes=2))
+        with mock.patch("time.time", return_value=self.NOW.timestamp()):
+            for vlr_id in due:
+                scheduler._polled(match_url(vlr_id), True)
+
+        # Only the live match is due again, and the one about to start is next
+        later = self.NOW + datetime.timedelta(minutes=3)
+        due, next_poll = scheduler._schedule(matches, later)
+        self.assertEqual(due, ["3"])
+        self.assertEqual(next_poll, self.NOW + datetime.timedelta(minutes=5))
+
+        # Matches no longer unfinished are forgotten
+        scheduler._schedule({"2": matches["2"]}, later)
+        self.assertEqual(list(scheduler._db.execute("SELECT vlr_id FROM refresh")), [("2",)])
+
+    def test_finished_match_is_retired(self):
+        ingest_pages({"https://www.vlr.gg/200/sen-vs-g2": load_page("match_upcoming.html")}, ["https://www.vlr.gg/200/sen-vs-g2"])
+        self.assertFalse(Match.objects.get(vlr_id="200").is_finished)
+
+        scheduler = self.scheduler({match_url("200"): load_page("match.html")})
+        stats, _ = asyncio.run(scheduler.poll())
+        self.assertEqual((stats.unfinished, stats.polled, stats.finished), (1, 1, 1))
+        self.assertTrue(Match.objects.get(vlr_id="200").is_finished)
+
+        stats, _ = asyncio.run(scheduler.poll())
+        self.assertEqual((stats.unfinished, stats.polled), (0, 0))
+        # Along with the players the upcoming match did not list
+        self.assertEqual(scheduler.client.fetched.count(match_url("200")), 1)
+
+
+class BulkUpsertTests(TransactionTestCase):
+    """Checks bulk upserts update conflicting rows in place on every backend, and a match's stats are written in one upsert"""
+
+    def setUp(self):
+        clear_caches()
+
+    def test_updates_in_place(self):
+        now = timezone.now()
+        event = Event.objects.create(name="Event", series="Series", vlr_url="https://www.vlr.gg/event/1/")
+        team = Team.objects.create(name="Team", team_tag="T", team_logo_url="", team_rating=1, vlr_id="1", last_updated=now)
+        match = Match.objects.create(
+            event=event, team1=team, team2=team, date_played=now, vlr_id="1", is_finished=True, team1_score=2, team2_score=0
+        )
+        ascent = MapName.objects.create(name="Ascent")
+
+        def upsert_maps(team1_score: int):
+            return bulk.bulk_upsert(
+                Map,
+                [
+                    Map(match=match, name=ascent, map_number=i + 1, game_id=str(i), team1_score=team1_score, team2_score=11)
+                    for i in range(3)
+                ],
+                unique_fields=["game_id"],
+                update_fields=["team1_score"],
+            )
+
+        maps = upsert_maps(13)
+        updated = upsert_maps(10)
+        self.assertEqual(list(Map.objects.order_by("game_id").values_list("team1_score", flat=True)), [10, 10, 10])
+        if connection.features.can_return_rows_from_bulk_insert:
+            self.assertEqual([row.pk for row in updated], [row.pk for row in maps])
+            self.assertEqual({row.pk for row in maps}, set(Map.objects.values_list("pk", flat=True)))
+        self.assertEqual(bulk.bulk_upsert(Map, [], unique_fields=["game_id"], update_fields=["team1_score"]), [])
+
+    def test_changed_stats_are_upserted_in_bulk(self):
+        url = "https://www.vlr.gg/100/sen-vs-g2"
+        ingest_pages({url: match_page()}, [url])
+
+        def stored_stats():
+            return {
+                (game_id, player_id): (pk, kills)
+                for game_id, player_id, pk, kills in PlayerStats.objects.values_list(
+                    "map__game_id", "player__vlr_id", "pk", "kills"
+                )
+            }
+
+        before = stored_stats()
+        _, match = parse_page(url, match_page())
+        for game in match.maps:
+            for line in game.team_1_stats:
+                line.kills += 1
+        team_1_players = {get_player_id_from_url(line.player) for line in match.maps[0].team_1_stats}
+        with CaptureQueriesContext(connection) as queries:
+            ingest_match(match, url)
+
+        writes = [query["sql"] for query in queries if query["sql"].startswith(("INSERT", "UPDATE"))]
+        self.assertEqual(len([sql for sql in writes if "vlr_data_playerstats" in sql]), 1)
+        self.assertFalse([sql for sql in writes if '"vlr_data_map"' in sql])
+        # Updated in place, and only the first team's lines changed
+        self.assertEqual(
+            stored_stats(),
+            {
+                (game_id, player_id): (pk, kills + 1 if player_id in team_1_players else kills)
+                for (game_id, player_id), (pk, kills) in before.items()
+            },
+        )
+
+
+class ChangeLogTests(TransactionTestCase):
+    """Checks refreshing an unchanged row writes nothing, and every real change is logged with the fields it touched"""
+
+    TEAM = "https://www.vlr.gg/team/1/team"
+    PLAYERS = ("https://www.vlr.gg/player/1/a", "https://www.vlr.gg/player/2/b")
+
+    def setUp(self):
+        clear_caches()
+
+    def logged(self, last_id: int = 0, entities=None):
+        return [(change.entity, change.entity_id, change.fields) for change in changes_since(last_id, entities)]
+
+    def test_unchanged_rows_are_not_written(self):
+        ingest_team(team_record(*self.PLAYERS), self.TEAM)
+        self.assertEqual(
+            self.logged(),
+            [
+                ("team", "1", ["name", "team_logo_url", "team_rating", "team_tag"]),
+                ("player", "1", ["ign", "real_name", "team_id"]),
+                ("player", "2", ["ign", "real_name", "team_id"]),
+            ],
+        )
+        last_updated = Team.objects.get().last_updated
+
+        with CaptureQueriesContext(connection) as queries:
+            ingest_team(team_record(*self.PLAYERS), self.TEAM)
+        self.assertFalse([query["sql"] for query in queries if query["sql"].startswith(("INSERT", "UPDATE"))])
+        self.assertEqual(len(self.logged()), 3)
+        self.assertEqual(Team.objects.get().last_updated, last_updated)
+
+    def test_changes_are_logged(self):
+        ingest_team(team_record(*self.PLAYERS), self.TEAM)
+        last_id = changes_since()[-1].pk
+        last_updated = dict(Player.objects.values_list("vlr_id", "last_updated"))
+
+        team = team_record(*self.PLAYERS)
+        team.team_rating = 1500
+        team.players[1].real_name = "Real Name"
+        ingest_team(team, self.TEAM)
+
+        self.assertEqual(self.logged(last_id), [("team", "1", ["team_rating"]), ("player", "2", ["real_name"])])
+        self.assertEqual(self.logged(last_id, ["player"]), [("player", "2", ["real_name"])])
+        self.assertEqual(Team.objects.get().team_rating, 1500)
+        # Only the changed player was written
+        self.assertEqual(Player.objects.get(vlr_id="1").last_updated, last_updated["1"])
+        self.assertGreater(Player.objects.get(vlr_id="2").last_updated, last_updated["2"])
@@ -1,18 +1,24 @@
 from django.urls import path
 from .views import (
+    HeadToHeadView,
     MatchDetailView,
     MatchListView,
     TeamDetailView,
     TeamListView,
+    TeamSummaryView,
     UpcomingMatchView,
-    PlayerDetailView
+    PlayerDetailView,
+    PlayerStatsView,
 )
 
 urlpatterns = [
     path("teams", TeamListView.as_view(), name="team_list"),
     path("team/<str:vlr_id>", TeamDetailView.as_view(), name="team_detail"),
+    path("team/<str:vlr_id>/summary", TeamSummaryView.as_view(), name="team_summary"),
+    path("head_to_head/<str:team1>/<str:team2>", HeadToHeadView.as_view(), name="head_to_head"),
     path("matches", MatchListView.as_view(), name="match_list"),
     path("match/<str:vlr_id>", MatchDetailView.as_view(), name="match_detail"),
     path("upcoming_matches", UpcomingMatchView.as_view(), name="upcoming_matches"),
     path("player/<str:vlr_id>", PlayerDetailView.as_view(), name="player_detail"),
+    path("player/<str:vlr_id>/stats", PlayerStatsView.as_view(), name="player_stats"),
 ]
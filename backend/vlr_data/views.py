@@ -4,19 +4,59 @@ from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions
+from rest_framework.exceptions import NotFound
 
-from .models import Player, Team, Match
-from .serializers import MatchSerializer, PlayerSerializer, TeamSerializer
+from .models import HeadToHead, Player, PlayerCareer, Team, TeamSummary, Match
+from .pagination import KeysetPagination
+from .routers import read_from_replica
+from .serializers import (
+    MatchSerializer,
+    PlayerCareerSerializer,
+    PlayerSerializer,
+    TeamSerializer,
+    TeamSummarySerializer,
+)
 
 
-class TeamListView(ListAPIView):
+# Matches with their event and teams joined in, reading only the columns MatchSerializer needs
+MATCHES = Match.objects.select_related("event", "team1", "team2").only(
+    "event__vlr_url",
+    "team1__vlr_id",
+    "team1__name",
+    "team1__team_logo_url",
+    "team2__vlr_id",
+    "team2__name",
+    "team2__team_logo_url",
+    "date_played",
+    "vlr_id",
+    "is_finished",
+    "team1_score",
+    "team2_score",
+)
+
+
+class ReplicaReadMixin:
+    """Serves read-only requests from the read replica, see routers.read_from_replica
+
+    Clients that must see the latest writes, e.g. right after triggering
+    one, can pass ?primary=true to read from the primary instead.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in permissions.SAFE_METHODS or request.GET.get("primary") in ("1", "true"):
+            return super().dispatch(request, *args, **kwargs)
+        with read_from_replica():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class TeamListView(ReplicaReadMixin, ListAPIView):
     permission_classes = (permissions.AllowAny, )
     
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
 
 
-class TeamDetailView(RetrieveAPIView):
+class TeamDetailView(ReplicaReadMixin, RetrieveAPIView):
     permission_classes = (permissions.AllowAny, )
         
     queryset = Team.objects.all()
@@ -24,30 +64,82 @@ class TeamDetailView(RetrieveAPIView):
     lookup_field = "vlr_id"
 
 
-class MatchListView(ListAPIView):
+class TeamSummaryView(ReplicaReadMixin, RetrieveAPIView):
+    permission_classes = (permissions.AllowAny, )
+
+    queryset = TeamSummary.objects.select_related("team").prefetch_related("team__map_records")
+    serializer_class = TeamSummarySerializer
+    lookup_field = "team__vlr_id"
+    lookup_url_kwarg = "vlr_id"
+
+
+class HeadToHeadView(ReplicaReadMixin, APIView):
+    permission_classes = (permissions.AllowAny, )
+
+    def get(self, request, team1, team2):
+        teams = dict(Team.objects.filter(vlr_id__in=[team1, team2]).values_list("vlr_id", "pk"))
+        if team1 == team2 or len(teams) < 2:
+            raise NotFound("Both teams must exist and be different.")
+
+        # Stored once per pair, with team_a the team with the lower primary key
+        swapped = teams[team1] > teams[team2]
+        team_a, team_b = sorted(teams.values())
+        h2h = HeadToHead.objects.filter(team_a_id=team_a, team_b_id=team_b).first() or HeadToHead()
+        wins = [h2h.team_a_wins, h2h.team_b_wins]
+        maps = [h2h.team_a_maps, h2h.team_b_maps]
+        if swapped:
+            wins.reverse()
+            maps.reverse()
+
+        return Response({
+            "team1": team1,
+            "team2": team2,
+            "matches_played": h2h.matches_played,
+            "team1_wins": wins[0],
+            "team2_wins": wins[1],
+            "team1_maps": maps[0],
+            "team2_maps": maps[1],
+            "last_played": h2h.last_played,
+        })
+
+
+class MatchListView(ReplicaReadMixin, ListAPIView):
     permission_classes = (permissions.AllowAny, )
         
-    queryset = Match.objects.all().order_by("-date_played")
+    queryset = MATCHES.order_by("-date_played", "-vlr_id")
     serializer_class = MatchSerializer
+    pagination_class = KeysetPagination
 
 
-class MatchDetailView(RetrieveAPIView):
+class MatchDetailView(ReplicaReadMixin, RetrieveAPIView):
     permission_classes = (permissions.AllowAny, )
         
-    queryset = Match.objects.all()
+    queryset = MATCHES
     serializer_class = MatchSerializer
     lookup_field = "vlr_id"
 
 
-class UpcomingMatchView(ListAPIView):
+class UpcomingMatchView(ReplicaReadMixin, ListAPIView):
     permission_classes = (permissions.AllowAny, )
     
-    queryset = Match.objects.filter(is_finished=False).order_by("date_played")
+    queryset = MATCHES.filter(is_finished=False).order_by("date_played", "vlr_id")
     serializer_class = MatchSerializer
+    pagination_class = KeysetPagination
     
-class PlayerDetailView(RetrieveAPIView):
+class PlayerDetailView(ReplicaReadMixin, RetrieveAPIView):
     permission_classes = (permissions.AllowAny, )
         
     queryset = Player.objects.all()
     serializer_class = PlayerSerializer
     lookup_field = "vlr_id"
+
+
+class PlayerStatsView(ReplicaReadMixin, RetrieveAPIView):
+    permission_classes = (permissions.AllowAny, )
+
+    queryset = PlayerCareer.objects.select_related("player").prefetch_related(
+        "player__agent_splits", "player__map_splits"
+    )
+    serializer_class = PlayerCareerSerializer
+    lookup_field = "player__vlr_id"
+    lookup_url_kwarg = "vlr_id"
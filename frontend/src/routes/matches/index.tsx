@@ -1,6 +1,6 @@
 import { createFileRoute, Link } from "@tanstack/react-router";
 import useFetch from "@hooks/useFetch";
-import type { Match } from "@/types";
+import type { Match, Page } from "@/types";
 import { timeUntil } from "@/utils/timeUntil";
 
 export const Route = createFileRoute("/matches/")({
@@ -9,19 +9,21 @@ export const Route = createFileRoute("/matches/")({
 
 function RouteComponent() {
   const {
-    data: matches,
+    data: matches_page,
     loading: matches_loading,
     error: matches_error,
-  } = useFetch<Match[]>("http://localhost:8000/api/upcoming_matches");
+  } = useFetch<Page<Match>>("http://localhost:8000/api/upcoming_matches");
 
   if (matches_loading) return <div>Loading…</div>;
   if (matches_error) return <div>Error: {matches_error}</div>;
 
-  if (!matches) {
+  if (!matches_page) {
     // covers both null and undefined
     return <div>No data yet</div>;
   }
 
+  const matches = matches_page.results;
+
   return (
     <div className="mx-5 my-3">
       <h1>Upcoming</h1>
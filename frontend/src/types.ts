@@ -12,3 +12,8 @@ export interface Match {
   team1_score: number;
   team2_score: number;
 }
+
+export interface Page<T> {
+  next: string | null;
+  results: T[];
+}